@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+import asyncio
+import time
+
+from atem import Atem
+from capture import DIRECTION_OUT
+
+
+# implements communication with atem switcher on an asyncio event loop
+#
+#   atem = AsyncAtem('192.168.2.8')
+#   await atem.connect()
+#   await atem.wait_ready()
+#   await atem.send_command(b'DCut', b'\x00\x00\x00\x00')
+class AsyncAtem(Atem, asyncio.DatagramProtocol):
+    def __init__(self, address, port=9910, interests=None):
+        self.address = (address, port)
+        self.transport = None
+        self._initState()
+        self.setInterests(interests)
+
+        # asyncio.Event binds to the running loop on first wait, not here
+        self._connected = asyncio.Event()
+        self._ready = asyncio.Event()
+        self._supervisor = None
+        # set to wake _supervise when a deadline moved closer
+        self._wake = asyncio.Event()
+        # futures of send_command not done yet, failed by close
+        self._futures = set()
+
+    # opens the transport and performs the handshake, returns once the switcher answered
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: self, remote_addr=self.address)
+        self._supervisor = loop.create_task(self._supervise())
+        await self._connected.wait()
+
+    # returns once the initial state dump of the switcher has been received
+    async def wait_ready(self, timeout=None):
+        await asyncio.wait_for(self._ready.wait(), timeout)
+
+    # sends a command to the switcher, returns True once it was acked or False if it got lost
+    async def send_command(self, command, payload):
+        future = asyncio.get_running_loop().create_future()
+        self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+
+        def done(pending):
+            if not future.done():
+                future.set_result(pending.acked)
+
+        self.sendCommand(command, payload, done)
+        return await future
+
+    # send_command awaiting an ACK raises ConnectionError
+    async def close(self):
+        if self._supervisor:
+            self._supervisor.cancel()
+            try:
+                await self._supervisor
+            except asyncio.CancelledError:
+                pass
+            self._supervisor = None
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+        for future in list(self._futures):
+            if not future.done():
+                future.set_exception(ConnectionError('connection to %s:%d closed' % self.address))
+        self.failCommands(queued=True)
+        self.stopTallycast()
+        self.stopCapture()
+        self.stopSnapshot()
+
+    # runs the timers of the connection state machine: HELLO retries, keepalive pings,
+    # retransmits and reconnects whenever the switcher falls silent
+    async def _supervise(self):
+        loop = asyncio.get_running_loop()
+        self.connectToSwitcher()
+        while True:
+            timeout = self.nextDeadline() - time.monotonic()
+            if timeout > 0:
+                # woken at the deadline or by _timersChanged when one moved closer, e.g. commands were
+                # sent; not wait_for, which may swallow the cancel of close when both happen at once
+                self._wake.clear()
+                timer = loop.call_later(timeout, self._wake.set)
+                try:
+                    await self._wake.wait()
+                finally:
+                    timer.cancel()
+                continue
+            self.checkTimeouts(time.monotonic())
+
+    def sendDatagram(self, datagram):
+        if self.capture is not None:
+            self.capture.record(DIRECTION_OUT, datagram)
+        if self.metrics is not None:
+            self.metrics.datagrams_sent += 1
+            self.metrics.bytes_sent += len(datagram)
+        if self.transport:
+            self.transport.sendto(datagram)
+
+    def _timersChanged(self):
+        self._wake.set()
+
+    # connect and wait_ready wait for these events
+    def _setState(self, state):
+        super()._setState(state)
+        if state >= self.STATE_SYNCING:
+            self._connected.set()
+        else:
+            self._connected.clear()
+        if state == self.STATE_READY:
+            self._ready.set()
+        else:
+            self._ready.clear()
+
+    # asyncio.DatagramProtocol callbacks
+
+    # sends what the handlers queued, e.g. FTUA of media transfers, like Atem.drainSocket
+    def datagram_received(self, datagram, address):
+        self.handleDatagram(datagram)
+        if self._outbox:
+            self.flushCommands()
+
+    def error_received(self, exc):
+        print('socket error', exc)
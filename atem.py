@@ -3,11 +3,25 @@
 # vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
 
 import socket
+import selectors
 import struct
 import ctypes
+import random
 import time
+from collections import namedtuple
 from pprint import pprint
 
+from features import (UNKNOWN_SOURCE, growSources, sourcesDict, AtemFacts, AtemConfig, AtemInput, AtemMultiviewer,
+                      AtemMixing, AtemKeyers, AtemDownstreamKeyer, AtemAux, AtemMediaPlayers, AtemMediaPool,
+                      AtemStill, AtemClip, AtemAudioClip, AtemAudioMixer, AtemAudioChannel, AtemCameraControl,
+                      AtemTally)
+from capture import CaptureWriter, DIRECTION_IN, DIRECTION_OUT
+from metrics import AtemMetrics
+from snapshot import SnapshotWriter, loadSnapshot
+from tallycast import TallyPublisher
+from audiolevels import AudioLevels
+from mediatransfer import STORE_STILLS, LKOB, FTCD, FTDA, FTDC, FTDE, MediaTransfer, MediaTransfers
+
 def dumpHex(buffer):
     s = ''
     for c in buffer:
@@ -25,19 +39,110 @@ def dumpAscii(buffer):
     print(s)
 
 
+# packet header as returned by Atem.parseCommandHeader
+AtemHeader = namedtuple('AtemHeader', ['bitmask', 'size', 'uid', 'ackId', 'resendId', 'packageId'])
+
+
+# a camera control feature of Atem.CC_FEATURES: codec unpacks its values from CCdP at offset and packs
+# them into CCmd after the raw elements of prefix; components name the values of features with several,
+# scales turn each value into its unit as value * multiplier / divisor + bias, options label the values
+# and unknown those missing there, {} is replaced by the value
+class AtemCCFeature(namedtuple('AtemCCFeature', ['slot', 'domain', 'feature', 'domainLabel', 'featureLabel',
+                                                 'dataType', 'codec', 'offset', 'prefix', 'components', 'scales',
+                                                 'options', 'unknown'])):
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, slot, domainLabel, elements, valuesOffset, domain, feature, label, dataType=None,
+               components=None, scales=None, options=None, unknown='{}', prefix=()):
+        codec = offset = None
+        if dataType is not None:
+            element = elements[dataType]
+            codec = struct.Struct('!' + element * len(components or ' '))
+            offset = valuesOffset + struct.calcsize('!' + element * len(prefix))
+        return cls(slot, domain, feature, domainLabel, label, dataType, codec, offset, prefix, components, scales,
+                   options, unknown)
+
+
+# a command handed to Atem.queueCommand, callback(command) runs once it is acked or failed;
+# data follows payload on the wire, e.g. a memoryview of a mapped file that is copied into the
+# datagram only; replaced is the last command with a callback that this one superseded, see
+# Atem.coalesceCommand
+class AtemCommand:
+    __slots__ = ['command', 'payload', 'data', 'callback', 'packageId', 'sentTime', 'ackTime', 'acked', 'failed',
+                 'replaced']
+
+    def __init__(self, command, payload, callback=None, data=None):
+        self.command = command
+        self.payload = payload
+        self.data = data
+        self.callback = callback
+        self.packageId = None
+        self.sentTime = None
+        self.ackTime = None
+        self.acked = False
+        self.failed = False
+        self.replaced = None
+
+    # completes the commands this one replaced along with it
+    def complete(self, acked, now):
+        command = self
+        while command is not None:
+            command.acked = acked
+            command.failed = not acked
+            command.ackTime = now
+            if command.callback is not None:
+                command.callback(command)
+            command = command.replaced
+
+
 # implements communication with atem switcher
 class Atem:
     # size of header data
     SIZE_OF_HEADER = 0x0c
+    # bitmask and size, uid, ackId, resendId, 2 unknown bytes, packageId
+    _HEADER = struct.Struct('!HHHH2xH')
+    # size of sub-command header data (size, 2 unknown bytes, type)
+    SIZE_OF_SUBHEADER = 0x08
+    _SUBHEADER = struct.Struct('!H2x4s')
 
     # packet types
     CMD_NOCOMMAND   = 0x00
     CMD_ACKREQUEST  = 0x01
     CMD_HELLOPACKET = 0x02
-    CMD_RESEND      = 0x04
-    CMD_UNDEFINED   = 0x08
+    # the datagram is sent again, and asks for datagrams from resendId on to be sent again
+    CMD_RETRANSMIT  = 0x04
+    CMD_RESENDREQUEST = 0x08
     CMD_ACK         = 0x10
 
+    # connection states, see connectionState
+    STATE_DISCONNECTED = 0
+    # HELLO sent, waiting for the switcher to answer
+    STATE_CONNECTING = 1
+    # receiving the initial state dump
+    STATE_SYNCING = 2
+    # dump complete, commands are sent
+    STATE_READY = 3
+
+    # seconds without any packet from the switcher before we ping it, and before we reconnect
+    KEEPALIVE_TIMEOUT = 1.0
+    RECONNECT_TIMEOUT = 2.0
+    # seconds until HELLO is sent again while the switcher does not answer, doubling per attempt
+    # up to HELLO_RETRY_MAX, each shortened by a random jitter of up to half
+    HELLO_RETRY_MIN = 0.2
+    HELLO_RETRY_MAX = 1.0
+    # seconds before an unacknowledged datagram is sent again, and how often
+    RETRANSMIT_TIMEOUT = 0.2
+    MAX_RETRANSMITS = 10
+    # commands are batched into datagrams of at most this payload size
+    MAX_PAYLOAD_SIZE = 1400
+    # datagrams sent but not yet acked, further commands wait in the outbox
+    MAX_INFLIGHT = 16
+    # seconds between datagrams of coalesced commands, one frame at 50Hz
+    COALESCE_INTERVAL = 0.02
+    # packageIds are 15 bit and wrap around
+    PACKAGE_ID_MASK = 0x7FFF
+
     # labels
     LABELS_VIDEOMODES = ['525i59.94NTSC', '625i50PAL', '525i59.94NTSC16:9', '625i50PAL16:9',
                          '720p50', '720p59.94', '1080i50', '1080i59.94',
@@ -64,10 +169,18 @@ class Atem:
                        20: 'Input 20', 1001: 'XLR', 1101: 'AES/EBU', 1201: 'RCA', 2001: 'MP1', 2002: 'MP2'}
     # cc
     LABELS_CC_DOMAIN = {0: 'lens', 1: 'camera', 8: 'chip'}
-    LABELS_CC_LENS_FEATURE = {0: 'focus', 1: 'auto_focused', 3: 'iris', 9: 'zoom'}
-    LABELS_CC_CAM_FEATURE = {1: 'gain', 2: 'white_balance', 5: 'shutter'}
-    LABELS_CC_CHIP_FEATURE = {0: 'lift', 1: 'gamma', 2: 'gain', 3: 'aperture', 4: 'contrast', 5: 'luminance',
-                              6: 'hue-saturation'}
+    # camera control data types, CCmd sends its values as one of these
+    CC_BOOL = 0
+    CC_INT8 = 1
+    CC_INT16 = 2
+    CC_INT32 = 3
+    CC_INT64 = 4
+    CC_FIXED16 = 128
+    # struct format of one element by data type; CCdP and CCmd carry the elements from byte 16 on,
+    # CCmd has their count at CC_COUNT_OFFSETS
+    CC_ELEMENTS = {CC_BOOL: 'b', CC_INT8: 'b', CC_INT16: 'h', CC_INT32: 'i', CC_INT64: 'q', CC_FIXED16: 'h'}
+    CC_COUNT_OFFSETS = {CC_BOOL: 6, CC_INT8: 6, CC_INT16: 8, CC_INT32: 10, CC_INT64: 12, CC_FIXED16: 8}
+    CC_VALUES_OFFSET = 16
 
     # value options
     VALUES_CC_GAIN = {512: '0db', 1024: '6db', 2048: '12db', 4096: '18db'}
@@ -77,62 +190,287 @@ class Atem:
                          1000: '1/1000', 690: '1/1450', 500: '1/2000'}
     VALUES_AUDIO_MIX = {0: 'off', 1: 'on', 2: 'AFV'}
 
-    # initializes the class
-    def __init__(self, address):
+    # camera control features by (domain, feature), see AtemCCFeature; slots index the values of
+    # AtemCamera. Features without a data type are announced by CCdo but not decoded
+    CC_FEATURES = {}
+    for _row in (
+            dict(domain=0, feature=0, label='focus', dataType=CC_FIXED16),
+            dict(domain=0, feature=1, label='auto_focused'),
+            dict(domain=0, feature=3, label='iris', dataType=CC_FIXED16),
+            dict(domain=0, feature=9, label='zoom', dataType=CC_FIXED16),
+            dict(domain=1, feature=1, label='gain', dataType=CC_INT16, options=VALUES_CC_GAIN, unknown='unknown'),
+            dict(domain=1, feature=2, label='white_balance', dataType=CC_INT16, options=VALUES_CC_WB,
+                 unknown='{}K'),
+            dict(domain=1, feature=5, label='shutter', dataType=CC_INT32, options=VALUES_CC_SHUTTER,
+                 unknown='off'),
+            dict(domain=8, feature=0, label='lift', dataType=CC_FIXED16, components=('R', 'G', 'B', 'Y'),
+                 scales=((1, 4096, 0),) * 4),
+            dict(domain=8, feature=1, label='gamma', dataType=CC_FIXED16, components=('R', 'G', 'B', 'Y'),
+                 scales=((1, 8192, 0),) * 4),
+            dict(domain=8, feature=2, label='gain', dataType=CC_FIXED16, components=('R', 'G', 'B', 'Y'),
+                 scales=((16, 32767, 0),) * 4),
+            dict(domain=8, feature=3, label='aperture'),
+            # the pivot comes first and is left at 0.5
+            dict(domain=8, feature=4, label='contrast', dataType=CC_FIXED16, scales=((1, 4096, 0),), prefix=(1024,)),
+            dict(domain=8, feature=5, label='luminance', dataType=CC_FIXED16, scales=((1, 2048, 0),)),
+            dict(domain=8, feature=6, label='hue-saturation', dataType=CC_FIXED16, components=('hue', 'saturation'),
+                 scales=((360, 2048, 180), (1, 4096, 0)))):
+        _row = AtemCCFeature.create(len(CC_FEATURES), LABELS_CC_DOMAIN[_row['domain']], CC_ELEMENTS,
+                                    CC_VALUES_OFFSET, **_row)
+        CC_FEATURES[(_row.domain, _row.feature)] = _row
+    del _row
+    # the same by (domain label, feature label)
+    CC_FEATURES_BY_LABEL = {(_row.domainLabel, _row.featureLabel): _row for _row in CC_FEATURES.values()}
+
+    # tally flags
+    TALLY_PROGRAM = 0x01
+    TALLY_PREVIEW = 0x02
+
+    # transition styles, and the selection bit of the background in TrSS, keys follow from bit 1 on
+    TRANSITION_MIX = 0
+    TRANSITION_DIP = 1
+    TRANSITION_WIPE = 2
+    TRANSITION_DVE = 3
+    TRANSITION_STING = 4
+    TRANSITION_BACKGROUND = 0x01
+    LABELS_TRANSITION_STYLE = ['mix', 'dip', 'wipe', 'dve', 'sting']
+    # a transition that ends before this position (0 to 9999) was taken back, see predictiveTally
+    TRANSITION_TAKEN_BACK = 5000
+
+    # options by the last element of a state path, see getOption
+    OPTIONS = {
+        'video_mode': LABELS_VIDEOMODES,
+        'port_type_external': LABELS_PORTS_EXTERNAL,
+        'port_type_internal': LABELS_PORTS_INTERNAL,
+        'layout': LABELS_MULTIVIEWER_LAYOUT,
+        'plug': LABELS_AUDIO_PLUG,
+        'mix_option': VALUES_AUDIO_MIX,
+        'program': LABELS_VIDEOSRC,
+        'preview': LABELS_VIDEOSRC,
+        'aux': LABELS_VIDEOSRC,
+        'windows': LABELS_VIDEOSRC,
+        'fill': LABELS_VIDEOSRC,
+        'key': LABELS_VIDEOSRC,
+        'solo_input': LABELS_AUDIOSRC,
+        'style': LABELS_TRANSITION_STYLE,
+        'nextStyle': LABELS_TRANSITION_STYLE,
+        'dipSource': LABELS_VIDEOSRC,
+        'fillSource': LABELS_VIDEOSRC,
+        'volume': range(0, 65382),
+        'master_volume': range(0, 65382),
+        'balance': range(-10000, 10001),
+    }
+    # camera control options by (domain label, feature label)
+    OPTIONS_BY_FEATURE = {_label: _row.options for _label, _row in CC_FEATURES_BY_LABEL.items() if _row.options}
+
+    # commands that set a value, e.g. from a fader, by tag: the payload bytes that address their target,
+    # see coalesceCommand. CAMI and CAMM include their mask, so volume and balance don't replace each other;
+    # CCmd is sent with absolute values only
+    COALESCED_COMMANDS = {b'CAMI': slice(0, 4), b'CAMM': slice(0, 1), b'CTPs': slice(0, 1), b'CCmd': slice(0, 3)}
+
+    # command tags dispatched whatever the interests: the end of the initial state and the answers
+    # to media transfers
+    REQUIRED_TAGS = (b'InCm', b'LKOB', b'FTCD', b'FTDa', b'FTDC', b'FTDE')
+
+    # command tags by feature group, see setInterests
+    FEATURE_GROUPS = {
+        'facts': [b'_ver', b'_pin', b'_top', b'_MeC', b'_mpl', b'_MvC', b'_SSC', b'_TlC', b'_AMC', b'_VMC',
+                  b'_MAC', b'Powr', b'Warn', b'Time'],
+        'config': [b'DcOt', b'VidM', b'InPr', b'MvPr', b'MvIn', b'MvVM'],
+        'mixing': [b'PrgI', b'PrvI', b'TrSS', b'TrPr', b'TrPs', b'TMxP', b'TDdP', b'TWpP'],
+        'keyers': [b'KeOn', b'DskB', b'DskS'],
+        'colorgen': [b'ColV'],
+        'mediaplayer': [b'RCPS', b'MPCE'],
+        'mediapool': [b'MPSp', b'MPCS', b'MPAS', b'MPfe', b'LKST'],
+        'macros': [b'MPrp'],
+        'aux': [b'AuxS'],
+        'cameracontrol': [b'CCdo', b'CCdP'],
+        'audio': [b'AMIP', b'AMMO', b'AMmO', b'AMTl', b'AMPP', b'AMLv'],
+        'tally': [b'TlIn', b'TlSr'],
+    }
+
+    # maps raw 4-byte command tags to recvXXXX handlers, see _buildDispatchTable
+    _dispatch = {}
+
+    # initializes the class, a localPort of 0 binds an ephemeral port,
+    # interests limits decoding to some commands, see setInterests
+    def __init__(self, address, port=9910, localPort=9910, interests=None):
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if localPort:
+            # not for ephemeral ports, Linux hands out one already bound by another socket with it
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.socket.setblocking(0)
-        self.socket.bind(('0.0.0.0', 9910))
+        self.socket.bind(('0.0.0.0', localPort))
+        # created on first use, an AtemManager polls the socket with its own selector
+        self.selector = None
 
-        self.address = (address, 9910)
+        self.address = (address, port)
+        self._initState()
+        self.setInterests(interests)
+
+    # sets up protocol and switcher state, independent of how datagrams are transported
+    def _initState(self):
         self.packetCounter = 0
+        # isInitialized is connectionState == STATE_READY
+        self.connectionState = self.STATE_DISCONNECTED
         self.isInitialized = False
         self.currentUid = 0x1337
-
-        self.system_config = {'inputs': {}, 'audio': {}}
-        self.status = {}
-        self.config = {'multiviewers': {}, 'mediapool': {}}
-        self.state = {
-            'program': {},
-            'preview': {},
-            'keyers': {},
-            'dskeyers': {},
-            'aux': {},
-            'mediaplayer': {},
-            'mediapool': {},
-            'audio': {},
-            'tally_by_index': {},
-            'tally': {}
-        }
-        self.cameracontrol = {}
-
-        self.state['booted'] = True
-
+        self.lastPacketTime = time.monotonic()
+        # HELLOs sent since connectToSwitcher, when the last was sent and when the next is due
+        self._helloAttempts = 0
+        self._helloTime = 0
+        self._helloDeadline = 0
+        # uid of the session we were ready on before reconnecting, None if it can't be resumed
+        self._resumeUid = None
+        # when we last pinged the switcher for lack of packets
+        self._pingTime = 0
+        # reused for every ACK we send
+        self._ackBuffer = bytearray(self.SIZE_OF_HEADER)
+        # commands waiting to be sent, and sent datagrams by packageId awaiting an ACK:
+        # [datagram, sentTime, retransmits, commands]
+        self._outbox = []
+        self._inflight = {}
+        # the latest coalesced command by (tag, target) and when they were last sent, see coalesceCommand
+        self._coalesced = {}
+        self._coalesceTime = 0
+        # packageId of the last datagram from the switcher handled in order, a session starts at 1
+        self._lastPackageId = 0
+        # whether the switcher sent a datagram of the session that HELLO started, see _awaitingSession
+        self._sessionStarted = False
+        # whether the switcher started a session with us before
+        self._hadSession = False
+        self._resendRequested = None
+        self._resendTime = 0
+        # datagram, decode and latency counters while set to an AtemMetrics, see metrics.py
+        self.metrics = None
+        # records datagrams in both directions while set, see startCapture
+        self.capture = None
+        # writes the state to disk as it changes while set, see startSnapshot
+        self.snapshot = None
+        # multicasts the tally to tally lights while set, see startTallycast
+        self.tallycast = None
+        # media pool uploads and downloads, created by the first, see mediatransfer.py
+        self.transfers = None
+        # the audio levels the switcher sends while metering is on, see setAudioLevels
+        self.audioLevels = None
+        self.audioLevelsEnabled = False
+        # whether the switcher finished sending its state in this session, see recvInCm
+        self.stateComplete = False
+
+        # switcher state by feature, see features.py; system_config, status, config, state and
+        # cameracontrol are dict views of it
+        self.facts = AtemFacts()
+        self.configuration = AtemConfig()
+        self.mixing = AtemMixing()
+        self.keyers = AtemKeyers()
+        self.aux = AtemAux()
+        self.mediaplayers = AtemMediaPlayers()
+        self.mediapool = AtemMediaPool()
+        self.audio = AtemAudioMixer()
+        self.cameras = AtemCameraControl(len(self.CC_FEATURES))
+        self.tally = AtemTally()
+
+        # called after connectionState changed, and once the initial state of a session is complete
+        self.connectionHandler = None
+        self.stateCompleteHandler = None
+        # called after tally, program or preview input changed
         self.tallyHandler = None
+        # marks the incoming source of M/E 1 as on program once a transition starts, instead of when
+        # the switcher reports the tally at its end; needs the mixing interest
+        self.predictiveTally = False
         self.pgmInputHandler = None
         self.prvInputHandler = None
+        # subscribers by command tag (None for all) and by state path, see handleAtemChange/handleStateChange
+        self._commandSubscribers = {}
+        self._stateSubscribers = {}
+        self._changed = False
+
+    # rebuild the dispatch table for subclasses that add or override handlers
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._buildDispatchTable()
+
+    # collects all recvXXXX methods once, keyed by the command tag as it appears on the wire
+    @classmethod
+    def _buildDispatchTable(cls):
+        table = {}
+        for name in dir(cls):
+            if name.startswith('recv') and len(name) == 8:
+                func = getattr(cls, name)
+                if callable(func):
+                    table[name[4:].encode('ascii')] = func
+        cls._dispatch = table
+
+    # limits decoding to the given command tags and feature groups, e.g. ['tally', 'PrgI'],
+    # None decodes everything; other commands are skipped by their sub-header alone
+    def setInterests(self, interests):
+        if interests is None:
+            # fall back to the class table
+            self.__dict__.pop('_dispatch', None)
+            return
+        tags = set(self.REQUIRED_TAGS)
+        for interest in interests:
+            if interest in self.FEATURE_GROUPS:
+                tags.update(self.FEATURE_GROUPS[interest])
+                continue
+            tag = interest
+            if isinstance(tag, str):
+                tag = tag.encode('ascii', 'replace')
+            if not isinstance(tag, bytes) or len(tag) != 4:
+                raise ValueError('interest %r is neither a feature group (%s) nor a 4 character command tag' %
+                                 (interest, ', '.join(self.FEATURE_GROUPS)))
+            tags.add(tag)
+        table = type(self)._dispatch
+        self._dispatch = {tag: func for tag, func in table.items() if tag in tags}
 
     # hello packet
-    def connectToSwitcher(self):
+    def createHelloPacket(self):
         datagram = self.createCommandHeader(self.CMD_HELLOPACKET, 8, self.currentUid, 0x0)
         datagram += struct.pack('!I', 0x01000000)
         datagram += struct.pack('!I', 0x00)
+        return datagram
+
+    # starts a new session with HELLO, sent again with backoff until the switcher answers;
+    # the switcher state is kept, so its initial dump only reports what changed meanwhile
+    def connectToSwitcher(self):
+        # resumed if the switcher turns out to still know it, see handleDatagram
+        self._resumeUid = self.currentUid if self.isInitialized else None
+        self._helloAttempts = 0
+        # once per attempt, HELLO retries stay quiet
+        print('Connecting...')
+        self.sendHello(time.monotonic())
+
+    # sends HELLO and schedules the next one in case it goes unanswered
+    def sendHello(self, now):
+        self.currentUid = 0x1337
+        self._setState(self.STATE_CONNECTING)
+        delay = min(self.HELLO_RETRY_MAX, self.HELLO_RETRY_MIN * 2 ** min(self._helloAttempts, 16))
+        self._helloAttempts += 1
+        self._helloTime = now
+        self._helloDeadline = now + delay * random.uniform(0.5, 1.0)
+        self.sendDatagram(self.createHelloPacket())
+
+    # asks the switcher for an ACK, it answers while it still knows our session
+    def sendPing(self, now):
+        datagram = self.createCommandHeader(self.CMD_ACKREQUEST, 0, self.currentUid, 0)
+        self._inflight[self.packetCounter] = [datagram, now, 0, []]
+        self._pingTime = now
+        self.sendDatagram(datagram)
+
+    # moves to connection state, runs connectionHandler if it changed
+    def _setState(self, state):
+        if state == self.connectionState:
+            return
+        self.connectionState = state
+        self.isInitialized = state == self.STATE_READY
+        # the state decides which timers run
+        self._timersChanged()
+        if self.tallycast is not None:
+            # lights learn whether the tally is live
+            self.tallycast.publish(self)
+        if self.connectionHandler is not None:
+            self.connectionHandler(self)
 
-        while True:
-            try:
-                print('Connecting...')
-                self.sendDatagram(datagram)
-                break
-            except OSError as e:
-                # catch Network unreachable error
-                print('OSError', e.errno)
-                #if e.errno == 101:
-                time.sleep(5)
-            except:
-                print('Connecting datagram failed')
-                time.sleep(5)
-                raise
-                
     # reads packets sent by the switcher
     def handleSocketData(self):
         # network is 100Mbit/s max, MTU is thus at most 1500
@@ -141,420 +479,1093 @@ class Atem:
         except socket.error:
             return False
 
+        self.handleDatagram(datagram)
+        return True
+
+    # handles a datagram received from the switcher
+    def handleDatagram(self, datagram):
         # print('received datagram')
-        header = self.parseCommandHeader(datagram)
-        if header:
-            self.currentUid = header['uid']
-
-            if header['bitmask'] & self.CMD_HELLOPACKET:
-                # print('not initialized, received HELLOPACKET, sending ACK packet')
-                self.isInitialized = False
-                ackDatagram = self.createCommandHeader(self.CMD_ACK, 0, header['uid'], 0x0)
-                self.sendDatagram(ackDatagram)
-            elif (header['bitmask'] & self.CMD_ACKREQUEST) and \
-                    (self.isInitialized or len(datagram) == self.SIZE_OF_HEADER):
+        self.lastPacketTime = time.monotonic()
+        if self.capture is not None:
+            self.capture.record(DIRECTION_IN, datagram, self.lastPacketTime)
+        metrics = self.metrics
+        if metrics is not None:
+            receivedAt = time.perf_counter()
+            metrics.datagrams_received += 1
+            metrics.bytes_received += len(datagram)
+        if len(datagram) < self.SIZE_OF_HEADER:
+            return
+        word, uid, ackId, resendId, packageId = self._HEADER.unpack_from(datagram)
+        bitmask = word >> 11
+
+        if bitmask & self.CMD_HELLOPACKET:
+            # print('not initialized, received HELLOPACKET, sending ACK packet')
+            # a new session numbers its packets from the start, anything in flight is lost
+            self.currentUid = uid
+            self._resumeUid = None
+            self.stateComplete = False
+            self.packetCounter = 0
+            # packageId 1 comes first, a later one asks for it again
+            self._lastPackageId = 0
+            self._sessionStarted = False
+            # commands queued for the session this one replaces are stale, those queued before
+            # the first session are meant for it
+            self.failCommands(queued=self._hadSession)
+            self._hadSession = True
+            if self.audioLevelsEnabled:
+                # the switcher sends levels per session, ask again once the dump is done
+                self.queueCommand(b'SALN', struct.pack('!?3x', True))
+            self._setState(self.STATE_SYNCING)
+            # the dump follows our ACK, give it time before trying a new session
+            self._helloDeadline = self.lastPacketTime + self.HELLO_RETRY_MAX
+            self.sendAck(uid, 0x0)
+            return
+        if self.connectionState == self.STATE_CONNECTING:
+            if uid != self._resumeUid:
+                # a late datagram of a session we gave up on, the switcher is reachable again:
+                # don't wait for the backoff, at most one HELLO per HELLO_RETRY_MIN though
+                if self.lastPacketTime - self._helloTime >= self.HELLO_RETRY_MIN:
+                    self._helloAttempts = 0
+                    self.sendHello(self.lastPacketTime)
+                return
+            # the switcher still knows the session we were ready on, carry on with it,
+            # a HELLO it answers meanwhile starts a new one all the same
+            self._setState(self.STATE_READY)
+        self.currentUid = uid
+
+        if bitmask & self.CMD_ACK and self._inflight:
+            self.handleAck(ackId)
+        # a datagram with CMD_RETRANSMIT is handled like any other, checkSequence drops it if we had it
+        if bitmask & self.CMD_RESENDREQUEST:
+            self.handleResendRequest(resendId)
+
+        if bitmask & self.CMD_ACKREQUEST:
+            self._sessionStarted = True
+            if not self.checkSequence(packageId):
+                return
+            if self.isInitialized or len(datagram) == self.SIZE_OF_HEADER:
                 # print('initialized, received ACKREQUEST, sending ACK packet')
-                # print("Sending ACK for packageId %d" % header['packageId'])
-                ackDatagram = self.createCommandHeader(self.CMD_ACK, 0, header['uid'], header['packageId'])
-                self.sendDatagram(ackDatagram)
-                self.isInitialized = True
-
-            if len(datagram) > self.SIZE_OF_HEADER + 2 and not (header['bitmask'] & self.CMD_HELLOPACKET):
-                self.parsePayload(datagram)
-
-        return True
+                # print("Sending ACK for packageId %d" % packageId)
+                self.sendAck(uid, packageId)
+                if not self.isInitialized:
+                    self._setState(self.STATE_READY)
+                    # switchers that don't send InCm are done with their dump here
+                    self._completeState()
+                    self.flushCommands()
+
+        if len(datagram) > self.SIZE_OF_HEADER + 2:
+            if metrics is not None:
+                metrics.receivedAt = receivedAt
+            self.parsePayload(datagram)
+
+    # returns whether the datagram with packageId is the next in order and should be handled
+    def checkSequence(self, packageId):
+        last = self._lastPackageId
+        delta = (packageId - last) & self.PACKAGE_ID_MASK
+        if delta == 1:
+            self._lastPackageId = packageId
+            return True
+        if delta == 0 or delta >= 0x4000:
+            # retransmitted because our ACK got lost, acknowledge it again but don't decode it twice
+            if self.metrics is not None:
+                self.metrics.duplicates += 1
+            if self.isInitialized:
+                self.sendAck(self.currentUid, packageId)
+            return False
+        # we missed datagrams, the switcher resends in order so drop this one until the gap is filled
+        if self.metrics is not None:
+            self.metrics.dropped += 1
+        self.requestResend((last + 1) & self.PACKAGE_ID_MASK)
+        return False
 
-    def waitForPacket(self):
-        # print(">>> waiting for packet")
-        i = 0
-        while not self.handleSocketData():
-            time.sleep(0.01)
-            i += 1
-            if i > 200:
+    # asks the switcher to send packageId again, at most once per RETRANSMIT_TIMEOUT
+    def requestResend(self, packageId):
+        now = time.monotonic()
+        if packageId == self._resendRequested and now - self._resendTime < self.RETRANSMIT_TIMEOUT:
+            return
+        self._resendRequested = packageId
+        self._resendTime = now
+        if self.metrics is not None:
+            self.metrics.resends += 1
+        self.sendDatagram(self._HEADER.pack((self.CMD_RESENDREQUEST << 11) | self.SIZE_OF_HEADER,
+                                            self.currentUid, 0, packageId, 0))
+
+    # the switcher missed our datagram resendId, send it and everything after it again
+    def handleResendRequest(self, resendId):
+        now = time.monotonic()
+        for packageId, sent in self._inflight.items():
+            if (packageId - resendId) & self.PACKAGE_ID_MASK < 0x4000:
+                sent[1] = now
+                sent[0] = self.markRetransmit(sent[0])
+                self.sendDatagram(sent[0])
+
+    # datagram with the CMD_RETRANSMIT flag set, as sent again
+    @classmethod
+    def markRetransmit(cls, datagram):
+        flag = cls.CMD_RETRANSMIT << 3
+        if datagram[0] & flag:
+            return datagram
+        return bytes((datagram[0] | flag,)) + bytes(datagram[1:])
+
+    # handles all datagrams already queued on the socket, then sends what their handlers queued
+    def drainSocket(self):
+        while self.handleSocketData():
+            pass
+        if self._outbox:
+            self.flushCommands()
+
+    # whether HELLO is sent again at _helloDeadline: until the switcher answered it and
+    # started its dump, a lost answer or ACK of ours would otherwise stall us
+    def _awaitingSession(self):
+        state = self.connectionState
+        return state == self.STATE_CONNECTING or (state == self.STATE_SYNCING and not self._sessionStarted)
+
+    # returns the monotonic time at which checkTimeouts has work to do
+    def nextDeadline(self):
+        if self._awaitingSession():
+            deadline = self._helloDeadline
+        else:
+            deadline = self.lastPacketTime + self.RECONNECT_TIMEOUT
+            if self.isInitialized and self._pingTime < self.lastPacketTime:
+                deadline = min(deadline, self.lastPacketTime + self.KEEPALIVE_TIMEOUT)
+        for sent in self._inflight.values():
+            deadline = min(deadline, sent[1] + self.RETRANSMIT_TIMEOUT)
+        if self.snapshot is not None and self.snapshot.dirty:
+            deadline = min(deadline, self.snapshot.deadline())
+        if self.tallycast is not None:
+            deadline = min(deadline, self.tallycast.deadline())
+        # while the switcher is not ready or we wait for ACKs, coalesced commands wait for them
+        if self._coalesced and self.isInitialized and len(self._inflight) < self.MAX_INFLIGHT:
+            deadline = min(deadline, self._coalesceTime + self.COALESCE_INTERVAL)
+        if self.transfers is not None and self.transfers.active:
+            deadline = min(deadline, self.transfers.deadline())
+        return deadline
+
+    # runs the timers that are due at monotonic time now
+    def checkTimeouts(self, now):
+        if self._inflight:
+            self.retransmit(now)
+        if self._coalesced and self._coalesceDue(now):
+            self._releaseCoalesced(now)
+            self.flushCommands()
+        if self.transfers is not None and self.transfers.active:
+            self.transfers.checkTimeouts(now)
+        if self.snapshot is not None and self.snapshot.dirty and now >= self.snapshot.deadline():
+            self.snapshot.flush(self, now)
+        if self.tallycast is not None and now >= self.tallycast.deadline():
+            self.tallycast.publish(self, now)
+        if self._awaitingSession():
+            if now >= self._helloDeadline:
+                self.sendHello(now)
+        elif now - self.lastPacketTime >= self.RECONNECT_TIMEOUT:
+            if self.connectionState != self.STATE_DISCONNECTED:
                 print('2s no packet, reconnecting')
-                self.currentUid = 0x1337
-                self.connectToSwitcher()
-                return
-        # print(">>> packet obtained")
+                if self.metrics is not None:
+                    self.metrics.reconnects += 1
+            self.connectToSwitcher()
+        elif self.isInitialized and self._pingTime < self.lastPacketTime and \
+                now - self.lastPacketTime >= self.KEEPALIVE_TIMEOUT:
+            self.sendPing(now)
+
+    # sleeps until datagrams arrive or a timer is due, then handles them
+    def waitForPacket(self):
+        if self.selector is None:
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(self.socket, selectors.EVENT_READ)
+        timeout = self.nextDeadline() - time.monotonic()
+        if timeout > 0 and self.selector.select(timeout):
+            self.drainSocket()
+        else:
+            self.checkTimeouts(time.monotonic())
 
     # generates packet header data
     def createCommandHeader(self, bitmask, payloadSize, uid, ackId):
-        buffer = b''
         packageId = 0
 
         if not (bitmask & (self.CMD_HELLOPACKET | self.CMD_ACK)):
-            self.packetCounter += 1
+            self.packetCounter = (self.packetCounter + 1) & self.PACKAGE_ID_MASK
             packageId = self.packetCounter
 
-        val = bitmask << 11
-        val |= (payloadSize + self.SIZE_OF_HEADER)
-        buffer += struct.pack('!H', val)
-        buffer += struct.pack('!H', uid)
-        buffer += struct.pack('!H', ackId)
-        buffer += struct.pack('!I', 0)
-        buffer += struct.pack('!H', packageId)
-        return buffer
+        return self._HEADER.pack((bitmask << 11) | (payloadSize + self.SIZE_OF_HEADER), uid, ackId, 0, packageId)
+
+    # acknowledges packageId, packed into a preallocated buffer
+    def sendAck(self, uid, packageId):
+        self._HEADER.pack_into(self._ackBuffer, 0, (self.CMD_ACK << 11) | self.SIZE_OF_HEADER, uid, packageId, 0, 0)
+        self.sendDatagram(self._ackBuffer)
 
     # parses the packet header
     def parseCommandHeader(self, datagram):
-        header = {}
-
         if len(datagram) >= self.SIZE_OF_HEADER:
-            header['bitmask'] = struct.unpack('B', datagram[0:1])[0] >> 3
-            header['size'] = struct.unpack('!H', datagram[0:2])[0] & 0x07FF
-            header['uid'] = struct.unpack('!H', datagram[2:4])[0]
-            header['ackId'] = struct.unpack('!H', datagram[4:6])[0]
-            header['packageId'] = struct.unpack('!H', datagram[10:12])[0]
-            # print(header)
-            return header
+            word, uid, ackId, resendId, packageId = self._HEADER.unpack_from(datagram)
+            return AtemHeader(word >> 11, word & 0x07FF, uid, ackId, resendId, packageId)
         return False
 
+    # with metrics on, sub-commands are counted by tag, the latency until the first state change
+    # of the datagram was handled is measured and, for one in DECODE_SAMPLING datagrams, the
+    # handlers are timed
     def parsePayload(self, datagram):
-        # print('parsing payload')
-        # eat up header
-        datagram = datagram[self.SIZE_OF_HEADER:]
-        # handle data
-        while len(datagram) > 0:
-            size = struct.unpack('!H', datagram[0:2])[0]
-            packet = datagram[0:size]
-            datagram = datagram[size:]
-
-            # skip size and 2 unknown bytes
-            packet = packet[4:]
-            ptype = packet[:4]
-            payload = packet[4:]
-
-            # find the approporiate function in the class
-            method = 'recv' + ptype.decode("utf-8")
-            if hasattr(self, method):
-                func = getattr(self, method)
-                if callable(func):
-                    # print('> calling ' + method)
-                    func(payload)
-                else:
-                    print('problem, member ' + method + ' not callable')
+        metrics = self.metrics
+        # perf_counter time the datagram was received at until its first state change was handled
+        receivedAt = None
+        timed = False
+        if metrics is not None:
+            clock = time.perf_counter
+            receivedAt = metrics.receivedAt
+            metrics.receivedAt = None
+            if receivedAt is None:
+                receivedAt = clock()
+            metrics.sampleCountdown -= 1
+            timed = metrics.sampleCountdown <= 0
+            if timed:
+                metrics.sampleCountdown = metrics.DECODE_SAMPLING
+                # one clock read per handler, each is timed from the end of the one before,
+                # which adds the cheap skipping of undecoded sub-commands in between to it
+                start = clock()
+            subcommands = metrics.subcommands
+        # walk the sub-commands by offset, handing each handler a view into the datagram
+        view = memoryview(datagram)
+        dispatch = self._dispatch
+        unpackSubHeader = self._SUBHEADER.unpack_from
+        offset = self.SIZE_OF_HEADER
+        end = len(datagram) - self.SIZE_OF_SUBHEADER
+        while offset <= end:
+            # size includes the sub-header: 2 bytes size, 2 unknown bytes, 4 bytes type
+            size, ptype = unpackSubHeader(datagram, offset)
+            if size < self.SIZE_OF_SUBHEADER:
+                # malformed sub-command, we would never advance
+                break
+            if metrics is not None:
+                subcommands[ptype] = subcommands.get(ptype, 0) + 1
+            func = dispatch.get(ptype)
+            if func is not None:
+                func(self, view[offset + self.SIZE_OF_SUBHEADER:offset + size])
+                if self._changed:
+                    self._changed = False
+                    if self._commandSubscribers:
+                        self._notifyCommand(ptype)
+                    if receivedAt is not None:
+                        metrics.callbackLatency.observe(clock() - receivedAt)
+                        receivedAt = None
+                if timed:
+                    now = clock()
+                    metrics.decodeSeconds[ptype] = metrics.decodeSeconds.get(ptype, 0.0) + now - start
+                    metrics.decodeCounts[ptype] = metrics.decodeCounts.get(ptype, 0) + 1
+                    start = now
+            offset += size
+
+    # queues a command, it is sent batched with others by the next flushCommands
+    def queueCommand(self, command, payload, callback=None, data=None):
+        pending = AtemCommand(command, payload, callback, data)
+        self._outbox.append(pending)
+        return pending
+
+    # sends a command right away together with anything already queued or coalesced
+    def sendCommand(self, command, payload, callback=None):
+        if self._coalesced:
+            self._releaseCoalesced(time.monotonic())
+        pending = self.queueCommand(command, payload, callback)
+        self.flushCommands()
+        return pending
+
+    # queues a command that sets a value, sent at most once per COALESCE_INTERVAL: until then a later
+    # command for the same target replaces it, and its callback runs with the result of the later one.
+    # Commands not in COALESCED_COMMANDS, e.g. cuts, are sent right away
+    def coalesceCommand(self, command, payload, callback=None):
+        target = self.COALESCED_COMMANDS.get(command)
+        if target is None:
+            return self.sendCommand(command, payload, callback)
+        pending = AtemCommand(command, payload, callback)
+        key = (command, bytes(payload[target]))
+        coalesced = self._coalesced
+        replaced = coalesced.pop(key, None)
+        if replaced is not None:
+            pending.replaced = replaced if replaced.callback is not None else replaced.replaced
+            if self.metrics is not None:
+                self.metrics.coalesced += 1
+        coalesced[key] = pending
+        if len(coalesced) == 1:
+            now = time.monotonic()
+            if self._coalesceDue(now):
+                # nothing sent for a while, no need to wait
+                self._releaseCoalesced(now)
+                self.flushCommands()
             else:
-                # print('unknown type ' + ptype.decode("utf-8"))
-                # dumpAscii(payload)
-                pass
-
-        # sys.exit()
-
-    def sendCommand(self, command, payload):
-        print('sending command')
-        size = len(command) + len(payload) + 4
-        dg = self.createCommandHeader(self.CMD_ACKREQUEST, size, self.currentUid, 0)
-        dg += struct.pack('!H', size)
-        dg += "\x00\x00"
-        dg += command
-        dg += payload
-        self.sendDatagram(dg)
+                self._timersChanged()
+        return pending
+
+    # whether coalesced commands are to be sent at monotonic time now
+    def _coalesceDue(self, now):
+        return (now - self._coalesceTime >= self.COALESCE_INTERVAL and self.isInitialized and
+                len(self._inflight) < self.MAX_INFLIGHT)
+
+    # moves the coalesced commands to the outbox
+    def _releaseCoalesced(self, now):
+        self._outbox.extend(self._coalesced.values())
+        self._coalesced.clear()
+        self._coalesceTime = now
+
+    # called when nextDeadline moved closer other than by handling datagrams or timers
+    def _timersChanged(self):
+        pass
+
+    # packs queued commands into as few ACKREQUEST datagrams as possible and sends them
+    def flushCommands(self):
+        if not self.isInitialized:
+            # sent once the switcher finished its initial state dump
+            return
+        outbox = self._outbox
+        while outbox and len(self._inflight) < self.MAX_INFLIGHT:
+            commands = []
+            size = 0
+            for pending in outbox:
+                commandSize = self.SIZE_OF_SUBHEADER + len(pending.payload)
+                if pending.data is not None:
+                    commandSize += len(pending.data)
+                if commands and size + commandSize > self.MAX_PAYLOAD_SIZE:
+                    break
+                commands.append(pending)
+                size += commandSize
+            del outbox[:len(commands)]
+
+            datagram = bytearray(self.createCommandHeader(self.CMD_ACKREQUEST, size, self.currentUid, 0))
+            for pending in commands:
+                data = pending.data
+                if data is None:
+                    datagram += self._SUBHEADER.pack(self.SIZE_OF_SUBHEADER + len(pending.payload), pending.command)
+                    datagram += pending.payload
+                else:
+                    datagram += self._SUBHEADER.pack(self.SIZE_OF_SUBHEADER + len(pending.payload) + len(data),
+                                                     pending.command)
+                    datagram += pending.payload
+                    datagram += data
+                    # retransmits send the datagram, let go of the buffer data points into
+                    pending.data = None
+
+            now = time.monotonic()
+            packageId = self.packetCounter
+            for pending in commands:
+                pending.packageId = packageId
+                pending.sentTime = now
+            self._inflight[packageId] = [datagram, now, 0, commands]
+            self.sendDatagram(datagram)
+            # retransmitted unless acked in time
+            self._timersChanged()
+
+    # completes every datagram in flight up to and including ackId
+    def handleAck(self, ackId):
+        now = time.monotonic()
+        for packageId in list(self._inflight):
+            # wraparound aware packageId <= ackId
+            if (ackId - packageId) & self.PACKAGE_ID_MASK < 0x4000:
+                sent = self._inflight.pop(packageId)
+                if self.metrics is not None and not sent[2]:
+                    # a retransmitted datagram's ACK may answer any of its copies
+                    self.metrics.ackRoundTrip.observe(now - sent[1])
+                for pending in sent[3]:
+                    pending.complete(True, now)
+        if self._outbox:
+            self.flushCommands()
+        if self._coalesced:
+            # room in flight again, coalesced commands may be due
+            self._timersChanged()
+
+    # sends datagrams again that were not acked in time, gives up after MAX_RETRANSMITS
+    def retransmit(self, now):
+        for packageId, sent in list(self._inflight.items()):
+            if now - sent[1] < self.RETRANSMIT_TIMEOUT:
+                continue
+            if sent[2] >= self.MAX_RETRANSMITS:
+                del self._inflight[packageId]
+                # the switcher would wait for this datagram forever
+                self._resumeUid = None
+                if self.metrics is not None:
+                    self.metrics.commands_failed += len(sent[3])
+                for pending in sent[3]:
+                    pending.complete(False, now)
+                continue
+            # the switcher only accepts packets in order, so this is typically go-back-n
+            sent[1] = now
+            sent[2] += 1
+            if self.metrics is not None:
+                self.metrics.retransmits += 1
+            sent[0] = self.markRetransmit(sent[0])
+            self.sendDatagram(sent[0])
+
+    # fails all commands and media transfers in flight, e.g. when the session is restarted,
+    # with queued also the commands queued or coalesced but not sent yet
+    def failCommands(self, queued=False):
+        if self.transfers is not None and self.transfers.active:
+            self.transfers.failAll()
+        now = time.monotonic()
+        failed = []
+        inflight = self._inflight
+        self._inflight = {}
+        for sent in inflight.values():
+            failed.extend(sent[3])
+        if queued:
+            failed.extend(self._outbox)
+            failed.extend(self._coalesced.values())
+            self._outbox = []
+            self._coalesced = {}
+        if self.metrics is not None:
+            self.metrics.commands_failed += len(failed)
+        for pending in failed:
+            pending.complete(False, now)
 
     # sends a datagram to the switcher
     def sendDatagram(self, datagram):
         # print('sending packet')
         # dumpHex(datagram)
+        if self.capture is not None:
+            self.capture.record(DIRECTION_OUT, datagram)
+        if self.metrics is not None:
+            self.metrics.datagrams_sent += 1
+            self.metrics.bytes_sent += len(datagram)
         try:
             self.socket.sendto(datagram, self.address)
         except:
+            if self.metrics is not None:
+                self.metrics.send_errors += 1
             print('socket.sendto failed')
 
+    # appends all datagrams received from and sent to the switcher to a capture file, see capture.py
+    def startCapture(self, path):
+        self.stopCapture()
+        self.capture = CaptureWriter(path)
+
+    def stopCapture(self):
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+
+    # restores the state last saved to path, running the usual callbacks, then saves it there
+    # whenever topology, input properties or tally change, at most every interval seconds;
+    # see snapshot.py
+    def startSnapshot(self, path, interval=2.0):
+        self.stopSnapshot()
+        loadSnapshot(self, path)
+        self.snapshot = SnapshotWriter(path, interval)
+        for tag in SnapshotWriter.TAGS:
+            if self._snapshotChanged not in self._commandSubscribers.get(tag.encode('ascii'), ()):
+                self.handleAtemChange(self._snapshotChanged, tag)
+
+    # writes pending changes and stops saving snapshots
+    def stopSnapshot(self):
+        if self.snapshot is not None:
+            self.snapshot.flush(self)
+            self.snapshot = None
+
+    def _snapshotChanged(self, atem, method):
+        if self.snapshot is not None and not self.snapshot.dirty:
+            self.snapshot.dirty = True
+            self._timersChanged()
+
+    # multicasts the tally to the tally lights of tallycast.py on every change and every interval
+    # seconds in between, see tallycast.py
+    def startTallycast(self, group='239.255.90.10', port=9911, interval=1.0, ttl=1, interface=None):
+        self.stopTallycast()
+        self.tallycast = TallyPublisher(group, port, interval, ttl, interface)
+        for tag in ('TlIn', 'TlSr'):
+            if self._tallycastChanged not in self._commandSubscribers.get(tag.encode('ascii'), ()):
+                self.handleAtemChange(self._tallycastChanged, tag)
+        self.tallycast.publish(self)
+        self._timersChanged()
+
+    def stopTallycast(self):
+        if self.tallycast is not None:
+            self.tallycast.close()
+            self.tallycast = None
+
+    def _tallycastChanged(self, atem, method):
+        if self.tallycast is not None:
+            self.tallycast.publish(self)
+
+    # runs stateCompleteHandler once the switcher sent its initial state in this session
+    def _completeState(self):
+        if not self.stateComplete:
+            self.stateComplete = True
+            if self.stateCompleteHandler is not None:
+                self.stateCompleteHandler(self)
+
     def parseBitmask(self, num, labels):
         states = {}
         for i, label in enumerate(labels):
             states[label] = bool(num & (1 << len(labels) - i - 1))
         return states
 
-    def convert_cstring(self, bytes):
-        return ctypes.create_string_buffer(bytes).value.decode('utf-8')
+    def convert_cstring(self, data):
+        return ctypes.create_string_buffer(bytes(data)).value.decode('utf-8')
+
+    # stores value in container[key] and notifies subscribers of path, if it changed
+    def _update(self, container, key, value, path):
+        if key in container and container[key] == value:
+            return False
+        old = container.get(key)
+        container[key] = value
+        self._notify(path, old, value)
+        return True
+
+    # stores value in the slot name of a state record and notifies subscribers of path, if it changed
+    def _set(self, record, name, value, path):
+        old = getattr(record, name)
+        if old == value:
+            return False
+        setattr(record, name, value)
+        self._notify(path, old, value)
+        return True
+
+    # stores value at index of an array of the state model, growing it if needed,
+    # and notifies subscribers of path, if it changed
+    def _setItem(self, items, index, value, path):
+        if index >= len(items):
+            growSources(items, index)
+        old = items[index]
+        if old == value:
+            return False
+        items[index] = value
+        self._notify(path, None if old == UNKNOWN_SOURCE else old, value)
+        return True
 
     # handling of subpackets
     # ----------------------
 
     def recv_ver(self, data):
         major, minor = struct.unpack('!HH', data[0:4])
-        self.system_config['version'] = str(major) + '.' + str(minor)
+        self._set(self.facts, 'version', str(major) + '.' + str(minor), ('system_config', 'version'))
 
     def recv_pin(self, data):
-        self.system_config['name'] = data
+        self._set(self.facts, 'name', self.convert_cstring(data), ('system_config', 'name'))
 
-    def recvWarn(self, text):
-        print('Warning: ' + text)
+    # sent by the switcher after the last command of its initial state
+    def recvInCm(self, data):
+        self._completeState()
+
+    def recvWarn(self, data):
+        print('Warning: ' + self.convert_cstring(data))
 
     def recv_top(self, data):
-        self.system_config['topology'] = {}
+        topology = self.facts.topology
         datalabels = ['mes', 'sources', 'color_generators', 'aux_busses', 'dsks', 'stingers', 'dves',
                       'supersources']
         for i, label in enumerate(datalabels):
-            self.system_config['topology'][label] = data[i]
+            self._set(topology, label, data[i], ('system_config', 'topology', label))
+
+        self._set(topology, 'hasSD', (data[9] > 0), ('system_config', 'topology', 'hasSD'))
 
-        self.system_config['topology']['hasSD'] = (data[9] > 0)
+        # size the per M/E, aux and keyer records once, handlers only update them in place
+        self.mixing.resize(topology.mes)
+        self.aux.resize(topology.aux_busses)
+        self.keyers.resize(topology.mes, topology.dsks)
 
     def recv_MeC(self, data):
         index = data[0]
-        self.system_config.setdefault('keyers', {})[index] = data[1]
+        self._setItem(self.facts.keyers, index, data[1], ('system_config', 'keyers', index))
 
     def recv_mpl(self, data):
-        self.system_config['media_players'] = {}
-        self.system_config['media_players']['still'] = data[0]
-        self.system_config['media_players']['clip'] = data[1]
+        media_players = self.facts.media_players
+        self._set(media_players, 'still', data[0], ('system_config', 'media_players', 'still'))
+        self._set(media_players, 'clip', data[1], ('system_config', 'media_players', 'clip'))
+        if data[0]:
+            self.mediaplayers.get(data[0] - 1)
 
     def recv_MvC(self, data):
-        self.system_config['multiviewers'] = data[0]
+        self._set(self.facts, 'multiviewers', data[0], ('system_config', 'multiviewers'))
+        multiviewers = self.configuration.multiviewers
+        while len(multiviewers) < data[0]:
+            multiviewers.append(AtemMultiviewer())
 
     def recv_SSC(self, data):
-        self.system_config['super_source_boxes'] = data[0]
+        self._set(self.facts, 'super_source_boxes', data[0], ('system_config', 'super_source_boxes'))
 
     def recv_TlC(self, data):
-        self.system_config['tally_channels'] = data[4]
+        self._set(self.facts, 'tally_channels', data[4], ('system_config', 'tally_channels'))
 
     def recv_AMC(self, data):
-        self.system_config['audio_channels'] = data[0]
-        self.system_config['has_monitor'] = (data[1] > 0)
+        self._set(self.facts, 'audio_channels', data[0], ('system_config', 'audio_channels'))
+        self._set(self.facts, 'has_monitor', (data[1] > 0), ('system_config', 'has_monitor'))
 
     def recv_VMC(self, data):
-        size = 18
+        size = AtemFacts.VIDEO_MODES
+        modes = data[0]
+        old = self.facts.video_modes
+        if old == modes:
+            return
+        self.facts.video_modes = modes
         for i in range(size):
-            self.system_config.setdefault('video_modes', {})[i] = bool(data[0] & (1 << size - i - 1))
+            bit = 1 << size - i - 1
+            if old is None or (old ^ modes) & bit:
+                self._notify(('system_config', 'video_modes', i), None if old is None else bool(old & bit),
+                             bool(modes & bit))
 
     def recv_MAC(self, data):
-        self.system_config['macro_banks'] = data[0]
+        self._set(self.facts, 'macro_banks', data[0], ('system_config', 'macro_banks'))
 
     def recvPowr(self, data):
-        self.status['power'] = self.parseBitmask(data[0], ['main', 'backup'])
+        old = self.facts.power
+        if old == data[0]:
+            return
+        self.facts.power = data[0]
+        labels = ['main', 'backup']
+        self._notify(('status', 'power'), None if old is None else self.parseBitmask(old, labels),
+                     self.parseBitmask(data[0], labels))
 
     def recvDcOt(self, data):
-        self.config['down_converter'] = data[0]
+        self._set(self.configuration, 'down_converter', data[0], ('config', 'down_converter'))
 
     def recvVidM(self, data):
-        self.config['video_mode'] = data[0]
+        self._set(self.configuration, 'video_mode', data[0], ('config', 'video_mode'))
 
     def recvInPr(self, data):
         index = struct.unpack('!H', data[0:2])[0]
-        self.system_config['inputs'][index] = {}
-        input_setting = self.system_config['inputs'][index]
-        input_setting['name_long'] = self.convert_cstring(data[2:22])
-        input_setting['name_short'] = self.convert_cstring(data[22:26])
-        input_setting['types_available'] = self.parseBitmask(data[27], self.LABELS_PORTS_EXTERNAL)
-        input_setting['port_type_external'] = data[29]
-        input_setting['port_type_internal'] = data[30]
-        input_setting['availability'] = self.parseBitmask(data[32], ['Auxilary', 'Multiviewer', 'SuperSourceArt',
-                                                                     'SuperSourceBox', 'KeySource'])
-        input_setting['me_availability'] = self.parseBitmask(data[33], ['ME1', 'ME2'])
+        input_setting = self.configuration.inputs.get(index)
+        if input_setting is None:
+            input_setting = self.configuration.inputs[index] = AtemInput()
+        path = ('system_config', 'inputs', index)
+        self._set(input_setting, 'name_long', self.convert_cstring(data[2:22]), path + ('name_long',))
+        self._set(input_setting, 'name_short', self.convert_cstring(data[22:26]), path + ('name_short',))
+        self._set(input_setting, 'port_type_external', data[29], path + ('port_type_external',))
+        self._set(input_setting, 'port_type_internal', data[30], path + ('port_type_internal',))
+        # bitmasks are stored raw, subscribers get them expanded as before
+        for name, value, labels in (('types_available', data[27], self.LABELS_PORTS_EXTERNAL),
+                                    ('availability', data[32], AtemInput.LABELS_AVAILABILITY),
+                                    ('me_availability', data[33], AtemInput.LABELS_ME_AVAILABILITY)):
+            old = getattr(input_setting, name)
+            if old != value:
+                setattr(input_setting, name, value)
+                self._notify(path + (name,), None if old is None else self.parseBitmask(old, labels),
+                             self.parseBitmask(value, labels))
 
     def recvMvPr(self, data):
         index = data[0]
-        self.config['multiviewers'].setdefault(index, {})['layout'] = data[1]
+        multiviewers = self.configuration.multiviewers
+        while len(multiviewers) <= index:
+            multiviewers.append(AtemMultiviewer())
+        self._set(multiviewers[index], 'layout', data[1], ('config', 'multiviewers', index, 'layout'))
 
     def recvMvIn(self, data):
         index = data[0]
         window = data[1]
-        self.config['multiviewers'].setdefault(index, {}).setdefault('windows', {})[window] = \
-        struct.unpack('!H', data[2:4])[0]
+        multiviewers = self.configuration.multiviewers
+        while len(multiviewers) <= index:
+            multiviewers.append(AtemMultiviewer())
+        self._setItem(multiviewers[index].windows, window, struct.unpack('!H', data[2:4])[0],
+                      ('config', 'multiviewers', index, 'windows', window))
 
     def recvPrgI(self, data):
         meIndex = data[0]
-        self.state['program'][meIndex] = struct.unpack('!H', data[2:4])[0]
-        self.pgmInputHandler(self)
+        if self._setItem(self.mixing.program, meIndex, (data[2] << 8) | data[3], ('program', meIndex)):
+            if self.pgmInputHandler is not None:
+                self.pgmInputHandler(self)
 
     def recvPrvI(self, data):
         meIndex = data[0]
-        self.state['preview'][meIndex] = struct.unpack('!H', data[2:4])[0]
-        self.prvInputHandler(self)
+        if self._setItem(self.mixing.preview, meIndex, (data[2] << 8) | data[3], ('preview', meIndex)):
+            if self.prvInputHandler is not None:
+                self.prvInputHandler(self)
 
     def recvKeOn(self, data):
         meIndex = data[0]
         keyer = data[1]
-        self.state['keyers'].setdefault(meIndex, {})[keyer] = (data[2] != 0)
+        onAir = self.keyers.onAir
+        while len(onAir) <= meIndex:
+            onAir.append(None)
+        flags = onAir[meIndex]
+        if flags is None:
+            flags = onAir[meIndex] = bytearray()
+        if keyer >= len(flags):
+            flags.extend(b'\xff' * (keyer + 1 - len(flags)))
+        value = int(data[2] != 0)
+        old = flags[keyer]
+        if old != value:
+            flags[keyer] = value
+            self._notify(('keyers', meIndex, keyer), None if old == 0xFF else bool(old), bool(value))
+
+    def _dsk(self, keyer):
+        dsks = self.keyers.dsks
+        while len(dsks) <= keyer:
+            dsks.append(AtemDownstreamKeyer())
+        return dsks[keyer]
 
     def recvDskB(self, data):
         keyer = data[0]
-        keyer_setting = self.state['dskeyers'].setdefault(keyer, {})
-        keyer_setting['fill'] = struct.unpack('!H', data[2:4])[0]
-        keyer_setting['key'] = struct.unpack('!H', data[4:6])[0]
+        keyer_setting = self._dsk(keyer)
+        self._set(keyer_setting, 'fill', struct.unpack('!H', data[2:4])[0], ('dskeyers', keyer, 'fill'))
+        self._set(keyer_setting, 'key', struct.unpack('!H', data[4:6])[0], ('dskeyers', keyer, 'key'))
 
     def recvDskS(self, data):
         keyer = data[0]
-        dsk_setting = self.state['dskeyers'].setdefault(keyer, {})
-        dsk_setting['onAir'] = (data[1] != 0)
-        dsk_setting['inTransition'] = (data[2] != 0)
-        dsk_setting['autoTransitioning'] = (data[3] != 0)
-        dsk_setting['framesRemaining'] = data[4]
+        dsk_setting = self._dsk(keyer)
+        self._set(dsk_setting, 'onAir', (data[1] != 0), ('dskeyers', keyer, 'onAir'))
+        self._set(dsk_setting, 'inTransition', (data[2] != 0), ('dskeyers', keyer, 'inTransition'))
+        self._set(dsk_setting, 'autoTransitioning', (data[3] != 0), ('dskeyers', keyer, 'autoTransitioning'))
+        self._set(dsk_setting, 'framesRemaining', data[4], ('dskeyers', keyer, 'framesRemaining'))
 
     def recvAuxS(self, data):
         auxIndex = data[0]
-        self.state['aux'][auxIndex] = struct.unpack('!H', data[2:4])[0]
+        self._setItem(self.aux.sources, auxIndex, (data[2] << 8) | data[3], ('aux', auxIndex))
+
+    # raw camera control values as reported to subscribers and in the dict view
+    def _ccRaw(self, feature, val):
+        if val is None:
+            return None
+        if feature.components is None:
+            return val[0]
+        return dict(zip(feature.components, val))
+
+    # translates raw camera control values into their unit or option label
+    def _ccTranslate(self, feature, val):
+        if val is None:
+            return None
+        if feature.options is not None:
+            return feature.options.get(val[0], feature.unknown.format(val[0]))
+        if feature.scales is None:
+            return val[0]
+        if feature.components is None:
+            multiplier, divisor, bias = feature.scales[0]
+            return float(val[0]) * multiplier / divisor + bias
+        return {key: float(v) * multiplier / divisor + bias
+                for key, v, (multiplier, divisor, bias) in zip(feature.components, val, feature.scales)}
+
+    # the raw values of a camera control value given in its unit, as option label or as dict by component
+    def _ccUntranslate(self, feature, value):
+        if feature.options is not None:
+            if not isinstance(value, str):
+                return (value,)
+            for raw, label in feature.options.items():
+                if label == value:
+                    return (raw,)
+            raise ValueError('unknown %s %s %r' % (feature.domainLabel, feature.featureLabel, value))
+        values = [value[key] for key in feature.components] if feature.components else [value]
+        if feature.scales is None:
+            return tuple(values)
+        return tuple(int(round((v - bias) * divisor / multiplier))
+                     for v, (multiplier, divisor, bias) in zip(values, feature.scales))
 
     def recvCCdo(self, data):
         input_num = data[1]
-        domain = data[2]
-        feature = data[3]
-        feature_label = feature
-        try:
-            if domain == 0:
-                feature_label = self.LABELS_CC_LENS_FEATURE[feature]
-            elif domain == 1:
-                feature_label = self.LABELS_CC_CAM_FEATURE[feature]
-            elif domain == 8:
-                feature_label = self.LABELS_CC_CHIP_FEATURE[feature]
-            self.cameracontrol.setdefault(input_num, {}).setdefault('features', {}).setdefault(
-                self.LABELS_CC_DOMAIN[domain], {})[feature_label] = bool(data[4])
-        except KeyError:
+        feature = self.CC_FEATURES.get((data[2], data[3]))
+        if feature is None:
             print("Warning: CC Feature not recognized (no label)")
-
+            return
+        available = self.cameras.get(input_num).available
+        value = int(data[4] != 0)
+        slot = feature.slot
+        old = available[slot]
+        if old != value:
+            available[slot] = value
+            self._notify(('cameracontrol', input_num, 'features', feature.domainLabel, feature.featureLabel),
+                         None if old == 0xFF else bool(old), bool(value))
+
+    # values are kept as the tuple the codec of their feature unpacks
     def recvCCdP(self, data):
+        feature = self.CC_FEATURES.get((data[2], data[3]))
+        if feature is None or feature.codec is None:
+            return
+        val = feature.codec.unpack_from(data, feature.offset)
         input_num = data[1]
-        domain = data[2]
-        feature = data[3]
-        feature_label = feature
-        val = None
-        val_translated = None
-        if domain == 0:  # lens
-            if feature == 0:  # focus
-                val = val_translated = struct.unpack('!h', data[16:18])[0]
-            elif feature == 1:  # auto focused
-                pass
-            elif feature == 3:  # iris
-                val = val_translated = struct.unpack('!h', data[16:18])[0]
-            elif feature == 9:  # zoom
-                val = val_translated = struct.unpack('!h', data[16:18])[0]
-        elif domain == 1:  # camera
-            if feature == 1:  # gain
-                val = struct.unpack('!h', data[16:18])[0]
-                val_translated = self.VALUES_CC_GAIN.get(val, 'unknown')
-            elif feature == 2:  # white balance
-                val = struct.unpack('!h', data[16:18])[0]
-                val_translated = self.VALUES_CC_WB.get(val, val + 'K')
-            elif feature == 5:  # shutter
-                val = struct.unpack('!h', data[18:20])[0]
-                val_translated = self.VALUES_CC_SHUTTER.get(val, 'off')
-        elif domain == 8:  # chip
-            val_keys_color = ['R', 'G', 'B', 'Y']
-            if feature == 0:  # lift
-                val = dict(zip(val_keys_color, struct.unpack('!hhhh', data[16:24])))
-                val_translated = {k: float(v) / 4096 for k, v in val.items()}
-            elif feature == 1:  # gamma
-                val = dict(zip(val_keys_color, struct.unpack('!hhhh', data[16:24])))
-                val_translated = {k: float(v) / 8192 for k, v in val.items()}
-            elif feature == 2:  # gain
-                val = dict(zip(val_keys_color, struct.unpack('!hhhh', data[16:24])))
-                val_translated = {k: float(v) * 16 / 32767 for k, v in val.items()}
-            elif feature == 3:  # aperture
-                pass  # no idea - todo
-            elif feature == 4:  # contrast
-                val = struct.unpack('!h', data[18:20])[0]
-                val_translated = float(val) / 4096
-            elif feature == 5:  # luminance
-                val = struct.unpack('!h', data[16:18])[0]
-                val_translated = float(val) / 2048
-            elif feature == 6:  # hue-saturation
-                val_keys = ['hue', 'saturation']
-                val = dict(zip(val_keys, struct.unpack('!hh', data[16:20])))
-                val_translated = {}
-                val_translated['hue'] = float(val['hue']) * 360 / 2048 + 180
-                val_translated['saturation'] = float(val['saturation']) / 4096
-        try:
-            if domain == 0:
-                feature_label = self.LABELS_CC_LENS_FEATURE[feature]
-            elif domain == 1:
-                feature_label = self.LABELS_CC_CAM_FEATURE[feature]
-            elif domain == 8:
-                feature_label = self.LABELS_CC_CHIP_FEATURE[feature]
-            self.cameracontrol.setdefault(input_num, {}).setdefault('state_raw', {}).setdefault(
-                self.LABELS_CC_DOMAIN[domain], {})[feature_label] = val
-            self.cameracontrol.setdefault(input_num, {}).setdefault('state', {}).setdefault(
-                self.LABELS_CC_DOMAIN[domain], {})[feature_label] = val_translated
-        except KeyError:
-            # print("Warning: CC Feature not recognized (no label)")
-            pass
+        values = self.cameras.get(input_num).values
+        slot = feature.slot
+        old = values[slot]
+        if old == val:
+            return
+        values[slot] = val
+        # values are translated for subscribers and the dict view only
+        if not self._stateSubscribers:
+            self._changed = True
+            return
+        path = ('cameracontrol', input_num)
+        self._notify(path + ('state_raw', feature.domainLabel, feature.featureLabel), self._ccRaw(feature, old),
+                     self._ccRaw(feature, val))
+        self._notify(path + ('state', feature.domainLabel, feature.featureLabel), self._ccTranslate(feature, old),
+                     self._ccTranslate(feature, val))
+
+    # CCmd payload setting a camera control feature of an input to raw values, a tuple as in AtemCamera.values
+    def encodeCameraControl(self, input_num, feature, val):
+        if feature.codec is None:
+            raise ValueError('%s %s can not be set' % (feature.domainLabel, feature.featureLabel))
+        size = feature.offset + feature.codec.size
+        payload = bytearray(size + -size % 8)
+        payload[0] = input_num
+        payload[1] = feature.domain
+        payload[2] = feature.feature
+        payload[4] = feature.dataType
+        struct.pack_into('!H', payload, self.CC_COUNT_OFFSETS[feature.dataType], len(feature.prefix) + len(val))
+        if feature.prefix:
+            struct.pack_into('!' + self.CC_ELEMENTS[feature.dataType] * len(feature.prefix), payload,
+                             self.CC_VALUES_OFFSET, *feature.prefix)
+        feature.codec.pack_into(payload, feature.offset, *val)
+        return bytes(payload)
+
+    # coalesces a CCmd setting a camera control feature of an input, value as in the 'state' of the
+    # cameracontrol view: in its unit, as option label or as dict by component
+    def setCameraControl(self, input_num, domain_label, feature_label, value, callback=None):
+        feature = self.CC_FEATURES_BY_LABEL.get((domain_label, feature_label))
+        if feature is None:
+            raise ValueError('unknown camera control feature %s %s' % (domain_label, feature_label))
+        payload = self.encodeCameraControl(input_num, feature, self._ccUntranslate(feature, value))
+        return self.coalesceCommand(b'CCmd', payload, callback)
+
+    # coalesces a CAMI setting volume, balance or mix option of an audio input, values as in the
+    # audio state, those left None are not changed
+    def setAudioInput(self, channel, volume=None, balance=None, mix_option=None, callback=None):
+        mask = 0
+        if mix_option is not None:
+            mask |= 0x01
+        if volume is not None:
+            mask |= 0x02
+        if balance is not None:
+            mask |= 0x04
+        payload = struct.pack('!BxHBxHh2x', mask, channel, mix_option or 0, volume or 0, balance or 0)
+        return self.coalesceCommand(b'CAMI', payload, callback)
+
+    # coalesces a CTPs moving the transition of an M/E to position, 0 to 10000 as by the T-bar
+    def setTransitionPosition(self, me, position, callback=None):
+        return self.coalesceCommand(b'CTPs', struct.pack('!BxH', me, position), callback)
+
+    # turns sending audio levels every frame on or off, returns the AudioLevels keeping them; history
+    # is the frames kept and hold those peakHold looks back, as they were when created
+    def setAudioLevels(self, enabled=True, history=64, hold=60):
+        if self.audioLevels is None:
+            self.audioLevels = AudioLevels(history, hold)
+        self.audioLevelsEnabled = enabled
+        self.sendCommand(b'SALN', struct.pack('!?3x', enabled))
+        return self.audioLevels
+
+    # media pool transfers, see mediatransfer.py; each returns its MediaTransfer, callback(transfer) runs
+    # once it finished. Frames are a path, mapped instead of read, or bytes in the switcher's format
+
+    def _transfer(self, transfer):
+        if self.transfers is None:
+            self.transfers = MediaTransfers(self)
+        self.transfers.add(transfer)
+        self._timersChanged()
+        return transfer
+
+    # a still that already holds a frame with the same hash is not sent again
+    def uploadStill(self, index, source, name='', description='', callback=None):
+        transfer = MediaTransfer.forUpload(STORE_STILLS, index, source, name, description, callback=callback)
+        still = self.mediapool.stills.get(index)
+        if still is not None and still.used and still.hash == transfer.hash:
+            transfer.end(transfer.SKIPPED)
+            if callback is not None:
+                callback(transfer)
+            return transfer
+        return self._transfer(transfer)
+
+    def uploadClipFrame(self, clip, frame, source, callback=None):
+        return self._transfer(MediaTransfer.forUpload(clip + 1, frame, source, callback=callback))
+
+    # the frame is in transfer.data once done
+    def downloadStill(self, index, callback=None):
+        return self._transfer(MediaTransfer(STORE_STILLS, index, False, callback))
+
+    def downloadClipFrame(self, clip, frame, callback=None):
+        return self._transfer(MediaTransfer(clip + 1, frame, False, callback))
 
     def recvRCPS(self, data):
         player_num = data[0]
-        player = self.state['mediaplayer'].setdefault(player_num, {})
-        player['playing'] = bool(data[1])
-        player['loop'] = bool(data[2])
-        player['beginning'] = bool(data[3])
-        player['clip_frame'] = struct.unpack('!H', data[4:6])[0]
+        player = self.mediaplayers.get(player_num)
+        path = ('mediaplayer', player_num)
+        self._set(player, 'playing', bool(data[1]), path + ('playing',))
+        self._set(player, 'loop', bool(data[2]), path + ('loop',))
+        self._set(player, 'beginning', bool(data[3]), path + ('beginning',))
+        self._set(player, 'clip_frame', struct.unpack('!H', data[4:6])[0], path + ('clip_frame',))
 
     def recvMPCE(self, data):
         player_num = data[0]
-        player = self.state['mediaplayer'].setdefault(player_num, {})
-        player['type'] = {1: 'still', 2: 'clip'}.get(data[1])
-        player['still_index'] = data[2]
-        player['clip_index'] = data[3]
+        player = self.mediaplayers.get(player_num)
+        path = ('mediaplayer', player_num)
+        self._set(player, 'type', {1: 'still', 2: 'clip'}.get(data[1]), path + ('type',))
+        self._set(player, 'still_index', data[2], path + ('still_index',))
+        self._set(player, 'clip_index', data[3], path + ('clip_index',))
 
     def recvMPSp(self, data):
-        self.config['mediapool'].setdefault(0, {})['maxlength'] = struct.unpack('!H', data[0:2])[0]
-        self.config['mediapool'].setdefault(1, {})['maxlength'] = struct.unpack('!H', data[2:4])[0]
+        maxlength = self.configuration.clip_maxlength
+        self._setItem(maxlength, 0, struct.unpack('!H', data[0:2])[0], ('config', 'mediapool', 0, 'maxlength'))
+        self._setItem(maxlength, 1, struct.unpack('!H', data[2:4])[0], ('config', 'mediapool', 1, 'maxlength'))
+
+    # the record of bank in one of the media pool bank dicts, created on first use
+    def _bank(self, banks, bank, cls):
+        record = banks.get(bank)
+        if record is None:
+            record = banks[bank] = cls()
+        return record
 
     def recvMPCS(self, data):
         bank = data[0]
-        clip_bank = self.state['mediapool'].setdefault('clips', {}).setdefault(bank, {})
-        clip_bank['used'] = bool(data[1])
-        clip_bank['filename'] = self.convert_cstring(data[2:18])
-        clip_bank['length'] = struct.unpack('!H', data[66:68])[0]
+        clip_bank = self._bank(self.mediapool.clips, bank, AtemClip)
+        path = ('mediapool', 'clips', bank)
+        self._set(clip_bank, 'used', bool(data[1]), path + ('used',))
+        self._set(clip_bank, 'filename', self.convert_cstring(data[2:18]), path + ('filename',))
+        self._set(clip_bank, 'length', struct.unpack('!H', data[66:68])[0], path + ('length',))
 
     def recvMPAS(self, data):
         bank = data[0]
-        audio_bank = self.state['mediapool'].setdefault('audio', {}).setdefault(bank, {})
-        audio_bank['used'] = bool(data[1])
-        audio_bank['filename'] = self.convert_cstring(data[18:34])
+        audio_bank = self._bank(self.mediapool.audio, bank, AtemAudioClip)
+        path = ('mediapool', 'audio', bank)
+        self._set(audio_bank, 'used', bool(data[1]), path + ('used',))
+        self._set(audio_bank, 'filename', self.convert_cstring(data[18:34]), path + ('filename',))
 
     def recvMPfe(self, data):
         if data[0] != 0:
             return
         bank = data[3]
-        still_bank = self.state['mediapool'].setdefault('stills', {}).setdefault(bank, {})
-        still_bank['used'] = bool(data[4])
-        still_bank['hash'] = data[5:21]#.decode("utf-8")
+        still_bank = self._bank(self.mediapool.stills, bank, AtemStill)
+        path = ('mediapool', 'stills', bank)
+        self._set(still_bank, 'used', bool(data[4]), path + ('used',))
+        self._set(still_bank, 'hash', bytes(data[5:21]), path + ('hash',))
         filename_length = data[23]
-        still_bank['filename'] = data[24:(24 + filename_length)].decode("utf-8")
+        self._set(still_bank, 'filename', bytes(data[24:(24 + filename_length)]).decode("utf-8"),
+                  path + ('filename',))
 
     def recvAMIP(self, data):
         channel = struct.unpack('!H', data[0:2])[0]
-        channel_config = self.system_config['audio'].setdefault(channel, {})
-        channel_config['fromMediaPlayer'] = bool(data[6])
-        channel_config['plug'] = data[7]
-
-        channel_state = self.state['audio'].setdefault(channel, {})
-        channel_state['mix_option'] = data[8]
-        channel_state['volume'] = struct.unpack('!H', data[10:12])[0]
-        channel_state['balance'] = struct.unpack('!h', data[12:14])[0]
+        channel_setting = self.audio.channels.get(channel)
+        if channel_setting is None:
+            channel_setting = self.audio.channels[channel] = AtemAudioChannel()
+        path = ('system_config', 'audio', channel)
+        self._set(channel_setting, 'fromMediaPlayer', bool(data[6]), path + ('fromMediaPlayer',))
+        self._set(channel_setting, 'plug', data[7], path + ('plug',))
+
+        path = ('audio', channel)
+        self._set(channel_setting, 'mix_option', data[8], path + ('mix_option',))
+        self._set(channel_setting, 'volume', struct.unpack('!H', data[10:12])[0], path + ('volume',))
+        self._set(channel_setting, 'balance', struct.unpack('!h', data[12:14])[0], path + ('balance',))
 
     def recvAMMO(self, data):
-        self.state['audio']['master_volume'] = struct.unpack('!H', data[0:2])[0]
+        self._set(self.audio, 'master_volume', struct.unpack('!H', data[0:2])[0], ('audio', 'master_volume'))
 
     def recvAMmO(self, data):
-        monitor = self.state['audio'].setdefault('monitor', {})
-        monitor['enabled'] = bool(data[0])
-        monitor['volume'] = struct.unpack('!H', data[2:4])[0]
-        monitor['mute'] = bool(data[4])
-        monitor['solo'] = bool(data[5])
-        monitor['solo_input'] = struct.unpack('!H', data[6:8])[0]
-        monitor['dim'] = bool(data[8])
+        monitor = self.audio.monitor
+        path = ('audio', 'monitor')
+        self._set(monitor, 'enabled', bool(data[0]), path + ('enabled',))
+        self._set(monitor, 'volume', struct.unpack('!H', data[2:4])[0], path + ('volume',))
+        self._set(monitor, 'mute', bool(data[4]), path + ('mute',))
+        self._set(monitor, 'solo', bool(data[5]), path + ('solo',))
+        self._set(monitor, 'solo_input', struct.unpack('!H', data[6:8])[0], path + ('solo_input',))
+        self._set(monitor, 'dim', bool(data[8]), path + ('dim',))
+
+    def recvAMLv(self, data):
+        if self.audioLevels is not None:
+            self.audioLevels.update(data)
 
     def recvAMTl(self, data):
         src_count = struct.unpack('!H', data[0:2])[0]
+        tally = self.audio.tally
         for i in range(src_count):
             num = 2 + i * 3
             channel = struct.unpack('!H', data[num:num + 2])[0]
-            self.state['audio'].setdefault('tally', {})[channel] = bool(data[num + 2])
+            self._update(tally, channel, bool(data[num + 2]), ('audio', 'tally', channel))
+
+    # tally flags as sent in TlIn/TlSr
+    def _tallyDict(self, flags):
+        return {'prv': bool(flags & self.TALLY_PREVIEW), 'pgm': bool(flags & self.TALLY_PROGRAM)}
+
+    # indexes of the bytes that differ between two equally long buffers, found by XOR of the whole buffers
+    def _diffBytes(self, old, new, changes):
+        del changes[:]
+        count = len(new)
+        diff = int.from_bytes(old, 'big') ^ int.from_bytes(new, 'big')
+        while diff:
+            byte = ((diff & -diff).bit_length() - 1) >> 3
+            changes.append(count - 1 - byte)
+            diff &= ~(0xFF << (byte << 3))
+        changes.reverse()
 
     def recvTlIn(self, data):
-        src_count = struct.unpack('!H', data[0:2])[0]
-        for i in range(2, src_count + 2):
-            self.state['tally_by_index'][str(i - 1)] = self.parseBitmask(data[i], ['prv', 'pgm'])
-        self.tallyHandler(self)
+        src_count = (data[0] << 8) | data[1]
+        flags = data[2:2 + src_count]
+        store = self.tally.byIndex
+        if self.tally.predicted:
+            self._dropPredicted(store)
+        if flags == store:
+            return
+        changes = self.tally.changes
+        known = len(store)
+        if known == src_count:
+            self._diffBytes(store, flags, changes)
+        else:
+            # number of inputs changed, new inputs are reported, removed ones count as no tally
+            old = bytes(store)
+            changes[:] = [i for i in range(max(src_count, len(old)))
+                          if i >= len(old) or old[i] != (flags[i] if i < src_count else 0)]
+            store.extend(bytes(max(0, src_count - len(store))))
+        for n, i in enumerate(changes):
+            old = self._tallyDict(store[i]) if i < known else None
+            value = flags[i] if i < src_count else 0
+            store[i] = value
+            changes[n] = i + 1
+            self._notify(('tally_by_index', str(i + 1)), old, self._tallyDict(value))
+        del store[src_count:]
+        if self.tallyHandler is not None:
+            self.tallyHandler(self)
 
     def recvTlSr(self, data):
-        src_count = struct.unpack('!H', data[0:2])[0]
-        for i in range(2, min(src_count * 3 + 2, len(data)-2)):
-            source = struct.unpack('!H', data[i:i + 2])[0]
-            self.state['tally'][source] = self.parseBitmask(data[i + 2], ['prv', 'pgm'])
-        self.tallyHandler(self)
+        src_count = (data[0] << 8) | data[1]
+        entries = data[2:2 + src_count * 3]
+        store = self.tally.bySource
+        if self.tally.predicted:
+            self._dropPredicted(store)
+        if entries == store:
+            return
+        positions = self.tally.sourcePositions
+        changes = self.tally.changes
+        removed = ()
+        previous = None
+        layoutChanged = len(store) != len(entries)
+        if not layoutChanged:
+            self._diffBytes(store, entries, changes)
+            # source ids are in the first two bytes of each 3 byte entry, flags in the third
+            layoutChanged = any(offset % 3 != 2 for offset in changes)
+        if layoutChanged:
+            previous = {source: store[offset] for source, offset in positions.items()}
+            store[:] = entries
+            positions.clear()
+            for offset in range(0, len(store), 3):
+                positions[(store[offset] << 8) | store[offset + 1]] = offset + 2
+            del changes[:]
+            for source, offset in positions.items():
+                if source not in previous or store[offset] != previous[source]:
+                    changes.append(offset)
+            removed = [source for source in previous if source not in positions]
+        else:
+            oldFlags = [store[offset] for offset in changes]
+            for offset in changes:
+                store[offset] = entries[offset]
+        for n, offset in enumerate(changes):
+            source = (store[offset - 2] << 8) | store[offset - 1]
+            changes[n] = source
+            if previous is None:
+                old = oldFlags[n]
+            else:
+                old = previous.get(source)
+            self._notify(('tally', source), None if old is None else self._tallyDict(old),
+                         self._tallyDict(store[offset]))
+        # sources no longer reported are off
+        for source in removed:
+            if previous[source]:
+                changes.append(source)
+                self._notify(('tally', source), self._tallyDict(previous[source]), self._tallyDict(0))
+        if self.tallyHandler is not None:
+            self.tallyHandler(self)
+
+    # O(1) tally lookups without allocation, by input index as in TlIn (1 based) and by source id as in TlSr
+    def getTally(self, index):
+        store = self.tally.byIndex
+        return store[index - 1] if 0 < index <= len(store) else 0
+
+    def isProgram(self, index):
+        return bool(self.getTally(index) & self.TALLY_PROGRAM)
+
+    def isPreview(self, index):
+        return bool(self.getTally(index) & self.TALLY_PREVIEW)
+
+    def getSourceTally(self, source):
+        offset = self.tally.sourcePositions.get(source)
+        return self.tally.bySource[offset] if offset is not None else 0
 
     def recvTime(self, data):
-        self.state['last_state_change'] = struct.unpack('!BBBB', data[0:4])
+        self._set(self.facts, 'last_state_change', struct.unpack('!BBBB', data[0:4]), ('last_state_change',))
 
     def recvAMPP(self, data):
         pass
@@ -583,40 +1594,268 @@ class Atem:
     def recvRXSS(self, data):
         pass
 
+    # transitions, see AtemTransition
+
+    def _transition(self, me):
+        if me >= len(self.mixing.transitions):
+            self.mixing.resize(me + 1)
+        return self.mixing.transitions[me]
+
     def recvTrSS(self, data):
-        pass
+        me = data[0]
+        transition = self._transition(me)
+        path = ('transitions', me)
+        self._set(transition, 'style', data[1], path + ('style',))
+        self._set(transition, 'selection', data[2], path + ('selection',))
+        self._set(transition, 'nextStyle', data[3], path + ('nextStyle',))
+        self._set(transition, 'nextSelection', data[4], path + ('nextSelection',))
+
     def recvTrPr(self, data):
-        pass
+        me = data[0]
+        self._set(self._transition(me), 'preview', data[1] != 0, ('transitions', me, 'preview'))
+
+    # state paths of TrPs by M/E, built once so that the TrPs of every frame allocate nothing
+    _TRPS_PATHS = {}
 
+    # sent every frame while a transition runs
     def recvTrPs(self, data):
-        pass
+        me = data[0]
+        transitions = self.mixing.transitions
+        transition = transitions[me] if me < len(transitions) else self._transition(me)
+        paths = self._TRPS_PATHS.get(me)
+        if paths is None:
+            paths = self._TRPS_PATHS[me] = tuple(('transitions', me, name)
+                                                 for name in ('inTransition', 'framesRemaining', 'position'))
+        inTransition = data[1] != 0
+        last = transition.position
+        self._set(transition, 'framesRemaining', data[2], paths[1])
+        self._set(transition, 'position', (data[4] << 8) | data[5], paths[2])
+        if self._set(transition, 'inTransition', inTransition, paths[0]) and self.predictiveTally and me == 0:
+            if inTransition:
+                self._predictTally(transition)
+            elif self.tally.predicted and (last or 0) < self.TRANSITION_TAKEN_BACK:
+                self._restoreTally()
 
     def recvTMxP(self, data):
-        pass
+        me = data[0]
+        self._set(self._transition(me), 'mixRate', data[1], ('transitions', me, 'mixRate'))
 
     def recvTDdP(self, data):
-        """Transition Dip"""
-        pass
+        me = data[0]
+        transition = self._transition(me)
+        self._set(transition, 'dipRate', data[1], ('transitions', me, 'dipRate'))
+        self._set(transition, 'dipSource', (data[2] << 8) | data[3], ('transitions', me, 'dipSource'))
 
     def recvTWpP(self, data):
-        """Transition Wipe"""
-        pass
+        me = data[0]
+        wipe = self._transition(me).wipe
+        path = ('transitions', me, 'wipe')
+        self._set(wipe, 'rate', data[1], path + ('rate',))
+        self._set(wipe, 'pattern', data[2], path + ('pattern',))
+        width, fillSource, symmetry, softness, x, y = struct.unpack('!HHHHHH', data[4:16])
+        self._set(wipe, 'width', width, path + ('width',))
+        self._set(wipe, 'fillSource', fillSource, path + ('fillSource',))
+        self._set(wipe, 'symmetry', symmetry, path + ('symmetry',))
+        self._set(wipe, 'softness', softness, path + ('softness',))
+        self._set(wipe, 'x', x, path + ('x',))
+        self._set(wipe, 'y', y, path + ('y',))
+        self._set(wipe, 'reverse', data[16] != 0, path + ('reverse',))
+        self._set(wipe, 'flipFlop', data[17] != 0, path + ('flipFlop',))
+
+    # predictive tally: the preview source of M/E 1 goes on program as a background transition starts,
+    # external inputs by index as in TlIn and every source as in TlSr. The switcher's next tally replaces
+    # the prediction, a transition taken back restores the flags from before
+    def _predictTally(self, transition):
+        source = self.mixing.preview[0] if self.mixing.preview else UNKNOWN_SOURCE
+        if source == UNKNOWN_SOURCE or transition.preview or \
+                not (transition.selection is None or transition.selection & self.TRANSITION_BACKGROUND):
+            return
+        tally = self.tally
+        changes = tally.changes
+        del changes[:]
+        if 0 < source <= len(tally.byIndex) and not tally.byIndex[source - 1] & self.TALLY_PROGRAM:
+            self._setTallyFlags(tally.byIndex, source - 1, tally.byIndex[source - 1] | self.TALLY_PROGRAM)
+            changes.append(source)
+        offset = tally.sourcePositions.get(source)
+        if offset is not None and not tally.bySource[offset] & self.TALLY_PROGRAM:
+            self._setTallyFlags(tally.bySource, offset, tally.bySource[offset] | self.TALLY_PROGRAM)
+            if source not in changes:
+                changes.append(source)
+        if changes:
+            self._tallyPredicted()
+
+    def _restoreTally(self):
+        tally = self.tally
+        changes = tally.changes
+        del changes[:]
+        for store, offset, flags in reversed(tally.predicted):
+            self._setTallyFlags(store, offset, flags, False)
+            source = offset + 1 if store is tally.byIndex else (store[offset - 2] << 8) | store[offset - 1]
+            if source not in changes:
+                changes.append(source)
+        del tally.predicted[:]
+        self._tallyPredicted()
+
+    # sets the flags of one entry of a tally store, keeping what they were to restore them
+    def _setTallyFlags(self, store, offset, flags, keep=True):
+        tally = self.tally
+        old = store[offset]
+        store[offset] = flags
+        if store is tally.byIndex:
+            path = ('tally_by_index', str(offset + 1))
+        else:
+            path = ('tally', (store[offset - 2] << 8) | store[offset - 1])
+        if keep:
+            tally.predicted.append([store, offset, old])
+        self._notify(path, self._tallyDict(old), self._tallyDict(flags))
+
+    # predictions stay local, tallycast and snapshots carry the tally as the switcher reported it
+    def _tallyPredicted(self):
+        if self.tallyHandler is not None:
+            self.tallyHandler(self)
+
+    # the switcher reported the tally of store, predictions for it are void
+    def _dropPredicted(self, store):
+        predicted = self.tally.predicted
+        predicted[:] = [entry for entry in predicted if entry[0] is not store]
 
     def recvLKST(self, data):
         pass
 
+    # answers to media transfers, see mediatransfer.py
+
+    def recvLKOB(self, data):
+        if self.transfers is not None:
+            self.transfers.lockObtained(LKOB.unpack_from(data)[0])
+
+    def recvFTCD(self, data):
+        if self.transfers is not None:
+            transferId, chunkSize, chunkCount = FTCD.unpack_from(data)
+            self.transfers.continueUpload(transferId, chunkSize, chunkCount)
+
+    def recvFTDa(self, data):
+        if self.transfers is not None:
+            transferId, size = FTDA.unpack_from(data)
+            self.transfers.data(transferId, data[FTDA.size:FTDA.size + size])
+
+    def recvFTDC(self, data):
+        if self.transfers is not None:
+            self.transfers.complete(FTDC.unpack_from(data)[0])
+
+    def recvFTDE(self, data):
+        if self.transfers is not None:
+            transferId, code = FTDE.unpack_from(data)
+            self.transfers.error(transferId, code)
+
     ## user functions
-    # used to register a function that should be called when a change is received from the atem
+    # used to register a function that should be called when a change is received from the atem,
+    # func(atem, method) runs after a command of type method (e.g. 'PrgI', all if empty) changed state
     def handleAtemChange(self, func, method=''):
-        pass  # todo: if given, filter by method parameter, then call func with atem method
+        if method.startswith('recv'):
+            method = method[4:]
+        tag = method.encode('ascii') if method else None
+        self._commandSubscribers.setdefault(tag, []).append(func)
 
-    # used to register a function that should be called when a change is set in an attribute
+    # used to register a function that should be called when a change is set in an attribute,
+    # func(atem, path, old, new) runs for changes at or below the name path, e.g. ['tally', 5]
     def handleStateChange(self, func, name=[]):
-        pass  # todo: if given, filer by name path, then call func with name path and val
+        self._stateSubscribers.setdefault(tuple(name), []).append(func)
+
+    # notifies state subscribers of path and of each of its prefixes
+    def _notify(self, path, old, new):
+        self._changed = True
+        subscribers = self._stateSubscribers
+        if subscribers:
+            for i in range(len(path) + 1):
+                funcs = subscribers.get(path[:i])
+                if funcs:
+                    for func in funcs:
+                        func(self, path, old, new)
+
+    # notifies command subscribers after the handler of tag changed state
+    def _notifyCommand(self, tag):
+        subscribers = self._commandSubscribers
+        method = tag.decode('ascii')
+        for key in (tag, None):
+            funcs = subscribers.get(key)
+            if funcs:
+                for func in funcs:
+                    func(self, method)
 
     # used to get ranges and options lists for attributes
     def getOption(self, name):
-        return  # todo: return range/list of options for the given attribute name path
+        # the feature of a camera control path decides about its options, e.g. camera gain vs. chip gain
+        if len(name) >= 2 and (name[-2], name[-1]) in self.OPTIONS_BY_FEATURE:
+            return self.OPTIONS_BY_FEATURE[(name[-2], name[-1])]
+        for key in reversed(name):
+            if key in self.OPTIONS:
+                return self.OPTIONS[key]
+        return None
+
+    # dict views of the state model, built on every access
+    # ------------------------------------------------------
+
+    @property
+    def system_config(self):
+        system_config = self.facts.asDict()
+        system_config['inputs'] = {index: input_setting.asDict(self.LABELS_PORTS_EXTERNAL)
+                                   for index, input_setting in self.configuration.inputs.items()}
+        system_config['audio'] = {channel: channel_setting.asDict(AtemAudioChannel.CONFIG)
+                                  for channel, channel_setting in self.audio.channels.items()}
+        system_config['keyers'] = sourcesDict(self.facts.keyers)
+        return system_config
+
+    @property
+    def status(self):
+        if self.facts.power is None:
+            return {}
+        return {'power': self.parseBitmask(self.facts.power, ['main', 'backup'])}
+
+    @property
+    def config(self):
+        return self.configuration.asDict()
+
+    @property
+    def state(self):
+        keyers = self.keyers.asDict()
+        tally = self.tally
+        state = {
+            'program': sourcesDict(self.mixing.program),
+            'preview': sourcesDict(self.mixing.preview),
+            'transitions': {me: transition.asDict() for me, transition in enumerate(self.mixing.transitions)
+                            if transition.style is not None or transition.inTransition is not None},
+            'keyers': keyers['keyers'],
+            'dskeyers': keyers['dskeyers'],
+            'aux': sourcesDict(self.aux.sources),
+            'mediaplayer': self.mediaplayers.asDict(),
+            'mediapool': self.mediapool.asDict(),
+            'audio': self.audio.asDict(),
+            'tally_by_index': {str(i + 1): self._tallyDict(flags) for i, flags in enumerate(tally.byIndex)},
+            'tally': {source: self._tallyDict(tally.bySource[offset])
+                      for source, offset in tally.sourcePositions.items()},
+            'booted': True,
+        }
+        if self.facts.last_state_change is not None:
+            state['last_state_change'] = self.facts.last_state_change
+        return state
+
+    @property
+    def cameracontrol(self):
+        cameracontrol = {}
+        for input_num, camera in self.cameras.cameras.items():
+            view = cameracontrol[input_num] = {}
+            for feature in self.CC_FEATURES.values():
+                domain_label, feature_label = feature.domainLabel, feature.featureLabel
+                if camera.available[feature.slot] != 0xFF:
+                    view.setdefault('features', {}).setdefault(domain_label, {})[feature_label] = \
+                        bool(camera.available[feature.slot])
+                val = camera.values[feature.slot]
+                if val is not None:
+                    view.setdefault('state_raw', {}).setdefault(domain_label, {})[feature_label] = \
+                        self._ccRaw(feature, val)
+                    view.setdefault('state', {}).setdefault(domain_label, {})[feature_label] = \
+                        self._ccTranslate(feature, val)
+        return cameracontrol
 
     def dump(self):
         pprint(self.system_config)
@@ -625,6 +1864,9 @@ class Atem:
         pprint(self.cameracontrol)
 
 
+Atem._buildDispatchTable()
+
+
 def init(a):
     a.connectToSwitcher()
     while True:
@@ -633,51 +1875,46 @@ def init(a):
 
 if __name__ == '__main__':
     import config
-    import RPi.GPIO as GPIO
+    from outputs import configOutputs
 
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setwarnings(False)
-    GPIO.setup(config.gpio_red,   GPIO.OUT)
-    GPIO.setup(config.gpio_green, GPIO.OUT)
+    # the lamps are written on a thread of their own, the receive loop only hands over the values
+    outputs = configOutputs(config)
 
     a = Atem(config.address)
+    # optional, predictive_tally = True in config.py: red as soon as a transition to the input starts
+    a.predictiveTally = getattr(config, 'predictive_tally', False)
 
     def tallyWatch(atem):
-        #return
-        # pprint(atem.state['tally_by_index'])
-        # pprint(atem.state['tally'])
-        index = str(config.input)
-        tally = atem.state['tally_by_index'][index]
-
-        try:
-            GPIO.output(config.gpio_red,   GPIO.HIGH if tally['pgm'] else GPIO.LOW)
-            GPIO.output(config.gpio_green, GPIO.HIGH if tally['prv'] else GPIO.LOW)
-        except:
-            print(index, 'not found in state', tally)
+        outputs.update({'red': atem.isProgram(config.input), 'green': atem.isPreview(config.input)})
 
     def programInputWatch(atem):
         return
-        print("Program RED", atem.state['program'][0], atem.state['program'])
-
-        if atem.state['program'][0] == config.input:
-            GPIO.output(config.gpio_red, GPIO.HIGH)
-        else:
-            GPIO.output(config.gpio_red, GPIO.LOW)
-
+        print("Program RED", atem.mixing.program[0], atem.state['program'])
 
     def previewInputWatch(atem):
         return
-        print("Preview GREEN", atem.state['preview'][0], atem.state['preview'])
-
-        if atem.state['preview'][0] == config.input:
-            GPIO.output(config.gpio_green, GPIO.HIGH)
-        else:
-            GPIO.output(config.gpio_green, GPIO.LOW)
+        print("Preview GREEN", atem.mixing.preview[0], atem.state['preview'])
 
     a.tallyHandler = tallyWatch
     a.pgmInputHandler = programInputWatch
     a.prvInputHandler = previewInputWatch
 
+    # optional, e.g. snapshot = '/home/pi/tally/state.snap' in config.py: the lights come up
+    # as they were before the restart, until the switcher says otherwise
+    if getattr(config, 'snapshot', None):
+        a.startSnapshot(config.snapshot)
+
+    # optional, e.g. tallycast = '239.255.90.10' in config.py: lights running tallycast.py subscribe
+    # follow this one without a session of their own
+    if getattr(config, 'tallycast', None):
+        a.startTallycast(config.tallycast)
+
+    # optional, e.g. metrics_port = 9100 in config.py
+    if getattr(config, 'metrics_port', None):
+        from metrics import MetricsServer
+        a.metrics = AtemMetrics()
+        MetricsServer(lambda: [a], port=config.metrics_port).start()
+
     a.connectToSwitcher()
 
     i = 0
@@ -685,4 +1922,4 @@ if __name__ == '__main__':
         a.waitForPacket()
         #i += 1
 
-    GPIO.cleanup()
+    outputs.close()
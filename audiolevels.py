@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# keeps the audio levels the switcher sends every frame once asked to, for VU meters
+#
+#   levels = atem.setAudioLevels(True)
+#   cursor = 0
+#   ...
+#   cursor, frames = levels.pull(cursor, decimation=4)     # every 4 frames as one
+#   print(levels.decibels(frames[-1][levels.channel(1) * 4]))
+#
+# an AMLv payload is the count of sources, the levels of master and monitor, the
+# source ids and the levels of every source; levels are left, right, peak left and
+# peak right as 32 bit values, AMLV_FULL_SCALE is 0 dBFS. Each payload is copied
+# into a row of a preallocated ring, a numpy array if numpy is installed and an
+# array('I') otherwise, without looking at single values. Consumers read decimated
+# frames and peak-hold from the ring at their own pace.
+
+import math
+import struct
+import sys
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+AMLV_HEADER = struct.Struct('!H2x')
+# values per channel in a frame
+VALUES = 4
+LEFT, RIGHT, PEAK_LEFT, PEAK_RIGHT = range(VALUES)
+# master and monitor come first in a frame, then the sources
+MASTER = 0
+MONITOR = 1
+SOURCES_OFFSET = 2
+AMLV_FULL_SCALE = 1 << 23
+# levels below are shown as silence
+SILENCE_DB = -60.0
+
+_SWAP = sys.byteorder == 'little'
+
+
+# a ring of the last history level frames of a switcher; a frame holds VALUES levels per channel,
+# channel(source) is the first of a source
+class AudioLevels:
+    def __init__(self, history=64, hold=60, useNumpy=True):
+        self.history = history
+        # frames peakHold looks back
+        self.hold = hold
+        self.numpy = numpy if useNumpy else None
+        # source ids in the order of their channels
+        self.sources = ()
+        self._channels = {}
+        self._ids = None
+        # frames received, the sequence number of the next one
+        self.count = 0
+        self._resize(0)
+
+    def _resize(self, sources):
+        self.width = (SOURCES_OFFSET + sources) * VALUES
+        self.count = 0
+        if self.numpy is not None:
+            self.ring = self.numpy.zeros((self.history, self.width), self.numpy.uint32)
+        else:
+            self.ring = array('I', bytes(4 * self.history * self.width))
+
+    # index of the channel of a source in a frame, ValueError for sources not metered
+    def channel(self, source):
+        try:
+            return self._channels[source]
+        except KeyError:
+            raise ValueError('source %d is not metered' % source) from None
+
+    # stores an AMLv payload as the next frame
+    def update(self, data):
+        sources = AMLV_HEADER.unpack_from(data)[0]
+        idsEnd = 36 + 2 * sources
+        levelsOffset = idsEnd + (-idsEnd % 4)
+        if len(data) < levelsOffset + 16 * sources:
+            print('AMLv too short for %d sources' % sources)
+            return
+        ids = data[36:idsEnd]
+        if ids != self._ids:
+            # other sources, the frames so far do not line up with the new ones
+            self._ids = bytes(ids)
+            self.sources = struct.unpack('!%dH' % sources, ids)
+            self._channels = {source: SOURCES_OFFSET + i for i, source in enumerate(self.sources)}
+            self._resize(sources)
+        position = self.count % self.history
+        self.count += 1
+        if self.numpy is not None:
+            row = self.ring[position]
+            row[:8] = self.numpy.frombuffer(data, '>u4', 8, 4)
+            row[8:] = self.numpy.frombuffer(data, '>u4', 4 * sources, levelsOffset)
+            return
+        row = array('I')
+        row.frombytes(data[4:36])
+        row.frombytes(data[levelsOffset:levelsOffset + 16 * sources])
+        if _SWAP:
+            row.byteswap()
+        start = position * self.width
+        self.ring[start:start + self.width] = row
+
+    # the frames with sequence numbers first to last - 1, at most history, as rows of the ring
+    def _rows(self, first, last):
+        first = max(first, last - self.history, 0)
+        if self.numpy is not None:
+            return self.ring.take(self.numpy.arange(first, last) % self.history, axis=0)
+        ring = self.ring
+        width = self.width
+        rows = []
+        for sequence in range(first, last):
+            start = sequence % self.history * width
+            rows.append(ring[start:start + width])
+        return rows
+
+    # the latest frame, None before the first
+    def latest(self):
+        if not self.count:
+            return None
+        return self._rows(self.count - 1, self.count)[0]
+
+    # the frames received since cursor in groups of decimation, each the highest levels of the group;
+    # returns the cursor of the next call and the frames, a group still filling up waits for it
+    def pull(self, cursor=0, decimation=1):
+        if cursor > self.count or cursor < self.count - self.history:
+            # frames were lost to the ring or the sources changed, start at the first group boundary
+            # still kept, so that groups line up with those of a cursor that kept pace
+            cursor = max(0, self.count - self.history)
+            cursor += -cursor % decimation
+        groups = (self.count - cursor) // decimation
+        if groups <= 0:
+            return cursor, []
+        end = cursor + groups * decimation
+        rows = self._rows(cursor, end)
+        if decimation == 1:
+            return end, list(rows)
+        if self.numpy is not None:
+            return end, list(rows.reshape(len(rows) // decimation, decimation, self.width).max(axis=1))
+        return end, [array('I', map(max, *rows[i:i + decimation])) for i in range(0, len(rows), decimation)]
+
+    # the highest peak of either side of every channel over the last hold frames
+    def peakHold(self):
+        rows = self._rows(self.count - self.hold, self.count)
+        if self.numpy is not None:
+            if not len(rows):
+                return self.numpy.zeros(self.width // VALUES, self.numpy.uint32)
+            return rows.reshape(len(rows), -1, VALUES)[:, :, PEAK_LEFT:].max(axis=(0, 2))
+        if not rows:
+            return array('I', bytes(4 * (self.width // VALUES)))
+        peaks = [row[PEAK_LEFT::VALUES] for row in rows] + [row[PEAK_RIGHT::VALUES] for row in rows]
+        return array('I', map(max, *peaks))
+
+    # a level in dBFS, SILENCE_DB for silence
+    @staticmethod
+    def decibels(value):
+        if value <= 0:
+            return SILENCE_DB
+        return max(SILENCE_DB, 20 * math.log10(value / AMLV_FULL_SCALE))
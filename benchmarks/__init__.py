@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# benchmarks for the atem client, run from the repository root, e.g.
+#   python3 -m benchmarks.bench_parse
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# runs the benchmark scenarios of benchmarks/suite.py and prints a table,
+# --json writes the results for tracking regressions ('-' for stdout)
+#
+#   python3 -m benchmarks [scenario ...] [--seconds 1] [--json results.json]
+
+import argparse
+import contextlib
+import json
+import platform
+import sys
+import time
+
+from benchmarks.suite import SCENARIOS
+
+
+def formatValue(value, width):
+    if value is None:
+        return '-'.rjust(width)
+    return ('%' + str(width) + '.0f') % value if value >= 100 else ('%' + str(width) + '.2f') % value
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3 -m benchmarks', description='run the benchmark scenarios')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help='any of %s, all if none given' % ', '.join(SCENARIOS))
+    parser.add_argument('--seconds', type=float, default=1.0, help='time spent per scenario')
+    parser.add_argument('--json', metavar='PATH', help='write the results as JSON, - for stdout')
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error('unknown scenario %s' % name)
+
+    results = []
+    table = sys.stderr if args.json == '-' else sys.stdout
+    print('%-10s %14s %12s %12s %12s %10s %10s' % ('scenario', 'subcmds/s', 'packets/s', 'alloc B/pkt',
+                                                   'held B/pkt', 'p50 us', 'p99 us'), file=table)
+    for name in args.scenarios or SCENARIOS:
+        # keep connection messages out of JSON written to stdout
+        with contextlib.redirect_stdout(table):
+            result = SCENARIOS[name](args.seconds)
+        results.append(result)
+        print('%-10s %s %s %s %s %s %s' % (name, formatValue(result['subcommands_per_sec'], 14),
+                                           formatValue(result['packets_per_sec'], 12),
+                                           formatValue(result['allocated_bytes_per_packet'], 12),
+                                           formatValue(result['retained_bytes_per_packet'], 12),
+                                           formatValue(result['latency_p50_us'], 10),
+                                           formatValue(result['latency_p99_us'], 10)), file=table)
+
+    if args.json:
+        report = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'results': results,
+        }
+        if args.json == '-':
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json, 'w') as file:
+                json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
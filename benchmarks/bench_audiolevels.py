@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# audio level metering of a 20 input switcher at 60 frames a second: decoding
+# AMLv into the ring of AudioLevels, with array and with numpy if installed,
+# against unpacking every value into dicts, the cost of pulling decimated
+# frames and peak-hold, and the stream from the local switcher emulator
+#
+#   python3 -m benchmarks.bench_audiolevels
+
+import random
+import struct
+import time
+
+from atem import Atem
+from audiolevels import AudioLevels, numpy
+from emulator import AtemEmulator, cmdAMLv
+
+INPUTS = 20
+RATE = 60
+
+
+# decodes every level of an AMLv with its own unpack into dicts
+def decodeDicts(data, levels):
+    sources = struct.unpack('!H', data[0:2])[0]
+    names = ('left', 'right', 'peak_left', 'peak_right')
+    for i, name in enumerate(names):
+        levels.setdefault('master', {})[name] = struct.unpack('!I', data[4 + 4 * i:8 + 4 * i])[0]
+        levels.setdefault('monitor', {})[name] = struct.unpack('!I', data[20 + 4 * i:24 + 4 * i])[0]
+    offset = 36 + 2 * sources
+    offset += -offset % 4
+    for i in range(sources):
+        source = struct.unpack('!H', data[36 + 2 * i:38 + 2 * i])[0]
+        channel = levels.setdefault(source, {})
+        for j, name in enumerate(names):
+            channel[name] = struct.unpack('!I', data[offset + 4 * j:offset + 4 * j + 4])[0]
+        offset += 16
+
+
+def payloads(count, inputs=INPUTS):
+    level = random.Random(1).getrandbits
+    result = []
+    for i in range(count):
+        sources = {source: (level(23), level(23), level(23), level(23)) for source in range(1, inputs + 1)}
+        result.append(memoryview(cmdAMLv((level(23),) * 4, (level(23),) * 4, sources))[Atem.SIZE_OF_SUBHEADER:])
+    return result
+
+
+def timePerCall(function, items, rounds=20):
+    start = time.perf_counter()
+    for i in range(rounds):
+        for item in items:
+            function(item)
+    return (time.perf_counter() - start) / (rounds * len(items))
+
+
+def main():
+    data = payloads(RATE)
+    decoders = [('dicts', None)]
+    decoders.append(('array', AudioLevels(useNumpy=False)))
+    if numpy is not None:
+        decoders.append(('numpy', AudioLevels()))
+    print('%d inputs at %d fps, AMLv of %d bytes' % (INPUTS, RATE, len(data[0])))
+    print('decoder   per frame   CPU at %d fps   decimate by 4 / s   peak-hold' % RATE)
+    for name, levels in decoders:
+        if levels is None:
+            state = {}
+            perFrame = timePerCall(lambda item: decodeDicts(item, state), data)
+            print('%-7s %8.2f us %13.3f %%' % (name, perFrame * 1e6, perFrame * RATE * 100))
+            continue
+        perFrame = timePerCall(levels.update, data)
+        # a meter drawn at 15 fps pulls a second of frames in groups of 4
+        start = time.perf_counter()
+        for i in range(100):
+            levels.pull(levels.count - RATE, 4)
+        pull = (time.perf_counter() - start) / 100
+        start = time.perf_counter()
+        for i in range(100):
+            levels.peakHold()
+        hold = (time.perf_counter() - start) / 100
+        print('%-7s %8.2f us %13.3f %% %16.0f us %8.0f us' % (name, perFrame * 1e6, perFrame * RATE * 100,
+                                                             pull * 1e6, hold * 1e6))
+    if numpy is None:
+        print('numpy not installed, AudioLevels uses array')
+
+    # the decoded levels are those sent
+    check = AudioLevels(useNumpy=False)
+    for item in data:
+        check.update(item)
+    state = {}
+    decodeDicts(data[-1], state)
+    latest = check.latest()
+    assert all(latest[check.channel(source) * 4 + 1] == state[source]['right'] for source in range(1, INPUTS + 1))
+
+    emulator = AtemEmulator(inputs=INPUTS, mes=1).start()
+    atem = Atem('127.0.0.1', emulator.port, localPort=0)
+    atem.connectToSwitcher()
+    while not atem.isInitialized:
+        atem.waitForPacket()
+    levels = atem.setAudioLevels(True)
+    stream = emulator.addStream('audiolevels', RATE)
+    cursor = 0
+    meter = 0
+    start = time.monotonic()
+    cpu = time.process_time()
+    while time.monotonic() - start < 3:
+        atem.waitForPacket()
+        cursor, frames = levels.pull(cursor, 4)
+        meter += len(frames)
+    cpu = time.process_time() - cpu
+    emulator.removeStream(stream)
+    print('emulator stream: %d frames in 3s, %d meter updates, process CPU %.0f ms including the emulator' %
+          (levels.count, meter, cpu * 1000))
+    atem.socket.close()
+    emulator.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# camera painting: CCdP handled with the camera control table (one lookup and
+# one unpack_from) and with the former if/elif ladder over domain and feature,
+# without and with a state subscriber, the cost of encoding CCmd, and the round
+# trip of a CCmd through the local switcher emulator until its CCdP came back,
+# coalesced by setCameraControl and sent right away by sendCommand
+#
+#   python3 -m benchmarks.bench_cameracontrol
+
+import struct
+import time
+
+from atem import Atem
+from benchmarks import datagrams
+from emulator import AtemEmulator
+from manager import AtemManager
+
+
+# CCdP as handled before the table, kept for comparison
+class LadderAtem(Atem):
+    COMPONENTS = {(8, 0): ('R', 'G', 'B', 'Y'), (8, 1): ('R', 'G', 'B', 'Y'), (8, 2): ('R', 'G', 'B', 'Y'),
+                  (8, 6): ('hue', 'saturation')}
+
+    def _ladderRaw(self, domain, feature, val):
+        keys = self.COMPONENTS.get((domain, feature))
+        if keys is None or val is None:
+            return val
+        return dict(zip(keys, val))
+
+    def _ladderTranslate(self, domain, feature, val):
+        if val is None:
+            return None
+        if domain == 1:  # camera
+            if feature == 1:  # gain
+                return self.VALUES_CC_GAIN.get(val, 'unknown')
+            elif feature == 2:  # white balance
+                return self.VALUES_CC_WB.get(val, str(val) + 'K')
+            elif feature == 5:  # shutter
+                return self.VALUES_CC_SHUTTER.get(val, 'off')
+        elif domain == 8:  # chip
+            val_keys_color = ['R', 'G', 'B', 'Y']
+            if feature == 0:  # lift
+                return {k: float(v) / 4096 for k, v in zip(val_keys_color, val)}
+            elif feature == 1:  # gamma
+                return {k: float(v) / 8192 for k, v in zip(val_keys_color, val)}
+            elif feature == 2:  # gain
+                return {k: float(v) * 16 / 32767 for k, v in zip(val_keys_color, val)}
+            elif feature == 4:  # contrast
+                return float(val) / 4096
+            elif feature == 5:  # luminance
+                return float(val) / 2048
+            elif feature == 6:  # hue-saturation
+                return {'hue': float(val[0]) * 360 / 2048 + 180, 'saturation': float(val[1]) / 4096}
+        return val
+
+    def recvCCdP(self, data):
+        input_num = data[1]
+        domain = data[2]
+        feature = data[3]
+        val = None
+        if domain == 0:  # lens
+            if feature in (0, 3, 9):  # focus, iris, zoom
+                val = struct.unpack('!h', data[16:18])[0]
+        elif domain == 1:  # camera
+            if feature in (1, 2):  # gain, white balance
+                val = struct.unpack('!h', data[16:18])[0]
+            elif feature == 5:  # shutter
+                val = struct.unpack('!h', data[18:20])[0]
+        elif domain == 8:  # chip
+            if feature in (0, 1, 2):  # lift, gamma, gain
+                val = struct.unpack('!hhhh', data[16:24])
+            elif feature == 4:  # contrast
+                val = struct.unpack('!h', data[18:20])[0]
+            elif feature == 5:  # luminance
+                val = struct.unpack('!h', data[16:18])[0]
+            elif feature == 6:  # hue-saturation
+                val = struct.unpack('!hh', data[16:20])
+        if val is None:
+            return
+        entry = self.CC_FEATURES[(domain, feature)]
+        values = self.cameras.get(input_num).values
+        old = values[entry.slot]
+        if old == val:
+            return
+        values[entry.slot] = val
+        if not self._stateSubscribers:
+            self._changed = True
+            return
+        path = ('cameracontrol', input_num)
+        self._notify(path + ('state_raw', entry.domainLabel, entry.featureLabel),
+                     self._ladderRaw(domain, feature, old), self._ladderRaw(domain, feature, val))
+        self._notify(path + ('state', entry.domainLabel, entry.featureLabel),
+                     self._ladderTranslate(domain, feature, old), self._ladderTranslate(domain, feature, val))
+
+
+# an RCP painting 8 cameras: every datagram moves lift, gamma, gain, iris, focus and
+# hue/saturation of one camera, each value changes; returns the datagrams and the
+# CCdP payloads in them
+def painting(cameras=8, steps=250):
+    packets = []
+    payloads = []
+    for step in range(steps):
+        inputNum = 1 + step % cameras
+        value = step - steps // 2
+        commands = [
+            datagrams.cmdCCdP(inputNum, 8, 0, [value, value + 1, value + 2, 0]),
+            datagrams.cmdCCdP(inputNum, 8, 1, [value, value, value, value]),
+            datagrams.cmdCCdP(inputNum, 8, 2, [2048 + value] * 4),
+            datagrams.cmdCCdP(inputNum, 0, 3, [1024 + value]),
+            datagrams.cmdCCdP(inputNum, 0, 0, [value]),
+            datagrams.cmdCCdP(inputNum, 8, 6, [value, 2048 + value]),
+        ]
+        packets.append(datagrams.datagram(commands, bitmask=0))
+        payloads.extend(memoryview(command)[Atem.SIZE_OF_SUBHEADER:] for command in commands)
+    return packets, payloads
+
+
+def createAtem(cls, subscribed):
+    atem = cls('127.0.0.1', localPort=0)
+    atem.socket.close()
+    atem.metrics = None
+    if subscribed:
+        atem.handleStateChange(lambda a, path, old, new: None, ['cameracontrol'])
+    return atem
+
+
+# best of several rounds, in CCdP/sec through handleDatagram and in microseconds per recvCCdP call;
+# the classes take turns within each round, so a busy machine slows all of them alike
+def measure(classes, packets, payloads, subscribed, rounds=100):
+    best = {cls: [None, None] for cls in classes}
+    for i in range(rounds):
+        for cls in classes:
+            atem = createAtem(cls, subscribed)
+            handle = atem.handleDatagram
+            start = time.perf_counter()
+            for packet in packets:
+                handle(packet)
+            elapsed = [time.perf_counter() - start]
+
+            atem = createAtem(cls, subscribed)
+            recv = atem.recvCCdP
+            start = time.perf_counter()
+            for payload in payloads:
+                recv(payload)
+            elapsed.append(time.perf_counter() - start)
+            best[cls] = [seconds if previous is None else min(previous, seconds)
+                         for previous, seconds in zip(best[cls], elapsed)]
+    return {cls: (len(payloads) / datagramSeconds, handlerSeconds / len(payloads) * 1e6)
+            for cls, (datagramSeconds, handlerSeconds) in best.items()}
+
+
+def roundTrips(immediate, count=200):
+    emulator = AtemEmulator(inputs=8).start()
+    manager = AtemManager()
+    atem = manager.addSwitcher('127.0.0.1', emulator.port)
+    end = time.monotonic() + 5
+    while not atem.isInitialized and time.monotonic() < end:
+        manager.poll(0.01)
+    seen = []
+    atem.handleStateChange(lambda a, path, old, new: seen.append(time.perf_counter()), ['cameracontrol', 1, 'state'])
+    feature = atem.CC_FEATURES_BY_LABEL[('chip', 'lift')]
+    times = []
+    for i in range(count):
+        seen.clear()
+        start = time.perf_counter()
+        if immediate:
+            atem.sendCommand(b'CCmd', atem.encodeCameraControl(1, feature, (i + 1, 0, 0, 0)))
+        else:
+            atem.setCameraControl(1, 'chip', 'lift', {'R': (i + 1) / 4096, 'G': 0.0, 'B': 0.0, 'Y': 0.0})
+            atem.flushCommands()
+        end = time.monotonic() + 1
+        while not seen and time.monotonic() < end:
+            manager.poll(0.01)
+        if seen:
+            times.append(seen[0] - start)
+    manager.close()
+    emulator.close()
+    times.sort()
+    return times
+
+
+def main():
+    packets, payloads = painting()
+    print('CCdP handling   subscriber   CCdP/s    recvCCdP')
+    for subscribed in (False, True):
+        results = measure((LadderAtem, Atem), packets, payloads, subscribed)
+        for name, cls in (('ladder', LadderAtem), ('table', Atem)):
+            print('%-15s %-10s %9.0f %8.2f us' % (name, 'state' if subscribed else 'none', *results[cls]))
+        table, ladder = results[Atem], results[LadderAtem]
+        print('table speedup %.2fx CCdP/s, %.2fx recvCCdP' % (table[0] / ladder[0], ladder[1] / table[1]))
+
+    atem = Atem('127.0.0.1', localPort=0)
+    atem.socket.close()
+    feature = atem.CC_FEATURES_BY_LABEL[('chip', 'lift')]
+    start = time.perf_counter()
+    for i in range(20000):
+        atem.encodeCameraControl(1, feature, (i, i, i, 0))
+    encode = (time.perf_counter() - start) / 20000
+    lift = {'R': 0.1, 'G': 0.1, 'B': 0.1, 'Y': 0.0}
+    start = time.perf_counter()
+    for i in range(20000):
+        atem.setCameraControl(1, 'chip', 'lift', lift)
+    queue = (time.perf_counter() - start) / 20000
+    print('CCmd encode %.2f us, setCameraControl with unit conversion %.2f us' % (encode * 1e6, queue * 1e6))
+
+    print('CCmd to CCdP round trip through the emulator, a change every round trip')
+    for name, immediate in (('setCameraControl', False), ('sendCommand', True)):
+        times = roundTrips(immediate)
+        if times:
+            print('%-17s p50 %6.2f ms, p99 %6.2f ms, %d answered' %
+                  (name, times[len(times) // 2] * 1000, times[min(len(times) - 1, int(len(times) * 0.99))] * 1000,
+                   len(times)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# a fader moving an audio input's volume at 1kHz, with a cut every 250ms, against
+# the local switcher emulator: datagrams and commands sent and the latency from a
+# fader move until the switcher received it or a later value, with every move
+# sent right away and coalesced at several intervals; cuts are never coalesced
+#
+#   python3 -m benchmarks.bench_coalesce
+
+import struct
+import time
+
+from emulator import AtemEmulator
+from manager import AtemManager
+from metrics import AtemMetrics
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+# returns the datagrams and commands sent, the fader latencies and the cut latencies in seconds
+def run(interval, seconds=2.0, rate=1000, delay=0.001):
+    emulator = AtemEmulator(inputs=8, delay=delay).start()
+    manager = AtemManager()
+    atem = manager.addSwitcher('127.0.0.1', emulator.port)
+    atem.metrics = AtemMetrics()
+    end = time.monotonic() + 5
+    while not atem.isInitialized and time.monotonic() < end:
+        manager.poll(0.01)
+
+    # the volume of every CAMI and the time it arrived at the switcher, likewise for cuts
+    arrived = []
+    cutsArrived = []
+
+    def received(emulator, session, tag, payload):
+        if tag == b'CAMI':
+            arrived.append(((payload[6] << 8) | payload[7], time.perf_counter()))
+        elif tag == b'DCut':
+            cutsArrived.append(time.perf_counter())
+
+    emulator.commandHandler = received
+    if interval is not None:
+        atem.COALESCE_INTERVAL = interval
+    datagrams = atem.metrics.datagrams_sent
+    commands = emulator.stats['commands']
+
+    moves = []
+    cuts = []
+    start = time.perf_counter()
+    count = int(seconds * rate)
+    for i in range(count):
+        due = start + i / rate
+        while time.perf_counter() < due:
+            manager.poll(max(0, due - time.perf_counter()))
+        moves.append(time.perf_counter())
+        # the CAMI of setAudioInput(1, volume=i + 1)
+        payload = struct.pack('!BxHBxHh2x', 0x02, 1, 0, i + 1, 0)
+        if interval is None:
+            atem.sendCommand(b'CAMI', payload)
+        else:
+            atem.coalesceCommand(b'CAMI', payload)
+        if i % (rate // 4) == rate // 8:
+            cuts.append(time.perf_counter())
+            atem.sendCommand(b'DCut', b'\x00\x00\x00\x00')
+    end = time.monotonic() + 1
+    while (not arrived or arrived[-1][0] < count or len(cutsArrived) < len(cuts)) and time.monotonic() < end:
+        manager.poll(0.005)
+    datagrams = atem.metrics.datagrams_sent - datagrams
+    commands = emulator.stats['commands'] - commands
+    manager.close()
+    emulator.close()
+
+    # the first arrival of a volume at or above each move's
+    latencies = []
+    position = 0
+    for i, moved in enumerate(moves):
+        while position < len(arrived) and arrived[position][0] < i + 1:
+            position += 1
+        if position < len(arrived):
+            latencies.append(arrived[position][1] - moved)
+    return datagrams, commands, latencies, [a - c for c, a in zip(cuts, cutsArrived)]
+
+
+def main():
+    print('1kHz fader      datagrams   commands   latency p50     p99      max   cut p50')
+    for name, interval in (('not coalesced', None), ('5ms', 0.005), ('1/60s', 1 / 60), ('1/50s', 0.02)):
+        datagrams, commands, latencies, cuts = run(interval)
+        print('%-14s %10d %10d %9.2f ms %6.2f ms %6.2f ms %6.2f ms' %
+              (name, datagrams, commands, percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000,
+               max(latencies) * 1000, percentile(cuts, 0.5) * 1000))
+
+
+if __name__ == '__main__':
+    main()
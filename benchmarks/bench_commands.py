@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# command throughput and cut to ACK latency of the outbound command
+# pipeline against the local switcher emulator, with simulated packet loss
+#
+#   python3 -m benchmarks.bench_commands
+
+import time
+
+from atem import Atem
+from emulator import AtemEmulator
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def connect(emulator):
+    atem = Atem('127.0.0.1', emulator.port, localPort=0)
+    atem.connectToSwitcher()
+    while not atem.isInitialized:
+        atem.waitForPacket()
+    return atem
+
+
+def waitFor(atem, commands):
+    while not all(pending.acked or pending.failed for pending in commands):
+        atem.waitForPacket()
+
+
+def cutLatency(atem, count):
+    latencies = []
+    for i in range(count):
+        pending = atem.sendCommand(b'DCut', b'\x00\x00\x00\x00')
+        waitFor(atem, [pending])
+        if pending.acked:
+            latencies.append(pending.ackTime - pending.sentTime)
+    return latencies
+
+
+def throughput(atem, count):
+    start = time.monotonic()
+    commands = [atem.queueCommand(b'CPgI', bytes([0, 0, 0, i & 0xff])) for i in range(count)]
+    atem.flushCommands()
+    waitFor(atem, commands)
+    return count / (time.monotonic() - start), sum(pending.failed for pending in commands)
+
+
+def main():
+    print('loss    cuts   p50 ack      p99 ack      commands/s   failed   datagrams')
+    for loss in (0.0, 0.01, 0.05, 0.2):
+        emulator = AtemEmulator(inputs=1, mes=1, loss=loss, applyCommands=False).start()
+        atem = connect(emulator)
+
+        latencies = cutLatency(atem, 200)
+        received = emulator.stats['received']
+        rate, failed = throughput(atem, 20000)
+        print('%3.0f%%   %5d   %7.3f ms   %7.3f ms   %10.0f   %6d   %9d' %
+              (loss * 100, len(latencies), percentile(latencies, 0.5) * 1000,
+               percentile(latencies, 0.99) * 1000, rate, failed, emulator.stats['received'] - received))
+
+        atem.socket.close()
+        emulator.close()
+
+
+if __name__ == '__main__':
+    main()
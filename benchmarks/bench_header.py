@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# header encode/decode and ACK handling with the struct.Struct codec,
+# compared to the former per-field struct.pack/unpack implementation
+#
+#   python3 -m benchmarks.bench_header
+
+import struct
+import time
+
+from atem import Atem
+from benchmarks import datagrams
+
+
+def legacyCreateCommandHeader(atem, bitmask, payloadSize, uid, ackId):
+    buffer = b''
+    packageId = 0
+    if not (bitmask & (atem.CMD_HELLOPACKET | atem.CMD_ACK)):
+        atem.packetCounter += 1
+        packageId = atem.packetCounter
+    val = bitmask << 11
+    val |= (payloadSize + atem.SIZE_OF_HEADER)
+    buffer += struct.pack('!H', val)
+    buffer += struct.pack('!H', uid)
+    buffer += struct.pack('!H', ackId)
+    buffer += struct.pack('!I', 0)
+    buffer += struct.pack('!H', packageId)
+    return buffer
+
+
+def legacyParseCommandHeader(atem, datagram):
+    header = {}
+    if len(datagram) >= atem.SIZE_OF_HEADER:
+        header['bitmask'] = struct.unpack('B', datagram[0:1])[0] >> 3
+        header['size'] = struct.unpack('!H', datagram[0:2])[0] & 0x07FF
+        header['uid'] = struct.unpack('!H', datagram[2:4])[0]
+        header['ackId'] = struct.unpack('!H', datagram[4:6])[0]
+        header['packageId'] = struct.unpack('!H', datagram[10:12])[0]
+        return header
+    return False
+
+
+# the ACK path of the former handleSocketData for a datagram without payload
+def legacyHandleDatagram(atem, datagram):
+    header = legacyParseCommandHeader(atem, datagram)
+    if header:
+        atem.currentUid = header['uid']
+        if header['bitmask'] & atem.CMD_ACKREQUEST:
+            ackDatagram = legacyCreateCommandHeader(atem, atem.CMD_ACK, 0, header['uid'], header['packageId'])
+            atem.sendDatagram(ackDatagram)
+            atem.isInitialized = True
+
+
+def rate(func, seconds=1.0):
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for i in range(1000):
+            func()
+        count += 1000
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return count / elapsed
+
+
+def main():
+    atem = Atem('127.0.0.1', localPort=0)
+    atem.socket.close()
+    atem.sendDatagram = lambda datagram: None
+    ping = datagrams.datagram([])
+
+    cases = [
+        ('create header',
+         lambda: legacyCreateCommandHeader(atem, atem.CMD_ACK, 0, 0x8001, 1),
+         lambda: atem.createCommandHeader(atem.CMD_ACK, 0, 0x8001, 1)),
+        ('parse header',
+         lambda: legacyParseCommandHeader(atem, ping),
+         lambda: atem.parseCommandHeader(ping)),
+        ('ack a ping',
+         lambda: legacyHandleDatagram(atem, ping),
+         lambda: atem.handleDatagram(ping)),
+    ]
+    for label, before, after in cases:
+        before = rate(before)
+        after = rate(after)
+        print('%-14s before %10.0f/s   after %10.0f/s   x%.2f' % (label, before, after, after / before))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# parse cost of a tally-only interest set compared to decoding everything,
+# for the initial state dump and for camera painting bursts
+#
+#   python3 -m benchmarks.bench_interests
+
+import time
+
+from atem import Atem
+from benchmarks import datagrams
+
+
+def createAtem(interests):
+    atem = Atem('127.0.0.1', localPort=0, interests=interests)
+    atem.socket.close()
+    atem.tallyHandler = atem.pgmInputHandler = atem.prvInputHandler = lambda a: None
+    return atem
+
+
+def measure(atem, packets, commandCount, seconds=1.5):
+    rounds = 0
+    start = time.perf_counter()
+    while True:
+        for packet in packets:
+            atem.parsePayload(packet)
+        rounds += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return rounds * commandCount / elapsed
+
+
+def main():
+    painting = []
+    for i in range(1, 21):
+        painting.append(datagrams.cmdCCdP(i, 8, 0, [i, i, i, i]))
+        painting.append(datagrams.cmdCCdP(i, 0, 3, [i * 16]))
+    painting.append(datagrams.cmdTlIn([0, 1, 2, 0]))
+    scenarios = [
+        ('initial dump, 4 M/E', datagrams.initialDump(inputs=20, mes=4)),
+        ('camera painting', painting * 10),
+    ]
+    for label, commands in scenarios:
+        packets = datagrams.datagrams(commands)
+        full = measure(createAtem(None), packets, len(commands))
+        tally = measure(createAtem(['tally', 'PrgI', 'PrvI']), packets, len(commands))
+        print('%-22s full %10.0f sub-commands/s   tally only %10.0f sub-commands/s   x%.2f' %
+              (label, full, tally, tally / full))
+
+
+if __name__ == '__main__':
+    main()
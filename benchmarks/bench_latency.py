@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# latency from a switcher datagram leaving the socket until tallyHandler runs,
+# for the former 10 ms sleep-poll loop and the selector based waitForPacket
+#
+#   python3 -m benchmarks.bench_latency
+
+import random
+import socket
+import threading
+import time
+
+from atem import Atem
+from benchmarks import datagrams
+
+
+# the receive loop as it was before selectors, kept for comparison
+def legacyWaitForPacket(atem):
+    i = 0
+    while not atem.handleSocketData():
+        time.sleep(0.01)
+        i += 1
+        if i > 200:
+            return
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(wait, samples):
+    switcher = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    switcher.bind(('127.0.0.1', 0))
+
+    atem = Atem('127.0.0.1')
+    atem.address = switcher.getsockname()
+    atem.isInitialized = True
+    atem.pgmInputHandler = atem.prvInputHandler = lambda a: None
+    received = []
+    atem.tallyHandler = lambda a: received.append(time.perf_counter())
+
+    running = True
+
+    def loop():
+        while running:
+            wait(atem)
+
+    thread = threading.Thread(target=loop)
+    thread.start()
+
+    latencies = []
+    for i in range(samples):
+        packet = datagrams.datagram([datagrams.cmdTlIn([i & 3, 0, 1, 2])], packageId=i + 1)
+        count = len(received)
+        sent = time.perf_counter()
+        switcher.sendto(packet, ('127.0.0.1', 9910))
+        while len(received) == count:
+            time.sleep(0.0001)
+        latencies.append(received[-1] - sent)
+        # randomize the phase against the poll interval
+        time.sleep(random.uniform(0.001, 0.02))
+
+    running = False
+    # wake the loop so it sees running is cleared
+    switcher.sendto(datagrams.datagram([], packageId=samples + 1), ('127.0.0.1', 9910))
+    thread.join()
+    atem.socket.close()
+    switcher.close()
+    return latencies
+
+
+def main(samples=200):
+    for label, wait in (('sleep-poll', legacyWaitForPacket), ('selector', Atem.waitForPacket)):
+        latencies = measure(wait, samples)
+        print('%-12s p50 %7.3f ms   p99 %7.3f ms   max %7.3f ms' %
+              (label, percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000,
+               max(latencies) * 1000))
+
+
+if __name__ == '__main__':
+    main()
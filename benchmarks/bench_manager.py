@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# client CPU and packet to callback latency of one AtemManager process
+# against a growing number of sessions to the local switcher emulator
+#
+#   python3 -m benchmarks.bench_manager
+
+import time
+
+from benchmarks import datagrams
+from emulator import AtemEmulator
+from manager import AtemManager
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(count, rate=50, seconds=2.0):
+    emulator = AtemEmulator(inputs=4, mes=1).start()
+    manager = AtemManager()
+    latencies = []
+    sentAt = [0]
+
+    for i in range(count):
+        atem = manager.addSwitcher('127.0.0.1', emulator.port)
+        atem.pgmInputHandler = atem.prvInputHandler = lambda a: None
+        atem.tallyHandler = lambda a: latencies.append(time.perf_counter() - sentAt[0])
+
+    while not all(atem.isInitialized for atem in manager.sessions):
+        manager.poll(0.1)
+    del latencies[:]
+
+    cpuStart = time.thread_time()
+    wallStart = time.monotonic()
+    nextSend = wallStart
+    frame = 0
+    while time.monotonic() - wallStart < seconds:
+        now = time.monotonic()
+        if now >= nextSend:
+            frame += 1
+            sentAt[0] = time.perf_counter()
+            emulator.broadcast([datagrams.cmdTlIn([frame & 3, 0, 1, 2])])
+            nextSend += 1.0 / rate
+        manager.poll(max(0, nextSend - time.monotonic()))
+    cpu = time.thread_time() - cpuStart
+    wall = time.monotonic() - wallStart
+
+    manager.close()
+    emulator.close()
+    return cpu / wall, latencies
+
+
+def main():
+    print('switchers   client cpu   packets   p50 latency   p99 latency')
+    for count in (1, 2, 4, 8, 16, 32, 64):
+        cpu, latencies = measure(count)
+        print('%9d   %9.1f%%   %7d   %8.3f ms   %8.3f ms' %
+              (count, cpu * 100, len(latencies), percentile(latencies, 0.5) * 1000,
+               percentile(latencies, 0.99) * 1000))
+
+
+if __name__ == '__main__':
+    main()
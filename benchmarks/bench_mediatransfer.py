@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# media pool transfers against the local switcher emulator: RLE throughput for
+# typical 1080p frames, upload and download throughput of a still, uploads to
+# the stills and two clips one after the other and all at once, and the upload
+# of a still the switcher already holds; the emulator answers after 1ms
+#
+#   python3 -m benchmarks.bench_mediatransfer
+
+import os
+import random
+import time
+
+from atem import Atem
+from emulator import AtemEmulator
+from mediatransfer import MediaTransfer, encodeRLE, decodeRLE
+
+WIDTH = 1920
+HEIGHT = 1080
+
+
+# a lower third: transparent but for a band with a gradient and some noise for text
+def graphicFrame(seed=1):
+    rows = []
+    line = bytes(WIDTH * 4)
+    band = bytearray()
+    for x in range(WIDTH):
+        band += bytes((0xFF, x * 255 // WIDTH, 0x40, 0x80))
+    noise = random.Random(seed)
+    for y in range(HEIGHT):
+        if 800 <= y < 960:
+            row = bytearray(band)
+            if 850 <= y < 910:
+                for x in range(200, 1400, 7):
+                    row[x * 4:x * 4 + 4] = bytes((0xFF, 0xEB, 0x80, noise.randrange(256)))
+            rows.append(bytes(row))
+        else:
+            rows.append(line)
+    return b''.join(rows)
+
+
+def connect(emulator):
+    atem = Atem('127.0.0.1', emulator.port, localPort=0)
+    atem.connectToSwitcher()
+    while not atem.isInitialized:
+        atem.waitForPacket()
+    return atem
+
+
+# runs the transfers atem.method(*args) returns until all finished, returns them and the seconds taken
+def transfer(atem, calls):
+    done = []
+    start = time.perf_counter()
+    transfers = [method(*args, callback=done.append) for method, args in calls]
+    while len(done) < len(transfers):
+        atem.waitForPacket()
+    elapsed = time.perf_counter() - start
+    for item in transfers:
+        assert item.state in (MediaTransfer.DONE, MediaTransfer.SKIPPED), item.error
+    return transfers, elapsed
+
+
+def main(rounds=5):
+    frames = (('graphic', graphicFrame()), ('random', os.urandom(WIDTH * HEIGHT * 4)),
+              ('black', bytes(WIDTH * HEIGHT * 4)))
+    print('frame     size       RLE size   encode MB/s   decode MB/s')
+    for name, frame in frames:
+        encoded = encodeRLE(frame)
+        start = time.perf_counter()
+        for i in range(rounds):
+            encodeRLE(frame)
+        encode = (time.perf_counter() - start) / rounds
+        start = time.perf_counter()
+        for i in range(rounds):
+            decoded = decodeRLE(encoded)
+        decode = (time.perf_counter() - start) / rounds
+        assert decoded == frame
+        print('%-8s %8d %11d %13.0f %13.0f' % (name, len(frame), len(encoded), len(frame) / encode / 1e6,
+                                                len(frame) / decode / 1e6))
+
+    emulator = AtemEmulator(inputs=8, mes=1, delay=0.001).start()
+    atem = connect(emulator)
+    graphic = frames[0][1]
+    random_ = frames[1][1]
+
+    print('\ntransfer                     frames   wire MB   seconds    wire MB/s')
+    results = []
+    for name, calls in (
+            ('upload still', [(atem.uploadStill, (1, random_))]),
+            ('download still', [(atem.downloadStill, (1,))]),
+            ('upload sequential x3', None),
+            ('upload parallel x3', [(atem.uploadStill, (4, random_)), (atem.uploadClipFrame, (0, 1, random_)),
+                                    (atem.uploadClipFrame, (1, 1, random_))]),
+            ('upload still, RLE', [(atem.uploadStill, (3, graphic))]),
+            ('upload still, unchanged', [(atem.uploadStill, (3, graphic))])):
+        if calls is None:
+            transfers = []
+            elapsed = 0
+            for method, args in ((atem.uploadStill, (2, random_)), (atem.uploadClipFrame, (0, 0, random_)),
+                                 (atem.uploadClipFrame, (1, 0, random_))):
+                done, seconds = transfer(atem, [(method, args)])
+                transfers += done
+                elapsed += seconds
+        else:
+            transfers, elapsed = transfer(atem, calls)
+        size = sum(item.size for item in transfers if item.state == MediaTransfer.DONE)
+        results.append(transfers)
+        print('%-27s %7d %9.2f %9.3f %12.1f' % (name, len(transfers), size / 1e6, elapsed, size / elapsed / 1e6))
+    assert results[1][0].data == random_
+    assert results[-1][0].state == MediaTransfer.SKIPPED
+    atem.socket.close()
+    emulator.close()
+
+
+if __name__ == '__main__':
+    main()
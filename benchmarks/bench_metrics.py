@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# cost of the metrics an Atem collects: datagrams/sec through handleDatagram
+# with collecting on (atem.metrics = AtemMetrics()) and off, the added CPU share at a
+# busy 1000 datagrams/sec, and the time a scrape of the Prometheus text takes
+#
+#   python3 -m benchmarks.bench_metrics
+
+import time
+
+from atem import Atem
+from benchmarks import datagrams
+from metrics import AtemMetrics, prometheusText
+
+
+def createAtem(metrics):
+    atem = Atem('127.0.0.1', localPort=0)
+    atem.socket.close()
+    atem.tallyHandler = atem.pgmInputHandler = atem.prvInputHandler = lambda a: None
+    atem.metrics = AtemMetrics() if metrics else None
+    return atem
+
+
+# datagrams without ACKREQUEST, so handling them sends nothing
+def workloads(inputs=20, mes=4):
+    dump = [datagrams.datagram(batch, packageId=i + 1, bitmask=0)
+            for i, batch in enumerate(datagrams.batches(datagrams.initialDump(inputs=inputs, mes=mes)))]
+    tally = []
+    for i in range(500):
+        flags = [0] * inputs
+        flags[i % inputs] |= Atem.TALLY_PROGRAM
+        flags[(i + 1) % inputs] |= Atem.TALLY_PREVIEW
+        tally.append(datagrams.datagram([datagrams.cmdTlIn(flags),
+                                         datagrams.cmdTlSr([(n + 1, flags[n]) for n in range(inputs)])], bitmask=0))
+    inputChanges = [datagrams.datagram([datagrams.cmdPrgI(0, 1 + i % inputs), datagrams.cmdPrvI(0, 1 + (i + 1) % inputs)],
+                                       bitmask=0) for i in range(500)]
+    return dump, [('dump', dump, False), ('tally', tally, True), ('inputs', inputChanges, True)]
+
+
+# seconds to handle the packets twice on a new Atem
+def handleTwice(packets, dump, warm, metrics):
+    atem = createAtem(metrics)
+    if warm:
+        for packet in dump:
+            atem.handleDatagram(packet)
+    handle = atem.handleDatagram
+    start = time.perf_counter()
+    for packet in packets:
+        handle(packet)
+    for packet in packets:
+        handle(packet)
+    return time.perf_counter() - start
+
+
+# best of several rounds, in datagrams/sec with metrics off and on; the two take turns within
+# each round, so a busy machine slows both alike
+def measure(packets, dump, warm, rounds=200):
+    best = [None, None]
+    for i in range(rounds):
+        for metrics in (False, True):
+            elapsed = handleTwice(packets, dump, warm, metrics)
+            if best[metrics] is None or elapsed < best[metrics]:
+                best[metrics] = elapsed
+    return [2 * len(packets) / elapsed for elapsed in best]
+
+
+# sub-commands in the packets
+def subCommands(packets):
+    count = 0
+    for packet in packets:
+        offset = Atem.SIZE_OF_HEADER
+        while offset + Atem.SIZE_OF_SUBHEADER <= len(packet):
+            offset += (packet[offset] << 8) | packet[offset + 1]
+            count += 1
+    return count
+
+
+def main():
+    dump, scenarios = workloads()
+    print('scenario   metrics off/s   metrics on/s   overhead   per datagram   per sub-command   cpu at 1k/s')
+    for name, packets, warm in scenarios:
+        off, on = measure(packets, dump, warm)
+        cost = 1 / on - 1 / off
+        print('%-8s %15.0f %14.0f %9.1f%% %11.2f us %14.0f ns %12.3f%%' %
+              (name, off, on, (off / on - 1) * 100, cost * 1e6, cost * len(packets) / subCommands(packets) * 1e9,
+               cost * 1000 * 100))
+
+    atems = []
+    for i in range(8):
+        atem = createAtem(True)
+        atem.address = ('10.0.0.%d' % (i + 1), 9910)
+        for packet in dump:
+            atem.handleDatagram(packet)
+        atems.append(atem)
+    start = time.perf_counter()
+    for i in range(100):
+        text = prometheusText(atems)
+    elapsed = (time.perf_counter() - start) / 100
+    print('scrape of %d switchers: %.2f ms, %d bytes' % (len(atems), elapsed * 1000, len(text)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# memory footprint and update cost of the __slots__/array state model in
+# features.py compared to the nested dicts it replaced: bytes held after the
+# initial state dump of a 20 input, 4 M/E switcher with camera control on
+# every input, and sub-commands/sec for bursts that change program, preview,
+# camera control and audio state
+#
+#   python3 -m benchmarks.bench_model
+
+import struct
+import time
+import tracemalloc
+
+from atem import Atem
+from benchmarks import datagrams
+
+
+# the former dict based handlers of the commands changed by the bursts, kept for comparison
+class DictAtem(Atem):
+    def _initState(self):
+        Atem._initState(self)
+        self.dictState = {'program': {}, 'preview': {}, 'audio': {}}
+        self.dictSystemConfig = {'audio': {}}
+        self.dictCameraControl = {}
+
+    def recvPrgI(self, data):
+        meIndex = data[0]
+        if self._update(self.dictState['program'], meIndex, struct.unpack('!H', data[2:4])[0], ('program', meIndex)):
+            if self.pgmInputHandler is not None:
+                self.pgmInputHandler(self)
+
+    def recvPrvI(self, data):
+        meIndex = data[0]
+        if self._update(self.dictState['preview'], meIndex, struct.unpack('!H', data[2:4])[0], ('preview', meIndex)):
+            if self.prvInputHandler is not None:
+                self.prvInputHandler(self)
+
+    def recvCCdP(self, data):
+        input_num = data[1]
+        domain = data[2]
+        feature = data[3]
+        val = None
+        val_translated = None
+        if domain == 0:  # lens
+            if feature in (0, 3, 9):  # focus, iris, zoom
+                val = val_translated = struct.unpack('!h', data[16:18])[0]
+        elif domain == 1:  # camera
+            if feature == 1:  # gain
+                val = struct.unpack('!h', data[16:18])[0]
+                val_translated = self.VALUES_CC_GAIN.get(val, 'unknown')
+            elif feature == 2:  # white balance
+                val = struct.unpack('!h', data[16:18])[0]
+                val_translated = self.VALUES_CC_WB.get(val, str(val) + 'K')
+            elif feature == 5:  # shutter
+                val = struct.unpack('!h', data[18:20])[0]
+                val_translated = self.VALUES_CC_SHUTTER.get(val, 'off')
+        elif domain == 8:  # chip
+            val_keys_color = ['R', 'G', 'B', 'Y']
+            if feature == 0:  # lift
+                val = dict(zip(val_keys_color, struct.unpack('!hhhh', data[16:24])))
+                val_translated = {k: float(v) / 4096 for k, v in val.items()}
+            elif feature == 1:  # gamma
+                val = dict(zip(val_keys_color, struct.unpack('!hhhh', data[16:24])))
+                val_translated = {k: float(v) / 8192 for k, v in val.items()}
+            elif feature == 2:  # gain
+                val = dict(zip(val_keys_color, struct.unpack('!hhhh', data[16:24])))
+                val_translated = {k: float(v) * 16 / 32767 for k, v in val.items()}
+            elif feature == 4:  # contrast
+                val = struct.unpack('!h', data[18:20])[0]
+                val_translated = float(val) / 4096
+            elif feature == 5:  # luminance
+                val = struct.unpack('!h', data[16:18])[0]
+                val_translated = float(val) / 2048
+            elif feature == 6:  # hue-saturation
+                val = dict(zip(['hue', 'saturation'], struct.unpack('!hh', data[16:20])))
+                val_translated = {'hue': float(val['hue']) * 360 / 2048 + 180,
+                                  'saturation': float(val['saturation']) / 4096}
+        try:
+            entry = self.CC_FEATURES[(domain, feature)]
+            domain_label, feature_label = entry.domainLabel, entry.featureLabel
+            camera = self.dictCameraControl.setdefault(input_num, {})
+            self._update(camera.setdefault('state_raw', {}).setdefault(domain_label, {}), feature_label, val,
+                         ('cameracontrol', input_num, 'state_raw', domain_label, feature_label))
+            self._update(camera.setdefault('state', {}).setdefault(domain_label, {}), feature_label, val_translated,
+                         ('cameracontrol', input_num, 'state', domain_label, feature_label))
+        except KeyError:
+            pass
+
+    def recvAMIP(self, data):
+        channel = struct.unpack('!H', data[0:2])[0]
+        channel_config = self.dictSystemConfig['audio'].setdefault(channel, {})
+        path = ('system_config', 'audio', channel)
+        self._update(channel_config, 'fromMediaPlayer', bool(data[6]), path + ('fromMediaPlayer',))
+        self._update(channel_config, 'plug', data[7], path + ('plug',))
+
+        channel_state = self.dictState['audio'].setdefault(channel, {})
+        path = ('audio', channel)
+        self._update(channel_state, 'mix_option', data[8], path + ('mix_option',))
+        self._update(channel_state, 'volume', struct.unpack('!H', data[10:12])[0], path + ('volume',))
+        self._update(channel_state, 'balance', struct.unpack('!h', data[12:14])[0], path + ('balance',))
+
+
+def createAtem(cls=Atem):
+    atem = cls('127.0.0.1', localPort=0)
+    atem.socket.close()
+    atem.tallyHandler = atem.pgmInputHandler = atem.prvInputHandler = lambda a: None
+    return atem
+
+
+# a burst that changes program/preview of every M/E, lens, lift and audio of every input
+def changeBurst(step, inputs=20, mes=4):
+    commands = []
+    for me in range(mes):
+        commands.append(datagrams.cmdPrgI(me, 1 + (step + me) % inputs))
+        commands.append(datagrams.cmdPrvI(me, 1 + (step + me + 1) % inputs))
+    for i in range(1, inputs + 1):
+        commands.append(datagrams.cmdCCdP(i, 0, 0, [step]))
+        commands.append(datagrams.cmdCCdP(i, 8, 0, [step, step, step, step]))
+        commands.append(datagrams.cmdAMIP(i, 32768 + step, 0))
+    return commands
+
+
+# bytes held by the state of a switcher after its initial dump: the model
+# itself, and the nested dicts the former handlers kept, i.e. the dict views
+def footprint(packets):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    atem = createAtem()
+    for packet in packets:
+        atem.parsePayload(packet)
+    model = tracemalloc.get_traced_memory()[0] - before
+
+    empty = createAtem()
+    before = tracemalloc.get_traced_memory()[0]
+    views = (atem.system_config, atem.status, atem.config, atem.state, atem.cameracontrol)
+    dicts = tracemalloc.get_traced_memory()[0] - before
+    before = tracemalloc.get_traced_memory()[0]
+    emptyViews = (empty.system_config, empty.status, empty.config, empty.state, empty.cameracontrol)
+    dicts -= tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del views, emptyViews
+
+    # the model size includes the Atem instance and its protocol state
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    empty = createAtem()
+    model -= tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return model, dicts
+
+
+# sub-commands/sec while every burst changes state
+def updateRate(cls, packets, commandCount, seconds=1.0):
+    atem = createAtem(cls)
+    for packet in datagrams.datagrams(datagrams.initialDump()):
+        atem.parsePayload(packet)
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for packet in packets:
+            atem.parsePayload(packet)
+        count += 1
+    return count * commandCount / (time.perf_counter() - start)
+
+
+def main():
+    dump = datagrams.datagrams(datagrams.initialDump())
+    model, dicts = footprint(dump)
+    print('state after initial dump: %8d bytes model   %8d bytes dicts   (%.1fx)' % (model, dicts, dicts / model))
+
+    bursts = [changeBurst(step) for step in range(2)]
+    packets = [packet for burst in bursts for packet in datagrams.datagrams(burst)]
+    commandCount = sum(len(burst) for burst in bursts)
+    rates = {}
+    for label, cls in (('dicts', DictAtem), ('model', Atem)):
+        rates[label] = updateRate(cls, packets, commandCount)
+        print('%-6s %10.0f changing sub-commands/s' % (label, rates[label]))
+    print('speedup %.2fx' % (rates['model'] / rates['dicts']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# tally lamps written in the tally callback, as atem.py used to, against Outputs
+# on its worker thread: a 25/s tally stream of the local switcher emulator drives
+# two MockOutputs taking 0 or 5 ms a write; measures how long the callback holds
+# up the receive loop, the time from the callback to the lamp, the writes done
+# and the datagrams the emulator had to send again
+#
+#   python3 -m benchmarks.bench_outputs
+
+import time
+
+from atem import Atem
+from emulator import AtemEmulator
+from outputs import MockOutput, Outputs
+
+INPUT = 1
+RATE = 25
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+# seconds from the callback that changed the red lamp until the lamp was written, for
+# every change that was written before the next one
+def latencies(stamps, writes):
+    result = []
+    last = None
+    index = 0
+    for i, (stamp, value) in enumerate(stamps):
+        if value == last:
+            continue
+        last = value
+        following = [s for s, v in stamps[i + 1:] if v != value]
+        until = following[0] if following else float('inf')
+        while index < len(writes) and writes[index][0] < stamp:
+            index += 1
+        for when, written in writes[index:]:
+            if when >= until:
+                break
+            if written == value:
+                result.append(when - stamp)
+                break
+    return result
+
+
+def run(inline, delay, debounce=0, seconds=3):
+    emulator = AtemEmulator(inputs=4, mes=1).start()
+    red = MockOutput(delay)
+    green = MockOutput(delay)
+    outputs = None
+    if not inline:
+        outputs = Outputs(debounce)
+        outputs.add('red', red)
+        outputs.add('green', green)
+        outputs.start()
+    atem = Atem('127.0.0.1', emulator.port, localPort=0, interests=['tally'])
+    stamps = []
+    held = []
+
+    def tallyWatch(atem):
+        start = time.monotonic()
+        program = atem.isProgram(INPUT)
+        preview = atem.isPreview(INPUT)
+        if outputs is None:
+            red.write(program)
+            green.write(preview)
+        else:
+            outputs.update({'red': program, 'green': preview})
+        stamps.append((start, program))
+        held.append(time.monotonic() - start)
+    atem.tallyHandler = tallyWatch
+    atem.connectToSwitcher()
+    while not atem.isInitialized:
+        atem.waitForPacket()
+    del stamps[:], held[:], red.writes[:]
+    retransmits = emulator.stats['retransmits']
+    stream = emulator.addStream('tally', RATE)
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        atem.waitForPacket()
+    emulator.removeStream(stream)
+    if outputs is not None:
+        time.sleep(debounce + delay * 2)
+        outputs.close()
+    atem.socket.close()
+    emulator.close()
+    seen = latencies(stamps, red.writes)
+    return (percentile(held, 0.5), percentile(held, 0.99), percentile(seen, 0.5), percentile(seen, 0.99),
+            len(red.writes) + len(green.writes), len(stamps), emulator.stats['retransmits'] - retransmits)
+
+
+def main():
+    print('tally stream at %d/s for 3 s, lamps of input %d' % (RATE, INPUT))
+    print('writes     delay  debounce   loop held p50    p99   to lamp p50    p99   writes/callbacks  retransmits')
+    for inline, delay, debounce in ((True, 0, 0), (False, 0, 0), (True, 0.005, 0), (False, 0.005, 0),
+                                    (False, 0.005, 0.1)):
+        result = run(inline, delay, debounce)
+        print('%-8s %5.0f ms %6.0f ms %10.1f us %6.1f us %8.2f ms %6.2f ms %9d/%-9d %7d' %
+              (('inline' if inline else 'Outputs', delay * 1000, debounce * 1000, result[0] * 1e6,
+                result[1] * 1e6, result[2] * 1000, result[3] * 1000) + result[4:]))
+
+
+if __name__ == '__main__':
+    main()
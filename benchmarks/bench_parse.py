@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# sub-commands/sec of Atem.parsePayload compared to the former
+# getattr based parser that re-sliced the datagram for every sub-command
+#
+#   python3 -m benchmarks.bench_parse
+
+import struct
+import time
+
+from atem import Atem
+from benchmarks import datagrams
+
+
+# the parser as it was before the dispatch table, kept for comparison
+def legacyParsePayload(atem, datagram):
+    datagram = bytes(datagram[atem.SIZE_OF_HEADER:])
+    while len(datagram) > 0:
+        size = struct.unpack('!H', datagram[0:2])[0]
+        packet = datagram[0:size]
+        datagram = datagram[size:]
+        packet = packet[4:]
+        ptype = packet[:4]
+        payload = packet[4:]
+        method = 'recv' + ptype.decode("utf-8")
+        if hasattr(atem, method):
+            func = getattr(atem, method)
+            if callable(func):
+                func(payload)
+
+
+def createAtem():
+    atem = Atem('127.0.0.1')
+    atem.socket.close()
+    atem.tallyHandler = atem.pgmInputHandler = atem.prvInputHandler = lambda a: None
+    return atem
+
+
+def measure(parse, atem, packets, commandCount, seconds):
+    rounds = 0
+    start = time.perf_counter()
+    while True:
+        for packet in packets:
+            parse(atem, packet)
+        rounds += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return rounds * commandCount / elapsed
+
+
+def main(seconds=2.0):
+    commands = datagrams.showBurst(inputs=20) * 20
+    scenarios = [
+        ('mtu sized datagrams', datagrams.datagrams(commands)),
+        ('single large datagram', [datagrams.datagram(commands)]),
+    ]
+    for label, packets in scenarios:
+        atem = createAtem()
+        before = measure(legacyParsePayload, atem, packets, len(commands), seconds)
+        after = measure(Atem.parsePayload, atem, packets, len(commands), seconds)
+        print('%-24s before %10.0f sub-commands/s   after %10.0f sub-commands/s   x%.2f' %
+              (label, before, after, after / before))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# load test of the proxy: the local switcher emulator, an AtemProxy and a
+# process with hundreds of Atem clients connected to the proxy, each in its own
+# process; measures how long the clients take to get ready, the time from a cut
+# on the switcher until every client saw the new program input, and the CPU the
+# proxy uses while relaying a 25/s tally stream to all of them
+#
+#   python3 -m benchmarks.bench_proxy
+
+import multiprocessing
+import time
+
+from emulator import AtemEmulator
+from manager import AtemManager
+from proxy import AtemProxy
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def runSwitcher(connection):
+    emulator = AtemEmulator(inputs=20, mes=4).start()
+    connection.send(emulator.port)
+    while True:
+        message = connection.recv()
+        if message == 'cut':
+            now = time.monotonic()
+            emulator.cut(0)
+            connection.send(now)
+        elif message == 'tally':
+            stream = emulator.addStream('tally', 25)
+            connection.send(None)
+        elif message == 'quiet':
+            emulator.removeStream(stream)
+            connection.send(emulator.stats['sessions'])
+        else:
+            emulator.close()
+            return
+
+
+def runProxy(connection, switcherPort):
+    proxy = AtemProxy('127.0.0.1', switcherPort, '127.0.0.1', 0).start()
+    connection.send(proxy.port)
+    while True:
+        message = connection.recv()
+        if message == 'cpu':
+            connection.send((time.process_time(), dict(proxy.stats)))
+        else:
+            proxy.close()
+            return
+
+
+def runClients(connection, port, count):
+    manager = AtemManager()
+    seen = []
+    start = time.monotonic()
+    for i in range(count):
+        atem = manager.addSwitcher('127.0.0.1', port, interests=['mixing', 'tally'])
+        atem.pgmInputHandler = lambda atem: seen.append(time.monotonic())
+    end = start + 30
+    while not all(atem.isInitialized and atem.stateComplete for atem in manager.sessions):
+        if time.monotonic() > end:
+            raise SystemExit('clients not ready after 30s')
+        manager.poll(0.01)
+    connection.send(time.monotonic() - start)
+    del seen[:]
+    while True:
+        if connection.poll():
+            message = connection.recv()
+            if message == 'seen':
+                connection.send(seen[:])
+                del seen[:]
+            else:
+                manager.close()
+                return
+        manager.poll(0.005)
+
+
+def main(counts=(50, 200, 500), cuts=10):
+    print('clients   all ready   cut seen p50   p99      all      proxy CPU at 25 tally/s   sessions upstream')
+    for count in counts:
+        switcher, switcherEnd = multiprocessing.Pipe()
+        multiprocessing.Process(target=runSwitcher, args=(switcherEnd,), daemon=True).start()
+        switcherPort = switcher.recv()
+        proxy, proxyEnd = multiprocessing.Pipe()
+        multiprocessing.Process(target=runProxy, args=(proxyEnd, switcherPort), daemon=True).start()
+        proxyPort = proxy.recv()
+        clients, clientsEnd = multiprocessing.Pipe()
+        multiprocessing.Process(target=runClients, args=(clientsEnd, proxyPort, count), daemon=True).start()
+        ready = clients.recv()
+
+        latencies = []
+        complete = []
+        for i in range(cuts):
+            start = switcher.send('cut') or switcher.recv()
+            time.sleep(0.3)
+            clients.send('seen')
+            seen = [when - start for when in clients.recv()]
+            latencies += seen
+            if len(seen) >= count:
+                complete.append(max(seen))
+
+        switcher.send('tally')
+        switcher.recv()
+        proxy.send('cpu')
+        cpu, stats = proxy.recv()
+        wall = time.monotonic()
+        time.sleep(3)
+        proxy.send('cpu')
+        cpuEnd, statsEnd = proxy.recv()
+        wall = time.monotonic() - wall
+        switcher.send('quiet')
+        sessions = switcher.recv()
+
+        print('%7d %9.2f s %10.1f ms %6.1f ms %6.1f ms %12.1f %% (%d datagrams/s) %10d' %
+              (count, ready, percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000,
+               max(complete) * 1000 if complete else float('nan'), (cpuEnd - cpu) / wall * 100,
+               (statsEnd['sent'] - stats['sent']) / wall, sessions))
+        for connection in (clients, proxy, switcher):
+            connection.send('stop')
+        time.sleep(0.5)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# time from the end of a network blip until the session is ready again, for the
+# connection state machine and the former reconnect handling, against the local
+# switcher emulator; callbacks counts those run while recovering, with the
+# switcher state unchanged there should be none
+#
+#   python3 -m benchmarks.bench_reconnect
+
+import random
+import time
+
+from atem import Atem
+from benchmarks import datagrams
+from emulator import AtemEmulator
+from manager import AtemManager
+
+
+# reconnect handling as it was before the state machine: HELLO only after
+# RECONNECT_TIMEOUT of silence, no keepalive ping and no HELLO retry
+class LegacyAtem(Atem):
+    def connectToSwitcher(self):
+        self.failCommands()
+        self._setState(self.STATE_DISCONNECTED)
+        self.currentUid = 0x1337
+        self.lastPacketTime = time.monotonic()
+        self.sendDatagram(self.createHelloPacket())
+
+    def nextDeadline(self):
+        deadline = self.lastPacketTime + self.RECONNECT_TIMEOUT
+        for sent in self._inflight.values():
+            deadline = min(deadline, sent[1] + self.RETRANSMIT_TIMEOUT)
+        return deadline
+
+    def checkTimeouts(self, now):
+        if self._inflight:
+            self.retransmit(now)
+        if now - self.lastPacketTime >= self.RECONNECT_TIMEOUT:
+            self.connectToSwitcher()
+
+
+def runUntil(manager, condition, timeout):
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        manager.poll(min(0.01, max(0, end - time.monotonic())))
+
+
+# returns seconds from the end of the blip until ready, the new sessions and the callbacks run meanwhile;
+# the blip starts at phase seconds after the session got ready, the timers of either client see it at
+# any point of their cycle that way
+def measure(cls, blip, dump, phase):
+    emulator = AtemEmulator(dump=dump).start()
+    manager = AtemManager()
+    atem = manager.addSwitcher('127.0.0.1', emulator.port, cls=cls)
+    callbacks = []
+    runUntil(manager, lambda: atem.isInitialized, 5)
+    atem.tallyHandler = atem.pgmInputHandler = atem.prvInputHandler = callbacks.append
+    atem.handleAtemChange(lambda a, method: callbacks.append(method))
+    runUntil(manager, lambda: False, phase)
+    hellos = emulator.stats['sessions']
+
+    emulator.loss = 1.0
+    runUntil(manager, lambda: False, blip)
+    emulator.loss = 0.0
+    blipEnd = time.monotonic()
+    runUntil(manager, lambda: atem.isInitialized and atem.lastPacketTime > blipEnd, 15)
+    elapsed = time.monotonic() - blipEnd
+
+    manager.close()
+    emulator.close()
+    return elapsed, emulator.stats['sessions'] - hellos, len(callbacks)
+
+
+def main(rounds=8):
+    dump = datagrams.initialDump(inputs=20, mes=4)
+    phases = random.Random(1)
+    print('blip     client      mean ready   max ready   new sessions   callbacks')
+    for blip in (0.5, 1.5, 3.0, 6.0):
+        for name, cls in (('legacy', LegacyAtem), ('state', Atem)):
+            results = [measure(cls, blip, dump, phases.uniform(0, 2)) for i in range(rounds)]
+            print('%4.1fs   %-8s %9.0f ms %8.0f ms %14.1f %11d' %
+                  (blip, name, sum(r[0] for r in results) / rounds * 1000, max(r[0] for r in results) * 1000,
+                   sum(r[1] for r in results) / rounds, sum(r[2] for r in results)))
+
+
+if __name__ == '__main__':
+    main()
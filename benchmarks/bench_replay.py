@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# decoding throughput when replaying a capture file, needs no network:
+# writes a capture of an initial dump followed by show bursts and replays
+# it as fast as possible
+#
+#   python3 -m benchmarks.bench_replay [capture file]
+
+import os
+import sys
+import tempfile
+import time
+
+from atem import Atem
+from capture import CaptureWriter, CaptureReader, DIRECTION_IN, replay
+from benchmarks import datagrams
+
+
+def writeCapture(path, bursts=2000):
+    writer = CaptureWriter(path)
+    timestamp = 0.0
+    dump = datagrams.datagrams(datagrams.initialDump())
+    for packet in dump:
+        writer.record(DIRECTION_IN, packet, timestamp)
+    # the bursts carry on numbering after the dump
+    packageId = len(dump) + 1
+    for i in range(bursts):
+        # a burst per frame at 50 fps
+        timestamp += 0.02
+        for packet in datagrams.datagrams(datagrams.showBurst(mes=4), firstPackageId=packageId):
+            writer.record(DIRECTION_IN, packet, timestamp)
+            packageId = (packageId + 1) & Atem.PACKAGE_ID_MASK
+    writer.close()
+
+
+def countCommands(path):
+    reader = CaptureReader(path)
+    commands = 0
+    for timestamp, direction, datagram in reader:
+        offset = Atem.SIZE_OF_HEADER
+        while offset + 2 <= len(datagram):
+            offset += (datagram[offset] << 8) | datagram[offset + 1]
+            commands += 1
+        datagram.release()
+    reader.close()
+    return commands
+
+
+def main():
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+        temporary = False
+    else:
+        handle, path = tempfile.mkstemp(suffix='.cap')
+        os.close(handle)
+        os.unlink(path)
+        writeCapture(path)
+        temporary = True
+    try:
+        commands = countCommands(path)
+        atem = Atem('127.0.0.1', localPort=0)
+        atem.socket.close()
+        atem.tallyHandler = atem.pgmInputHandler = atem.prvInputHandler = lambda a: None
+        start = time.perf_counter()
+        count = replay(atem, path)
+        elapsed = time.perf_counter() - start
+        print('%d datagrams, %d sub-commands, %d bytes' % (count, commands, os.path.getsize(path)))
+        print('replay %10.0f datagrams/s %10.0f sub-commands/s' % (count / elapsed, commands / elapsed))
+    finally:
+        if temporary:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# start to first tally callback without and with a snapshot from the last run,
+# against the local switcher emulator answering with some network delay, plus
+# the cost of writing and loading a snapshot
+#
+#   python3 -m benchmarks.bench_snapshot
+
+import os
+import tempfile
+import time
+
+from atem import Atem
+from emulator import AtemEmulator
+from snapshot import MAGIC, encodeSnapshot, loadSnapshot, writeAtomic
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+# returns seconds until the first tally callback and until the state was complete,
+# and the tally callbacks run by live data from the switcher
+def boot(emulator, path):
+    start = time.perf_counter()
+    atem = Atem('127.0.0.1', emulator.port, localPort=0)
+    tally = []
+    complete = []
+    atem.tallyHandler = lambda a: tally.append(time.perf_counter() - start)
+    atem.stateCompleteHandler = lambda a: complete.append(time.perf_counter() - start)
+    if path is not None:
+        atem.startSnapshot(path)
+    restored = len(tally)
+    atem.connectToSwitcher()
+    while not complete:
+        atem.waitForPacket()
+    atem.stopSnapshot()
+    atem.socket.close()
+    return tally[0], complete[0], len(tally) - restored
+
+
+def main(rounds=20):
+    emulator = AtemEmulator(inputs=40, mes=4, delay=0.002).start()
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'state.snap')
+    boot(emulator, path)
+
+    print('start   first tally p50   p99      state complete p50   live tally callbacks')
+    for name, snapshot in (('cold', None), ('warm', path)):
+        results = [boot(emulator, snapshot) for i in range(rounds)]
+        first = [r[0] for r in results]
+        print('%-5s %12.2f ms %8.2f ms %15.2f ms %17d' % (name, percentile(first, 0.5) * 1000,
+                                                          percentile(first, 0.99) * 1000,
+                                                          percentile([r[1] for r in results], 0.5) * 1000,
+                                                          sum(r[2] for r in results)))
+    emulator.close()
+
+    atem = Atem('127.0.0.1', localPort=0)
+    atem.socket.close()
+    loadSnapshot(atem, path)
+    start = time.perf_counter()
+    for i in range(100):
+        data = MAGIC + encodeSnapshot(atem)
+    encode = (time.perf_counter() - start) / 100
+    start = time.perf_counter()
+    for i in range(20):
+        writeAtomic(path, data)
+    write = (time.perf_counter() - start) / 20
+    fresh = []
+    for i in range(100):
+        fresh.append(Atem('127.0.0.1', localPort=0))
+        fresh[-1].socket.close()
+    start = time.perf_counter()
+    for atem in fresh:
+        loadSnapshot(atem, path)
+    load = (time.perf_counter() - start) / len(fresh)
+    print('snapshot %d bytes, encode %.3f ms, atomic write %.3f ms, load %.3f ms' %
+          (len(data), encode * 1000, write * 1000, load * 1000))
+    os.remove(path)
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
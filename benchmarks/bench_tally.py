@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# tally packet cost with the bytearray tally store: packets/sec and
+# tracemalloc measured memory per packet, for repeated and changing frames;
+# exits non-zero if repeated tally packets retain memory
+#
+#   python3 -m benchmarks.bench_tally
+
+import sys
+import time
+import tracemalloc
+
+from atem import Atem
+from benchmarks import datagrams
+
+
+def createAtem():
+    atem = Atem('127.0.0.1', localPort=0)
+    atem.socket.close()
+    atem.tallyHandler = lambda a: None
+    return atem
+
+
+def frame(program, preview, inputs=20):
+    flags = [0] * inputs
+    flags[program - 1] |= Atem.TALLY_PROGRAM
+    flags[preview - 1] |= Atem.TALLY_PREVIEW
+    return datagrams.datagram([datagrams.cmdTlIn(flags),
+                               datagrams.cmdTlSr([(i + 1, flags[i]) for i in range(inputs)])])
+
+
+# returns packets/sec, bytes retained per packet and peak bytes above the start
+def measure(atem, packets, count):
+    for packet in packets:
+        atem.parsePayload(packet)
+
+    start = time.perf_counter()
+    for i in range(count):
+        atem.parsePayload(packets[i % len(packets)])
+    rate = count / (time.perf_counter() - start)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(count):
+        atem.parsePayload(packets[i % len(packets)])
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rate, (current - before) / count, peak - before
+
+
+def main(count=20000):
+    scenarios = [
+        ('repeated frame', [frame(1, 2)]),
+        ('cut every frame', [frame(1, 2), frame(2, 1)]),
+    ]
+    ok = True
+    for label, packets in scenarios:
+        rate, retained, peak = measure(createAtem(), packets, count)
+        print('%-16s %10.0f packets/s   %6.2f bytes retained/packet   peak %6d bytes' %
+              (label, rate, retained, peak))
+        # allow for tracemalloc's own bookkeeping, but nothing that grows with the packet count
+        if label == 'repeated frame' and retained * count > 1024:
+            ok = False
+    if not ok:
+        print('FAIL: repeated tally packets retain memory')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
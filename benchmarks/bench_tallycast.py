@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# tally multicast: frame sizes, the CPU a tally light spends per change with a
+# TallySubscriber against a full Atem session parsing TlIn and TlSr, what the
+# publisher pays per change, and boot to first tally of a light joining a
+# publisher fed by the local switcher emulator against an Atem connecting to it
+#
+#   python3 -m benchmarks.bench_tallycast
+
+import multiprocessing
+import random
+import time
+
+from atem import Atem
+from benchmarks import datagrams
+from emulator import AtemEmulator
+from tallycast import FRAME, TallyPublisher, TallySubscriber
+
+PORT = 19911
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def flags(program, preview, inputs):
+    result = [0] * inputs
+    result[program - 1] |= Atem.TALLY_PROGRAM
+    result[preview - 1] |= Atem.TALLY_PREVIEW
+    return result
+
+
+def packet(program, preview, inputs):
+    tally = flags(program, preview, inputs)
+    return datagrams.datagram([datagrams.cmdTlIn(tally),
+                               datagrams.cmdTlSr([(i + 1, tally[i]) for i in range(inputs)])])
+
+
+def createAtem():
+    atem = Atem('127.0.0.1', localPort=0)
+    atem.socket.close()
+    atem.tallyHandler = lambda a: None
+    return atem
+
+
+def timePerCall(function, items, rounds=2000):
+    start = time.perf_counter()
+    for i in range(rounds):
+        function(items[i % len(items)])
+    return (time.perf_counter() - start) / rounds
+
+
+# an Atem with its tally published to 127.0.0.1 until told to stop
+def runPublisher(connection, interval):
+    emulator = AtemEmulator(inputs=20, mes=1).start()
+    atem = Atem('127.0.0.1', emulator.port, localPort=0, interests=['tally'])
+    atem.startTallycast('127.0.0.1', PORT, interval)
+    atem.connectToSwitcher()
+    while not atem.isInitialized:
+        atem.waitForPacket()
+    connection.send(None)
+    while not connection.poll():
+        atem.waitForPacket()
+    connection.recv()
+    atem.stopTallycast()
+    atem.socket.close()
+    emulator.close()
+
+
+# seconds from creating the subscriber until its first tally, started at a random
+# point of the refresh interval
+def bootSubscriber(interval):
+    time.sleep(random.random() * interval)
+    start = time.perf_counter()
+    subscriber = TallySubscriber('127.0.0.1', PORT)
+    while not subscriber.frames:
+        subscriber.waitForFrame(interval * 2)
+    result = time.perf_counter() - start
+    subscriber.close()
+    return result
+
+
+def bootAtem(emulator):
+    start = time.perf_counter()
+    atem = Atem('127.0.0.1', emulator.port, localPort=0, interests=['tally'])
+    tally = []
+    atem.tallyHandler = lambda a: tally.append(time.perf_counter() - start)
+    atem.connectToSwitcher()
+    while not tally:
+        atem.waitForPacket()
+    atem.socket.close()
+    return tally[0]
+
+
+def main(rounds=10):
+    print('inputs   TlIn+TlSr datagram   tally frame')
+    for inputs in (20, 40):
+        atem = createAtem()
+        atem.parsePayload(packet(1, 2, inputs))
+        publisher = TallyPublisher('127.0.0.1', PORT)
+        publisher.publish(atem)
+        print('%6d %15d bytes %8d bytes' % (inputs, len(packet(1, 2, inputs)), len(publisher.frame)))
+        publisher.close()
+
+    # a cut every call, Atem decoding the switcher's datagram, the publisher building and sending
+    # the frame and the subscriber decoding it
+    inputs = 20
+    packets = [packet(i, i % inputs + 1, inputs) for i in range(1, inputs + 1)]
+    atem = createAtem()
+    perPacket = timePerCall(atem.parsePayload, packets)
+    publisher = TallyPublisher('127.0.0.1', PORT)
+    frames = []
+    for item in packets:
+        atem.parsePayload(item)
+        publisher.publish(atem)
+        frames.append(publisher.frame)
+    # every call publishes a change
+    state = [0]
+
+    def publish(item):
+        atem.tally.byIndex[0] = state[0] = state[0] ^ 1
+        publisher.publish(atem)
+    perPublish = timePerCall(publish, packets)
+    publisher.close()
+    subscriber = TallySubscriber('127.0.0.1', PORT + 1)
+    subscriber.tallyHandler = lambda s: None
+
+    def decode(frame):
+        subscriber.epoch = None
+        subscriber.handleFrame(frame)
+    perFrame = timePerCall(decode, frames)
+    print('per tally change, %d inputs: Atem.parsePayload %.1f us, publish %.1f us for any number of lights, '
+          'TallySubscriber.handleFrame %.1f us' % (inputs, perPacket * 1e6, perPublish * 1e6, perFrame * 1e6))
+
+    # decoded the same
+    atem = createAtem()
+    for item, frame in zip(packets, frames):
+        atem.parsePayload(item)
+        decode(frame)
+        assert all(subscriber.isProgram(i) == atem.isProgram(i) and subscriber.isPreview(i) == atem.isPreview(i)
+                   for i in range(1, inputs + 1))
+        assert all(subscriber.getSourceTally(i) == atem.getSourceTally(i) for i in range(1, inputs + 1))
+    assert FRAME.size + inputs + 3 * inputs == len(frames[0])
+    subscriber.close()
+
+    print('boot to first tally   p50        p99')
+    emulator = AtemEmulator(inputs=inputs, mes=1, delay=0.002).start()
+    results = [bootAtem(emulator) for i in range(rounds)]
+    print('Atem session %10.2f ms %8.2f ms   (emulator with 2 ms delay)' %
+          (percentile(results, 0.5) * 1000, percentile(results, 0.99) * 1000))
+    emulator.close()
+    for interval in (0.2, 1.0):
+        connection, end = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=runPublisher, args=(end, interval), daemon=True)
+        process.start()
+        connection.recv()
+        results = [bootSubscriber(interval) for i in range(rounds)]
+        connection.send('stop')
+        process.join()
+        print('light, %.1fs refresh %7.2f ms %8.2f ms' %
+              (interval, percentile(results, 0.5) * 1000, percentile(results, 0.99) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# transition tracking: the cost and tracemalloc measured memory of TrPs, which
+# the switcher sends every frame of a transition, and the time from an auto
+# transition on the local switcher emulator until the incoming input shows on
+# program, with the switcher's tally and with predictiveTally
+#
+#   python3 -m benchmarks.bench_transitions
+
+import time
+import tracemalloc
+
+from atem import Atem
+from benchmarks import datagrams
+from emulator import AtemEmulator, cmdTrPs
+from manager import AtemManager
+
+
+def createAtem():
+    atem = Atem('127.0.0.1', localPort=0)
+    atem.socket.close()
+    atem.parsePayload(datagrams.datagram(datagrams.initialDump(inputs=20, mes=1)[:-1]))
+    return atem
+
+
+def frames(count=25):
+    return [datagrams.datagram([cmdTrPs(0, True, count - i, i * 10000 // count)]) for i in range(count)]
+
+
+# returns seconds per datagram, bytes retained per datagram and peak bytes above the start
+def measure(atem, packets, count=50000):
+    for packet in packets:
+        atem.parsePayload(packet)
+    start = time.perf_counter()
+    for i in range(count):
+        atem.parsePayload(packets[i % len(packets)])
+    perPacket = (time.perf_counter() - start) / count
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(count):
+        atem.parsePayload(packets[i % len(packets)])
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return perPacket, (current - before) / count, peak - before
+
+
+# a transition taken back before its middle leaves the tally as it was
+def checkTakenBack():
+    atem = createAtem()
+    atem.predictiveTally = True
+    before = bytes(atem.tally.byIndex)
+    incoming = atem.mixing.preview[0]
+    atem.parsePayload(datagrams.datagram([cmdTrPs(0, True, 25, 0)]))
+    assert atem.isProgram(incoming)
+    atem.parsePayload(datagrams.datagram([cmdTrPs(0, True, 20, 3000)]))
+    atem.parsePayload(datagrams.datagram([cmdTrPs(0, False, 25, 0)]))
+    assert bytes(atem.tally.byIndex) == before and not atem.tally.predicted
+
+
+def main(rounds=5):
+    packets = frames()
+    atem = createAtem()
+    atem.metrics = None
+    print('TrPs         per datagram   retained per datagram   peak')
+    for name, subscribe in (('plain', False), ('subscribed', True)):
+        if subscribe:
+            atem.handleStateChange(lambda atem, path, old, new: None, ('transitions',))
+        perPacket, retained, peak = measure(atem, packets)
+        print('%-10s %10.2f us %16.3f B %12d B' % (name, perPacket * 1e6, retained, peak))
+    atem.predictiveTally = True
+    checkTakenBack()
+
+    emulator = AtemEmulator(inputs=20, mes=1).start()
+    manager = AtemManager()
+    clients = []
+    for predictive in (False, True):
+        client = manager.addSwitcher('127.0.0.1', emulator.port, interests=['tally', 'mixing'])
+        client.predictiveTally = predictive
+        clients.append(client)
+    while not all(client.stateComplete for client in clients):
+        manager.poll(0.01)
+    latencies = ([], [])
+    for i in range(rounds):
+        incoming = emulator.preview[0]
+        start = time.monotonic()
+        emulator.autoTransition(0)
+        seen = [None, None]
+        while None in seen and time.monotonic() - start < 3:
+            manager.poll(0.002)
+            for n, client in enumerate(clients):
+                if seen[n] is None and client.isProgram(incoming):
+                    seen[n] = time.monotonic() - start
+        for n in range(2):
+            latencies[n].append(seen[n])
+        # until the switcher's tally settled
+        end = time.monotonic() + 0.2
+        while time.monotonic() < end:
+            manager.poll(0.01)
+    print('auto transition of %d frames, incoming input on program after' % emulator.MIX_RATE)
+    for n, name in enumerate(('switcher tally', 'predictiveTally')):
+        values = latencies[n]
+        print('%-16s %8.1f ms mean %8.1f ms max' % (name, sum(values) / len(values) * 1000, max(values) * 1000))
+    manager.close()
+    emulator.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# builders for synthetic switcher datagrams used by the benchmarks,
+# the sub-command builders live in emulator.py
+
+from emulator import (MAX_PAYLOAD, subCommand, datagram, datagrams, batches, cmd_ver, cmd_pin, cmd_top, cmd_MeC,
+                      cmd_mpl, cmdVidM, cmdInPr, cmdPrgI, cmdPrvI, cmdAuxS, cmdKeOn, cmdDskB, cmdDskS, cmdTlIn,
+                      cmdTlSr, cmdCCdo, cmdCCdP, cmdMPfe, cmdAMIP, cmdAMMO, tallyFlags, tallyCommands, initialDump)
+
+
+# a mixed burst of the sub-commands a busy show produces
+def showBurst(inputs=20, mes=1):
+    commands = [cmdTlIn([(i % 3) for i in range(inputs)]),
+                cmdTlSr([(i, i % 3) for i in range(1, inputs + 1)])]
+    for me in range(mes):
+        commands.append(cmdPrgI(me, 1 + me))
+        commands.append(cmdPrvI(me, 2 + me))
+    for i in range(1, inputs + 1):
+        commands.append(cmdCCdP(i, 0, 0, [i * 10]))
+        commands.append(cmdCCdP(i, 8, 0, [i, i, i, i]))
+    return commands
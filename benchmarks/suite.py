@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# benchmark scenarios run by python3 -m benchmarks, each reports
+# sub-commands/sec, memory allocated per packet and the latency from
+# handing a packet to the parser until the first callback runs
+
+import gc
+import sys
+import time
+import tracemalloc
+
+from atem import Atem
+from benchmarks import datagrams
+from emulator import AtemEmulator
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else None
+
+
+def createAtem():
+    atem = Atem('127.0.0.1', localPort=0)
+    atem.socket.close()
+    atem.tallyHandler = atem.pgmInputHandler = atem.prvInputHandler = lambda a: None
+    return atem
+
+
+def countCommands(packets):
+    commands = 0
+    for packet in packets:
+        offset = Atem.SIZE_OF_HEADER
+        while offset + 2 <= len(packet):
+            offset += (packet[offset] << 8) | packet[offset + 1]
+            commands += 1
+    return commands
+
+
+# parses rounds of packets, each round on the Atem returned by prepare(), and measures
+#   - sub-commands/sec over all rounds
+#   - bytes allocated above the baseline while parsing a packet, and memory blocks
+#     still held per packet afterwards, both as traced by tracemalloc
+#   - latency from parsePayload until the first command callback of the packet
+def measureParse(name, prepare, packets, seconds):
+    commandCount = countCommands(packets)
+
+    atem = prepare()
+    elapsed = 0.0
+    rounds = 0
+    while elapsed < seconds:
+        start = time.perf_counter()
+        for packet in packets:
+            atem.parsePayload(packet)
+        elapsed += time.perf_counter() - start
+        rounds += 1
+        atem = prepare()
+
+    # latency, with a subscriber for all commands
+    latencies = []
+    for i in range(max(1, 2000 // len(packets))):
+        atem = prepare()
+        first = []
+        atem.handleAtemChange(lambda a, method: first or first.append(time.perf_counter()))
+        for packet in packets:
+            del first[:]
+            start = time.perf_counter()
+            atem.parsePayload(packet)
+            if first:
+                latencies.append(first[0] - start)
+
+    # allocations, per packet on an Atem already holding the state of a round
+    atem = prepare()
+    gc.collect()
+    tracemalloc.start()
+    allocated = 0
+    before = tracemalloc.get_traced_memory()[0]
+    blocks = sys.getallocatedblocks()
+    for packet in packets:
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        atem.parsePayload(packet)
+        allocated += tracemalloc.get_traced_memory()[1] - current
+    blocks = sys.getallocatedblocks() - blocks
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    return {
+        'scenario': name,
+        'packets': len(packets),
+        'subcommands': commandCount,
+        'subcommands_per_sec': rounds * commandCount / elapsed,
+        'packets_per_sec': rounds * len(packets) / elapsed,
+        'allocated_bytes_per_packet': allocated / len(packets),
+        'retained_bytes_per_packet': retained / len(packets),
+        'retained_blocks_per_packet': blocks / len(packets),
+        'latency_p50_us': percentile(latencies, 0.5) * 1e6,
+        'latency_p99_us': percentile(latencies, 0.99) * 1e6,
+    }
+
+
+# the initial state dump of a 4 M/E switcher, parsed into a fresh Atem each round
+def scenarioDump(seconds):
+    packets = datagrams.datagrams(datagrams.initialDump(inputs=40, mes=4, stills=100))
+    return measureParse('dump', createAtem, packets, seconds)
+
+
+# tally frames that all differ from the frame before, on an Atem that saw the dump
+def scenarioTally(seconds, inputs=40, frames=100):
+    dump = datagrams.datagrams(datagrams.initialDump(inputs=inputs, mes=4))
+
+    def prepare():
+        atem = createAtem()
+        for packet in dump:
+            atem.parsePayload(packet)
+        return atem
+
+    packets = []
+    for i in range(frames):
+        flags = [0] * inputs
+        flags[i % inputs] |= Atem.TALLY_PROGRAM
+        flags[(i + 1) % inputs] |= Atem.TALLY_PREVIEW
+        packets.append(datagrams.datagram([datagrams.cmdTlIn(flags),
+                                           datagrams.cmdTlSr([(n + 1, flags[n]) for n in range(inputs)])],
+                                          packageId=i + 1))
+    return measureParse('tally', prepare, packets, seconds)
+
+
+# program and preview changes on every M/E, one cut per packet
+def scenarioInputs(seconds, inputs=40, mes=4, cuts=100):
+    dump = datagrams.datagrams(datagrams.initialDump(inputs=inputs, mes=mes))
+
+    def prepare():
+        atem = createAtem()
+        for packet in dump:
+            atem.parsePayload(packet)
+        return atem
+
+    packets = []
+    for i in range(cuts):
+        commands = []
+        for me in range(mes):
+            commands.append(datagrams.cmdPrgI(me, 1 + (i + me + 1) % inputs))
+            commands.append(datagrams.cmdPrvI(me, 1 + (i + me + 2) % inputs))
+        packets.append(datagrams.datagram(commands, packageId=i + 1))
+    return measureParse('inputs', prepare, packets, seconds)
+
+
+# header encode and decode, a "sub-command" is one header created and parsed
+def scenarioHeader(seconds):
+    atem = createAtem()
+    count = 0
+    elapsed = 0.0
+    latencies = []
+    while elapsed < seconds:
+        start = time.perf_counter()
+        for i in range(1000):
+            atem.parseCommandHeader(atem.createCommandHeader(Atem.CMD_ACKREQUEST, 8, 0x8001, 0))
+        elapsed += time.perf_counter() - start
+        count += 1000
+    for i in range(2000):
+        start = time.perf_counter()
+        atem.parseCommandHeader(atem.createCommandHeader(Atem.CMD_ACKREQUEST, 8, 0x8001, 0))
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    atem.parseCommandHeader(atem.createCommandHeader(Atem.CMD_ACKREQUEST, 8, 0x8001, 0))
+    allocated = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return {
+        'scenario': 'header',
+        'packets': 1,
+        'subcommands': 1,
+        'subcommands_per_sec': count / elapsed,
+        'packets_per_sec': count / elapsed,
+        'allocated_bytes_per_packet': allocated,
+        'retained_bytes_per_packet': None,
+        'retained_blocks_per_packet': None,
+        'latency_p50_us': percentile(latencies, 0.5) * 1e6,
+        'latency_p99_us': percentile(latencies, 0.99) * 1e6,
+    }
+
+
+# HELLO until the initial dump of a 4 M/E switcher is handled, against the local
+# switcher emulator; latency is the time to isInitialized
+def scenarioHandshake(seconds):
+    dump = datagrams.initialDump(inputs=20, mes=4)
+    emulator = AtemEmulator(dump=dump).start()
+    commandCount = len(dump)
+    latencies = []
+    elapsed = 0.0
+    try:
+        while elapsed < seconds or len(latencies) < 5:
+            atem = Atem('127.0.0.1', emulator.port, localPort=0)
+            start = time.perf_counter()
+            atem.connectToSwitcher()
+            while not atem.isInitialized:
+                atem.waitForPacket()
+            latency = time.perf_counter() - start
+            latencies.append(latency)
+            elapsed += latency
+            atem.selector.close()
+            atem.socket.close()
+    finally:
+        emulator.close()
+    return {
+        'scenario': 'handshake',
+        'packets': len(datagrams.datagrams(dump)),
+        'subcommands': commandCount,
+        'subcommands_per_sec': len(latencies) * commandCount / elapsed,
+        'packets_per_sec': None,
+        'allocated_bytes_per_packet': None,
+        'retained_bytes_per_packet': None,
+        'retained_blocks_per_packet': None,
+        'latency_p50_us': percentile(latencies, 0.5) * 1e6,
+        'latency_p99_us': percentile(latencies, 0.99) * 1e6,
+    }
+
+
+SCENARIOS = {
+    'dump': scenarioDump,
+    'tally': scenarioTally,
+    'inputs': scenarioInputs,
+    'header': scenarioHeader,
+    'handshake': scenarioHandshake,
+}
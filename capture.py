@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# records the datagrams exchanged with a switcher into a capture file and
+# replays captures into Atem.parsePayload, for offline profiling and tests
+#
+#   atem.startCapture('show.cap')
+#   ...
+#   atem.stopCapture()
+#
+#   python3 capture.py record 192.168.2.8 show.cap
+#   python3 capture.py replay show.cap [--realtime] [--speed 2]
+#
+# a capture file is MAGIC followed by records of a RECORD header
+# (monotonic timestamp, direction, length) and the datagram itself
+
+import mmap
+import struct
+import time
+
+MAGIC = b'ATEMCAP1'
+# timestamp in seconds, direction, datagram length
+RECORD = struct.Struct('!dBH')
+
+DIRECTION_IN = 0
+DIRECTION_OUT = 1
+
+
+# appends datagrams to a capture file, writes are buffered until flush or close
+class CaptureWriter:
+    def __init__(self, path, bufferSize=1 << 16):
+        self.file = open(path, 'ab', buffering=bufferSize)
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.count = 0
+
+    def record(self, direction, datagram, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+        self.file.write(RECORD.pack(timestamp, direction, len(datagram)))
+        self.file.write(datagram)
+        self.count += 1
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+# reads a capture file through mmap, records are (timestamp, direction, datagram)
+# with datagram a memoryview into the mapping, valid until close
+class CaptureReader:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError('%s is not a capture file' % path)
+        self.view = memoryview(self.map)
+
+    def __iter__(self):
+        view = self.view
+        unpackRecord = RECORD.unpack_from
+        offset = len(MAGIC)
+        end = len(view) - RECORD.size
+        while offset <= end:
+            timestamp, direction, length = unpackRecord(view, offset)
+            offset += RECORD.size
+            if offset + length > len(view):
+                # cut short, e.g. while still being written
+                break
+            yield timestamp, direction, view[offset:offset + length]
+            offset += length
+
+    def close(self):
+        if getattr(self, 'view', None) is not None:
+            self.view.release()
+            self.view = None
+        self.map.close()
+        self.file.close()
+
+
+# feeds the received datagrams of a capture to atem.parsePayload, as fast as
+# possible or, with realtime, spaced as recorded and sped up by speed;
+# returns the number of datagrams replayed
+def replay(atem, path, realtime=False, speed=1.0):
+    reader = CaptureReader(path)
+    count = 0
+    try:
+        start = None
+        for timestamp, direction, datagram in reader:
+            try:
+                if direction != DIRECTION_IN:
+                    continue
+                if realtime:
+                    now = time.monotonic()
+                    if start is None:
+                        start = (timestamp, now)
+                    delay = (timestamp - start[0]) / speed - (now - start[1])
+                    if delay > 0:
+                        time.sleep(delay)
+                if len(datagram) > atem.SIZE_OF_HEADER + 2:
+                    atem.parsePayload(datagram)
+                count += 1
+            finally:
+                # the mapping can only be closed once no view into it is left, else
+                # reader.close raises BufferError in place of what parsePayload raised
+                datagram.release()
+    finally:
+        reader.close()
+    return count
+
+
+if __name__ == '__main__':
+    import argparse
+    from atem import Atem
+
+    parser = argparse.ArgumentParser(description='record or replay ATEM datagrams')
+    commands = parser.add_subparsers(dest='command', required=True)
+    record = commands.add_parser('record', help='record the datagrams exchanged with a switcher')
+    record.add_argument('address')
+    record.add_argument('path')
+    play = commands.add_parser('replay', help='decode a capture and report the throughput')
+    play.add_argument('path')
+    play.add_argument('--realtime', action='store_true')
+    play.add_argument('--speed', type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        atem = Atem(args.address, localPort=0)
+        atem.startCapture(args.path)
+        atem.connectToSwitcher()
+        try:
+            while True:
+                atem.waitForPacket()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            atem.stopCapture()
+    else:
+        atem = Atem('127.0.0.1', localPort=0)
+        atem.socket.close()
+        start = time.perf_counter()
+        count = replay(atem, args.path, args.realtime, args.speed)
+        elapsed = time.perf_counter() - start
+        print('%d datagrams in %.3fs, %.0f datagrams/s' % (count, elapsed, count / elapsed if elapsed else 0))
@@ -0,0 +1,893 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# local stand-in for an ATEM switcher: answers the handshake of Atem.connectToSwitcher,
+# sends an initial state dump, honours ACKREQUEST/ACK/RESEND and generates change
+# streams for any number of client sessions, with injectable packet loss and delay
+#
+#   emulator = AtemEmulator(port=9910, inputs=20, mes=4, loss=0.01, delay=0.005)
+#   emulator.addStream('tally', rate=25)
+#   emulator.start()
+#   ...
+#   emulator.close()
+#
+#   python3 emulator.py --port 9910 --tally 25 --cameracontrol 100 --loss 0.01
+
+import heapq
+import random
+import selectors
+import socket
+import struct
+import threading
+import time
+
+from atem import Atem
+from mediatransfer import LOCK, LKOB, LKST, FTSD, FTSU, FTCD, FTDA, FTFD, FTDC, FTUA, FTDE, STORE_STILLS, \
+    ERROR_NOT_FOUND, ERROR_NOT_LOCKED
+
+# longest payload we put into one datagram, keeps us below a 1500 byte MTU
+MAX_PAYLOAD = 1400
+
+
+# sub-command builders
+# --------------------
+
+# wraps a payload into a sub-command with its 8 byte sub-header
+def subCommand(tag, payload):
+    return struct.pack('!H2x4s', len(payload) + Atem.SIZE_OF_SUBHEADER, tag) + payload
+
+
+# builds a switcher to client datagram carrying the given sub-commands
+def datagram(commands, uid=0x8001, packageId=1, bitmask=Atem.CMD_ACKREQUEST):
+    payload = b''.join(commands)
+    word = (bitmask << 11) | (len(payload) + Atem.SIZE_OF_HEADER)
+    return struct.pack('!HHHIH', word, uid, 0, 0, packageId) + payload
+
+
+# packs sub-commands into as few datagrams as possible
+def datagrams(commands, maxPayload=MAX_PAYLOAD, uid=0x8001, firstPackageId=1):
+    return [datagram(batch, uid, firstPackageId + i) for i, batch in enumerate(batches(commands, maxPayload))]
+
+
+# packs sub-commands into as few payloads as possible, each a list of sub-commands
+def batches(commands, maxPayload=MAX_PAYLOAD):
+    result = []
+    batch = []
+    size = 0
+    for command in commands:
+        if batch and size + len(command) > maxPayload:
+            result.append(batch)
+            batch = []
+            size = 0
+        batch.append(command)
+        size += len(command)
+    if batch:
+        result.append(batch)
+    return result
+
+
+def cmd_ver(major, minor):
+    return subCommand(b'_ver', struct.pack('!HH', major, minor))
+
+
+def cmd_pin(name):
+    return subCommand(b'_pin', struct.pack('!44s', name.encode('utf-8')))
+
+
+def cmd_top(mes, sources, auxBusses=6, dsks=2):
+    return subCommand(b'_top', bytes([mes, sources, 2, auxBusses, dsks, 1, 1, 1, 0, 1, 0, 0]))
+
+
+def cmd_MeC(me, keyers):
+    return subCommand(b'_MeC', bytes([me, keyers, 0, 0]))
+
+
+def cmd_mpl(stills, clips):
+    return subCommand(b'_mpl', bytes([stills, clips, 0, 0]))
+
+
+def cmdVidM(mode):
+    return subCommand(b'VidM', bytes([mode, 0, 0, 0]))
+
+
+def cmdInPr(index, nameLong, nameShort):
+    payload = struct.pack('!H20s4s', index, nameLong.encode('utf-8'), nameShort.encode('utf-8'))
+    payload += bytes([0, 0x1f, 0, 0, 0, 0, 0x1f, 0x03, 0, 0])
+    return subCommand(b'InPr', payload)
+
+
+def cmdPrgI(me, source):
+    return subCommand(b'PrgI', struct.pack('!BxH', me, source))
+
+
+def cmdPrvI(me, source):
+    return subCommand(b'PrvI', struct.pack('!BxH', me, source))
+
+
+def cmdAuxS(aux, source):
+    return subCommand(b'AuxS', struct.pack('!BxH', aux, source))
+
+
+def cmdKeOn(me, keyer, onAir):
+    return subCommand(b'KeOn', bytes([me, keyer, int(onAir), 0]))
+
+
+def cmdDskB(keyer, fill, key):
+    return subCommand(b'DskB', struct.pack('!BxHH2x', keyer, fill, key))
+
+
+def cmdDskS(keyer, onAir):
+    return subCommand(b'DskS', bytes([keyer, int(onAir), 0, 0, 0, 0, 0, 0]))
+
+
+# style as in Atem.TRANSITION_*, selection bit 0 the background, keys from bit 1 on
+def cmdTrSS(me, style=Atem.TRANSITION_MIX, selection=Atem.TRANSITION_BACKGROUND, nextStyle=None, nextSelection=None):
+    nextStyle = style if nextStyle is None else nextStyle
+    nextSelection = selection if nextSelection is None else nextSelection
+    return subCommand(b'TrSS', struct.pack('!BBBBB3x', me, style, selection, nextStyle, nextSelection))
+
+
+def cmdTrPr(me, preview=False):
+    return subCommand(b'TrPr', struct.pack('!B?2x', me, preview))
+
+
+# position 0 to 9999
+def cmdTrPs(me, inTransition, framesRemaining, position):
+    return subCommand(b'TrPs', struct.pack('!B?BxH2x', me, inTransition, framesRemaining, position))
+
+
+def cmdTMxP(me, rate):
+    return subCommand(b'TMxP', struct.pack('!BB2x', me, rate))
+
+
+def cmdTDdP(me, rate, source):
+    return subCommand(b'TDdP', struct.pack('!BBH', me, rate, source))
+
+
+def cmdTWpP(me, rate, pattern=0, width=0, fillSource=1000, symmetry=5000, softness=0, x=5000, y=5000,
+            reverse=False, flipFlop=False):
+    return subCommand(b'TWpP', struct.pack('!BBBxHHHHHH??2x', me, rate, pattern, width, fillSource, symmetry,
+                                           softness, x, y, reverse, flipFlop))
+
+
+# flags per input: bit 0 program, bit 1 preview
+def cmdTlIn(flags):
+    return subCommand(b'TlIn', struct.pack('!H', len(flags)) + bytes(flags))
+
+
+# sources is a list of (source, flags)
+def cmdTlSr(sources):
+    payload = struct.pack('!H', len(sources))
+    for source, flags in sources:
+        payload += struct.pack('!HB', source, flags)
+    return subCommand(b'TlSr', payload)
+
+
+# ends the initial state
+def cmdInCm():
+    return subCommand(b'InCm', b'\x01\x00\x00\x00')
+
+
+def cmdCCdo(inputNum, domain, feature, available=True):
+    return subCommand(b'CCdo', bytes([0, inputNum, domain, feature, int(available), 0, 0, 0]))
+
+
+def cmdCCdP(inputNum, domain, feature, values):
+    payload = struct.pack('!xBBB12x', inputNum, domain, feature)
+    payload += struct.pack('!%dh' % len(values), *values)
+    payload += b'\x00' * (24 - len(payload) % 24 if len(payload) % 24 else 0)
+    return subCommand(b'CCdP', payload)
+
+
+def cmdMPfe(index, filename, hash=b'\x11' * 16):
+    name = filename.encode('utf-8')
+    payload = struct.pack('!BxxBB16sxxB', 0, index, 1, hash, len(name)) + name
+    payload += b'\x00' * (-len(payload) % 4)
+    return subCommand(b'MPfe', payload)
+
+
+def cmdLKOB(store):
+    return subCommand(b'LKOB', LKOB.pack(store))
+
+
+def cmdLKST(store, locked):
+    return subCommand(b'LKST', LKST.pack(store, locked))
+
+
+def cmdFTCD(transferId, chunkSize, chunkCount):
+    return subCommand(b'FTCD', FTCD.pack(transferId, chunkSize, chunkCount))
+
+
+def cmdFTDa(transferId, data):
+    return subCommand(b'FTDa', FTDA.pack(transferId, len(data)) + data)
+
+
+def cmdFTDC(transferId):
+    return subCommand(b'FTDC', FTDC.pack(transferId))
+
+
+def cmdFTDE(transferId, code):
+    return subCommand(b'FTDE', FTDE.pack(transferId, code))
+
+
+def cmdAMIP(channel, volume, balance):
+    payload = struct.pack('!H4xBBBxHh2x', channel, 0, 6, 1, volume, balance)
+    return subCommand(b'AMIP', payload)
+
+
+def cmdAMMO(volume):
+    return subCommand(b'AMMO', struct.pack('!H2x', volume))
+
+
+# levels are (left, right, peak left, peak right) of the master, the monitor and by source
+def cmdAMLv(master, monitor, sources):
+    payload = struct.pack('!H2x8I', len(sources), *(master + monitor))
+    payload += struct.pack('!%dH' % len(sources), *sources)
+    payload += b'\x00' * (-len(payload) % 4)
+    for levels in sources.values():
+        payload += struct.pack('!4I', *levels)
+    return subCommand(b'AMLv', payload)
+
+
+# the (domain, feature, values) of the camera control state of an input
+CC_DEFAULTS = ((0, 0, [0]), (0, 3, [1024]), (0, 9, [0]), (1, 1, [512]), (1, 2, [5600]), (1, 5, [0, 10000]),
+               (8, 0, [0, 0, 0, 0]), (8, 1, [0, 0, 0, 0]), (8, 2, [2048, 2048, 2048, 2048]), (8, 4, [0, 2048]),
+               (8, 5, [0]), (8, 6, [0, 2048]))
+
+
+# tally flags by input for program and preview source of M/E 1
+def tallyFlags(inputs, program, preview):
+    flags = [0] * inputs
+    if 0 < program <= inputs:
+        flags[program - 1] |= Atem.TALLY_PROGRAM
+    if 0 < preview <= inputs:
+        flags[preview - 1] |= Atem.TALLY_PREVIEW
+    return flags
+
+
+def tallyCommands(flags):
+    return [cmdTlIn(flags), cmdTlSr([(i + 1, value) for i, value in enumerate(flags)])]
+
+
+# the initial state dump of a switcher with the given inputs and M/Es,
+# program and preview default to input me + 1 and me + 2, transitions are mixes of mixRate frames
+def initialDump(inputs=20, mes=4, stills=20, program=None, preview=None, mixRate=25):
+    program = program or [1 + me for me in range(mes)]
+    preview = preview or [2 + me for me in range(mes)]
+    commands = [cmd_ver(2, 30), cmd_pin('ATEM Emulator'), cmd_top(mes, inputs + 20), cmd_mpl(2, 2), cmdVidM(6)]
+    for me in range(mes):
+        commands.append(cmd_MeC(me, 4))
+    for i in range(1, inputs + 1):
+        commands.append(cmdInPr(i, 'Camera %d' % i, 'CM%d' % i))
+    for me in range(mes):
+        commands.append(cmdPrgI(me, program[me]))
+        commands.append(cmdPrvI(me, preview[me]))
+        for keyer in range(4):
+            commands.append(cmdKeOn(me, keyer, False))
+        commands.extend([cmdTrSS(me), cmdTrPr(me), cmdTrPs(me, False, mixRate, 0), cmdTMxP(me, mixRate),
+                         cmdTDdP(me, mixRate, 3010), cmdTWpP(me, mixRate)])
+    for dsk in range(2):
+        commands.append(cmdDskB(dsk, 1, 1))
+        commands.append(cmdDskS(dsk, False))
+    for aux in range(6):
+        commands.append(cmdAuxS(aux, 1 + aux % inputs))
+    for i in range(1, inputs + 1):
+        for domain, feature, values in CC_DEFAULTS:
+            commands.append(cmdCCdo(i, domain, feature))
+            commands.append(cmdCCdP(i, domain, feature, values))
+    for i in range(stills):
+        commands.append(cmdMPfe(i, 'still%02d.png' % i))
+    for i in range(1, inputs + 1):
+        commands.append(cmdAMIP(i, 32768, 0))
+    commands.append(cmdAMMO(32768))
+    commands.extend(tallyCommands(tallyFlags(inputs, program[0], preview[0])))
+    commands.append(cmdInCm())
+    return commands
+
+
+# the emulator
+# ------------
+
+# a client connected to the emulator
+class EmulatorSession:
+    __slots__ = ['address', 'uid', 'nextPackageId', 'expectedId', 'outstanding', 'lastReceived', 'lastSent',
+                 'dumped', 'ready', 'commands', 'levels']
+
+    def __init__(self, address, uid, now):
+        self.address = address
+        self.uid = uid
+        self.nextPackageId = 1
+        # next packageId expected from the client
+        self.expectedId = 1
+        # sent datagrams by packageId awaiting an ACK: [datagram, sentTime, retransmits]
+        self.outstanding = {}
+        self.lastReceived = now
+        self.lastSent = now
+        # the dump was sent, and the client acked all of it
+        self.dumped = False
+        self.ready = False
+        self.commands = 0
+        # the client asked for audio levels by SALN
+        self.levels = False
+
+
+class AtemEmulator:
+    # seconds before unacked datagrams are sent again, and how often
+    RETRANSMIT_TIMEOUT = 0.5
+    MAX_RETRANSMITS = 10
+    # idle sessions get an empty ACKREQUEST this often so clients do not reconnect
+    KEEPALIVE_INTERVAL = 0.5
+    # sessions silent this long are dropped
+    SESSION_TIMEOUT = 5.0
+    # session timers are checked this often rather than at their exact deadlines, so the time a
+    # datagram costs does not grow with the number of sessions
+    SESSION_TICK = 0.05
+    PACKAGE_ID_MASK = Atem.PACKAGE_ID_MASK
+    # media transfers: largest chunk, chunks granted to an upload at once and chunks of a download
+    # sent ahead of the FTUA of the client
+    TRANSFER_CHUNK_SIZE = 1384
+    UPLOAD_WINDOW = 64
+    DOWNLOAD_WINDOW = 32
+    # frames of an auto transition, sent as TrPs one a frame at 25 fps as of the 1080i50 of the dump
+    MIX_RATE = 25
+    FRAME_INTERVAL = 0.04
+
+    # dump replaces the generated initial state (a list of sub-commands), loss is the probability
+    # to drop any datagram in either direction, outgoing datagrams are held back by delay plus
+    # up to jitter seconds
+    def __init__(self, host='127.0.0.1', port=0, inputs=20, mes=4, dump=None, loss=0.0, delay=0.0, jitter=0.0,
+                 applyCommands=True, seed=None):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, port))
+        self.socket.setblocking(0)
+        self.port = self.socket.getsockname()[1]
+
+        self.inputs = inputs
+        self.mes = mes
+        self.program = [1 + me for me in range(mes)]
+        self.preview = [2 + me for me in range(mes)]
+        self.dump = dump
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        # switch program/preview on CPgI/CPvI/DCut/DAut and camera control on CCmd, broadcasting the result
+        self.applyCommands = applyCommands
+        self.random = random.Random(seed)
+        # called with (emulator, session, tag, payload) for every command a client sent
+        self.commandHandler = None
+
+        self.sessions = {}
+        self._nextUid = 0x8001
+        # media pool frames as sent by clients by (store, index): [data, name, hash]; the address of the
+        # session holding the lock of a store; transfers by (address, transferId), uploads are
+        # [store, index, size, data, chunks, name, hash] and downloads [data, offset, chunks sent]
+        self.media = {}
+        self.locks = {}
+        self.uploads = {}
+        self.downloads = {}
+        # [time, interval, kind] of the change streams, see addStream
+        self.streams = []
+        # auto transitions by M/E: [time of the next frame, frames done]
+        self.transitions = {}
+        # delayed datagrams: (sendTime, sequence, datagram, address)
+        self._delayed = []
+        self._delayedCount = 0
+        # when runTimers next looks at the sessions
+        self._sessionTick = 0
+        self.stats = {'received': 0, 'sent': 0, 'lost': 0, 'commands': 0, 'retransmits': 0, 'resends': 0,
+                      'sessions': 0, 'dropped_sessions': 0}
+
+        # broadcast and addStream may be called from other threads than the one serving
+        self.lock = threading.RLock()
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.socket, selectors.EVENT_READ, self)
+        self._wakeReader, self._wakeWriter = socket.socketpair()
+        self._wakeReader.setblocking(0)
+        self.selector.register(self._wakeReader, selectors.EVENT_READ, None)
+        self._thread = None
+        self._running = False
+
+    # sub-commands of the initial state dump
+    def dumpCommands(self):
+        if self.dump is not None:
+            return self.dump
+        return initialDump(self.inputs, self.mes, program=self.program, preview=self.preview, mixRate=self.MIX_RATE)
+
+    # sending
+    # -------
+
+    def _sendRaw(self, data, address):
+        if self.loss and self.random.random() < self.loss:
+            self.stats['lost'] += 1
+            return
+        if self.delay or self.jitter:
+            sendTime = time.monotonic() + self.delay + (self.random.random() * self.jitter if self.jitter else 0)
+            self._delayedCount += 1
+            wake = not self._delayed or sendTime < self._delayed[0][0]
+            heapq.heappush(self._delayed, (sendTime, self._delayedCount, data, address))
+            if wake and self._thread is not None and threading.current_thread() is not self._thread:
+                self._wakeWriter.send(b'\x00')
+            return
+        try:
+            self.socket.sendto(data, address)
+            self.stats['sent'] += 1
+        except OSError:
+            # clients that went away make sendto fail with ECONNREFUSED
+            pass
+
+    def _sendHeader(self, session, bitmask, payload=b'', ackId=0, resendId=0, packageId=0):
+        word = (bitmask << 11) | (len(payload) + Atem.SIZE_OF_HEADER)
+        self._sendRaw(Atem._HEADER.pack(word, session.uid, ackId, resendId, packageId) + payload, session.address)
+
+    # sends payload (joined sub-commands) to one session as a tracked ACKREQUEST datagram
+    def send(self, session, payload):
+        with self.lock:
+            packageId = session.nextPackageId
+            session.nextPackageId = (packageId + 1) & self.PACKAGE_ID_MASK
+            word = (Atem.CMD_ACKREQUEST << 11) | (len(payload) + Atem.SIZE_OF_HEADER)
+            data = Atem._HEADER.pack(word, session.uid, 0, 0, packageId) + payload
+            now = time.monotonic()
+            session.outstanding[packageId] = [data, now, 0]
+            session.lastSent = now
+            self._sendRaw(data, session.address)
+            return packageId
+
+    # sends sub-commands to every session that got its dump
+    def broadcast(self, commands):
+        payloads = [b''.join(batch) for batch in batches(commands)]
+        with self.lock:
+            for session in list(self.sessions.values()):
+                if session.dumped:
+                    for payload in payloads:
+                        self.send(session, payload)
+
+    # receiving
+    # ---------
+
+    def handleSocketData(self):
+        try:
+            data, address = self.socket.recvfrom(2048)
+        except OSError:
+            return False
+        if len(data) < Atem.SIZE_OF_HEADER:
+            return True
+        with self.lock:
+            self.stats['received'] += 1
+            if self.loss and self.random.random() < self.loss:
+                self.stats['lost'] += 1
+                return True
+            self.handleDatagram(data, address)
+        return True
+
+    def handleDatagram(self, data, address):
+        word, uid, ackId, resendId, packageId = Atem._HEADER.unpack_from(data)
+        bitmask = word >> 11
+        now = time.monotonic()
+
+        if bitmask & Atem.CMD_HELLOPACKET:
+            # a new session, also when a client reuses the port of one that went away
+            session = EmulatorSession(address, self._nextUid, now)
+            self._nextUid = 0x8001 + ((self._nextUid - 0x8000) & 0x7FFF)
+            self.sessions[address] = session
+            self.stats['sessions'] += 1
+            self.dropTransfers(address)
+            word = (Atem.CMD_HELLOPACKET << 11) | (Atem.SIZE_OF_HEADER + 8)
+            self._sendRaw(Atem._HEADER.pack(word, uid, 0, 0, 0) + b'\x02\x00\x00\x00\x00\x00\x00\x00', address)
+            return
+
+        session = self.sessions.get(address)
+        if session is None:
+            return
+        session.lastReceived = now
+
+        if bitmask & Atem.CMD_ACK:
+            if not session.dumped:
+                # the client acked our HELLO
+                self.sendDump(session)
+            elif session.outstanding:
+                self.handleAck(session, ackId)
+
+        if bitmask & Atem.CMD_RESENDREQUEST:
+            self.stats['resends'] += 1
+            for sentId, sent in sorted(session.outstanding.items()):
+                if (sentId - resendId) & self.PACKAGE_ID_MASK < 0x4000:
+                    sent[1] = now
+                    sent[0] = Atem.markRetransmit(sent[0])
+                    self._sendRaw(sent[0], address)
+
+        if bitmask & Atem.CMD_ACKREQUEST:
+            if packageId == session.expectedId:
+                session.expectedId = (packageId + 1) & self.PACKAGE_ID_MASK
+                self.handleCommands(session, data)
+            elif (session.expectedId - packageId) & self.PACKAGE_ID_MASK >= 0x4000:
+                # like the switcher, only accept packets in order, the client sends them again
+                return
+            self._sendHeader(session, Atem.CMD_ACK, ackId=(session.expectedId - 1) & self.PACKAGE_ID_MASK)
+
+    # sends the initial state and a ping that ends it
+    def sendDump(self, session):
+        session.dumped = True
+        for batch in batches(self.dumpCommands()):
+            self.send(session, b''.join(batch))
+        self.send(session, b'')
+
+    # ACKs are cumulative and acknowledge every outstanding datagram up to ackId
+    def handleAck(self, session, ackId):
+        for sentId in list(session.outstanding):
+            if (ackId - sentId) & self.PACKAGE_ID_MASK < 0x4000:
+                del session.outstanding[sentId]
+        if not session.outstanding:
+            session.ready = True
+
+    def handleCommands(self, session, data):
+        offset = Atem.SIZE_OF_HEADER
+        while offset + Atem.SIZE_OF_SUBHEADER <= len(data):
+            size, tag = Atem._SUBHEADER.unpack_from(data, offset)
+            if size < Atem.SIZE_OF_SUBHEADER:
+                break
+            payload = data[offset + Atem.SIZE_OF_SUBHEADER:offset + size]
+            offset += size
+            session.commands += 1
+            self.stats['commands'] += 1
+            if self.commandHandler is not None:
+                self.commandHandler(self, session, tag, payload)
+            if self.applyCommands:
+                self.applyCommand(tag, payload, session)
+
+    # the switcher side of the few commands the emulator implements, session sent it
+    def applyCommand(self, tag, payload, session=None):
+        if tag in (b'CPgI', b'CPvI') and len(payload) >= 4:
+            me = payload[0]
+            if me < self.mes:
+                source = (payload[2] << 8) | payload[3]
+                if tag == b'CPgI':
+                    self.setProgram(me, source)
+                else:
+                    self.setPreview(me, source)
+        elif tag == b'DCut' and payload:
+            me = payload[0]
+            if me < self.mes:
+                self.cut(me)
+        elif tag == b'DAut' and payload:
+            me = payload[0]
+            if me < self.mes:
+                self.autoTransition(me)
+        elif tag == b'CCmd' and len(payload) >= 16:
+            # the camera reports the new values back, CCdP has them at the same offset
+            self.broadcast([subCommand(b'CCdP', bytes([0, payload[0], payload[1], payload[2]]) + bytes(12) +
+                                       payload[16:])])
+        elif tag == b'SALN' and session is not None and payload:
+            session.levels = bool(payload[0])
+        elif session is not None and tag in self.TRANSFER_COMMANDS:
+            self.TRANSFER_COMMANDS[tag](self, session, payload)
+
+    # media transfers
+    # ---------------
+
+    def _lock(self, session, payload):
+        store, locked = LOCK.unpack_from(payload)
+        owner = self.locks.get(store)
+        if locked and owner in (None, session.address):
+            self.locks[store] = session.address
+            self.send(session, cmdLKOB(store))
+            self.broadcast([cmdLKST(store, True)])
+        elif not locked and owner == session.address:
+            del self.locks[store]
+            self.broadcast([cmdLKST(store, False)])
+
+    def _startUpload(self, session, payload):
+        transferId, store, index, size, mode = FTSD.unpack_from(payload)
+        if self.locks.get(store) != session.address:
+            self.send(session, cmdFTDE(transferId, ERROR_NOT_LOCKED))
+            return
+        self.uploads[(session.address, transferId)] = [store, index, size, bytearray(), 0, '', bytes(16)]
+        self.send(session, cmdFTCD(transferId, self.TRANSFER_CHUNK_SIZE, self.UPLOAD_WINDOW))
+
+    def _fileDescription(self, session, payload):
+        transferId, name, description, hash = FTFD.unpack_from(payload)
+        upload = self.uploads.get((session.address, transferId))
+        if upload is not None:
+            upload[5] = name.split(b'\x00', 1)[0].decode('utf-8', 'replace')
+            upload[6] = hash
+
+    def _uploadData(self, session, payload):
+        transferId, size = FTDA.unpack_from(payload)
+        key = (session.address, transferId)
+        upload = self.uploads.get(key)
+        if upload is None:
+            return
+        upload[3] += payload[FTDA.size:FTDA.size + size]
+        upload[4] += 1
+        if len(upload[3]) >= upload[2]:
+            del self.uploads[key]
+            store, index, size, data, chunks, name, hash = upload
+            self.media[(store, index)] = [bytes(data), name, hash]
+            self.send(session, cmdFTDC(transferId))
+            if store == STORE_STILLS:
+                self.broadcast([cmdMPfe(index, name, hash)])
+        elif upload[4] % (self.UPLOAD_WINDOW // 2) == 0:
+            # half the window was stored, the client may send that much more
+            self.send(session, cmdFTCD(transferId, self.TRANSFER_CHUNK_SIZE, self.UPLOAD_WINDOW // 2))
+
+    def _startDownload(self, session, payload):
+        transferId, store, index, kind = FTSU.unpack_from(payload)
+        if self.locks.get(store) != session.address:
+            self.send(session, cmdFTDE(transferId, ERROR_NOT_LOCKED))
+            return
+        frame = self.media.get((store, index))
+        if frame is None:
+            self.send(session, cmdFTDE(transferId, ERROR_NOT_FOUND))
+            return
+        download = self.downloads[(session.address, transferId)] = [frame[0], 0, 0]
+        self._sendDownload(session, transferId, download, 0)
+
+    # sends chunks until DOWNLOAD_WINDOW are not acknowledged, FTDC after the last one
+    def _sendDownload(self, session, transferId, download, acked):
+        data, offset, sent = download
+        while sent - acked < self.DOWNLOAD_WINDOW and offset < len(data):
+            chunk = data[offset:offset + self.TRANSFER_CHUNK_SIZE]
+            self.send(session, cmdFTDa(transferId, chunk))
+            offset += len(chunk)
+            sent += 1
+        download[1] = offset
+        download[2] = sent
+        if offset >= len(data):
+            del self.downloads[(session.address, transferId)]
+            self.send(session, cmdFTDC(transferId))
+
+    def _acknowledge(self, session, payload):
+        transferId, last = FTUA.unpack_from(payload)
+        download = self.downloads.get((session.address, transferId))
+        if download is not None:
+            sent = download[2]
+            # the FTUA has the index of the last chunk received, modulo 256
+            self._sendDownload(session, transferId, download, sent - ((sent - 1 - last) & 0xFF))
+
+    TRANSFER_COMMANDS = {b'LOCK': _lock, b'FTSD': _startUpload, b'FTFD': _fileDescription, b'FTDa': _uploadData,
+                         b'FTSU': _startDownload, b'FTUA': _acknowledge}
+
+    # forgets the transfers and locks of a client that went away
+    def dropTransfers(self, address):
+        for key in [key for key in self.uploads if key[0] == address]:
+            del self.uploads[key]
+        for key in [key for key in self.downloads if key[0] == address]:
+            del self.downloads[key]
+        for store in [store for store, owner in self.locks.items() if owner == address]:
+            del self.locks[store]
+            self.broadcast([cmdLKST(store, False)])
+
+    # state changes
+    # -------------
+
+    def _inputCommands(self, me):
+        commands = [cmdPrgI(me, self.program[me]), cmdPrvI(me, self.preview[me])]
+        if me == 0:
+            commands.extend(tallyCommands(tallyFlags(self.inputs, self.program[0], self.preview[0])))
+        return commands
+
+    def setProgram(self, me, source):
+        with self.lock:
+            self.program[me] = source
+            self.broadcast(self._inputCommands(me))
+
+    def setPreview(self, me, source):
+        with self.lock:
+            self.preview[me] = source
+            self.broadcast(self._inputCommands(me))
+
+    # swaps program and preview of an M/E
+    def cut(self, me=0):
+        with self.lock:
+            self.program[me], self.preview[me] = self.preview[me], self.program[me]
+            self.broadcast(self._inputCommands(me))
+
+    # mixes preview to program over MIX_RATE frames with a TrPs each; like a switcher program, preview
+    # and tally change only when it ends
+    def autoTransition(self, me=0):
+        with self.lock:
+            if me in self.transitions:
+                return
+            self.transitions[me] = [time.monotonic() + self.FRAME_INTERVAL, 0]
+            self.broadcast([cmdTrPs(me, True, self.MIX_RATE, 0)])
+        if self._thread is not None:
+            self._wakeWriter.send(b'\x00')
+
+    def runTransition(self, me, transition):
+        frame = transition[1] = transition[1] + 1
+        if frame < self.MIX_RATE:
+            self.broadcast([cmdTrPs(me, True, self.MIX_RATE - frame, frame * 10000 // self.MIX_RATE)])
+            return
+        del self.transitions[me]
+        self.program[me], self.preview[me] = self.preview[me], self.program[me]
+        self.broadcast([cmdTrPs(me, False, self.MIX_RATE, 0)] + self._inputCommands(me))
+
+    # change streams
+    # --------------
+
+    STREAMS = ('tally', 'inputs', 'cameracontrol', 'audiolevels')
+
+    # generates changes rate times a second, kind is one of
+    #   tally: a cut on M/E 1 followed by a new preview, with TlIn/TlSr
+    #   inputs: new program and preview sources on a random M/E
+    #   cameracontrol: a CCdP change of iris, focus or lift on a random input
+    #   audiolevels: AMLv with random levels of every input to the clients that sent SALN
+    def addStream(self, kind, rate):
+        if kind not in self.STREAMS:
+            raise ValueError('unknown stream %s, expected one of %s' % (kind, ', '.join(self.STREAMS)))
+        with self.lock:
+            stream = [time.monotonic(), 1.0 / rate, kind]
+            self.streams.append(stream)
+        if self._thread is not None:
+            self._wakeWriter.send(b'\x00')
+        return stream
+
+    def removeStream(self, stream):
+        with self.lock:
+            self.streams.remove(stream)
+
+    def runStream(self, kind):
+        randint = self.random.randint
+        if kind == 'tally':
+            self.program[0], self.preview[0] = self.preview[0], self.program[0]
+            source = self.preview[0]
+            while source in (self.program[0], self.preview[0]) and self.inputs > 2:
+                source = randint(1, self.inputs)
+            self.preview[0] = source
+            self.broadcast(self._inputCommands(0))
+        elif kind == 'inputs':
+            me = randint(0, self.mes - 1)
+            self.program[me] = randint(1, self.inputs)
+            self.preview[me] = randint(1, self.inputs)
+            self.broadcast(self._inputCommands(me))
+        elif kind == 'cameracontrol':
+            inputNum = randint(1, self.inputs)
+            domain, feature, count = self.random.choice(((0, 3, 1), (0, 0, 1), (8, 0, 4)))
+            self.broadcast([cmdCCdP(inputNum, domain, feature, [randint(-2048, 2048)] * count)])
+        elif kind == 'audiolevels':
+            sessions = [session for session in self.sessions.values() if session.dumped and session.levels]
+            if sessions:
+                level = self.random.getrandbits
+                sources = {i: (level(23), level(23), level(23), level(23)) for i in range(1, self.inputs + 1)}
+                payload = cmdAMLv((level(23),) * 4, (level(23),) * 4, sources)
+                for session in sessions:
+                    self.send(session, payload)
+
+    # timers
+    # ------
+
+    # returns the monotonic time at which runTimers has work to do
+    def nextDeadline(self):
+        with self.lock:
+            deadline = time.monotonic() + 1.0
+            for stream in self.streams:
+                deadline = min(deadline, stream[0])
+            for transition in self.transitions.values():
+                deadline = min(deadline, transition[0])
+            if self._delayed:
+                deadline = min(deadline, self._delayed[0][0])
+            if self.sessions:
+                deadline = min(deadline, self._sessionTick)
+            return deadline
+
+    def runTimers(self, now):
+        with self.lock:
+            while self._delayed and self._delayed[0][0] <= now:
+                sendTime, sequence, data, address = heapq.heappop(self._delayed)
+                try:
+                    self.socket.sendto(data, address)
+                    self.stats['sent'] += 1
+                except OSError:
+                    pass
+
+            for stream in self.streams:
+                if stream[0] <= now:
+                    self.runStream(stream[2])
+                    # keep the rate, but do not try to catch up after a stall
+                    stream[0] = max(stream[0] + stream[1], now - stream[1])
+
+            for me, transition in list(self.transitions.items()):
+                if transition[0] <= now:
+                    transition[0] = max(transition[0] + self.FRAME_INTERVAL, now - self.FRAME_INTERVAL)
+                    self.runTransition(me, transition)
+
+            if now < self._sessionTick:
+                return
+            self._sessionTick = now + self.SESSION_TICK
+            for address, session in list(self.sessions.items()):
+                if now - session.lastReceived > self.SESSION_TIMEOUT:
+                    del self.sessions[address]
+                    self.stats['dropped_sessions'] += 1
+                    self.dropTransfers(address)
+                    continue
+                for sentId, sent in sorted(session.outstanding.items()):
+                    if now - sent[1] >= self.RETRANSMIT_TIMEOUT:
+                        if sent[2] >= self.MAX_RETRANSMITS:
+                            del self.sessions[address]
+                            self.stats['dropped_sessions'] += 1
+                            self.dropTransfers(address)
+                            break
+                        sent[1] = now
+                        sent[2] += 1
+                        self.stats['retransmits'] += 1
+                        sent[0] = Atem.markRetransmit(sent[0])
+                        self._sendRaw(sent[0], address)
+                else:
+                    if session.dumped and now - session.lastSent >= self.KEEPALIVE_INTERVAL:
+                        self.send(session, b'')
+
+    # serving
+    # -------
+
+    # waits at most timeout seconds for datagrams, handles them and runs due timers
+    def poll(self, timeout=None):
+        wait = max(0, self.nextDeadline() - time.monotonic())
+        timeout = wait if timeout is None else min(timeout, wait)
+        for key, events in self.selector.select(timeout):
+            if key.data is None:
+                try:
+                    while self._wakeReader.recv(64):
+                        pass
+                except OSError:
+                    pass
+            else:
+                while self.handleSocketData():
+                    pass
+        self.runTimers(time.monotonic())
+
+    def run(self):
+        self._running = True
+        while self._running:
+            self.poll()
+
+    # serves from a background thread
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._running = False
+        if self._thread is not None:
+            self._wakeWriter.send(b'\x00')
+            self._thread.join()
+            self._thread = None
+        self.selector.close()
+        self._wakeReader.close()
+        self._wakeWriter.close()
+        self.socket.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='emulate an ATEM switcher')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=9910)
+    parser.add_argument('--inputs', type=int, default=20)
+    parser.add_argument('--mes', type=int, default=4)
+    parser.add_argument('--loss', type=float, default=0.0, help='probability to drop a datagram')
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds outgoing datagrams are held back')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many seconds added to the delay')
+    for kind in AtemEmulator.STREAMS:
+        parser.add_argument('--' + kind, type=float, default=0.0, metavar='RATE', help='%s changes per second' % kind)
+    args = parser.parse_args()
+
+    emulator = AtemEmulator(args.host, args.port, args.inputs, args.mes, loss=args.loss, delay=args.delay,
+                            jitter=args.jitter)
+    for kind in AtemEmulator.STREAMS:
+        if getattr(args, kind):
+            emulator.addStream(kind, getattr(args, kind))
+    print('emulating a %d input, %d M/E switcher on port %d' % (args.inputs, args.mes, emulator.port))
+    try:
+        lastReport = time.monotonic()
+        while True:
+            emulator.poll(1.0)
+            if time.monotonic() - lastReport >= 5:
+                lastReport = time.monotonic()
+                print(len(emulator.sessions), 'sessions', emulator.stats)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.close()
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# switcher state model, one feature class per aspect of the switcher as laid
+# out in roadmap.md; records use __slots__ and sources live in arrays that are
+# preallocated from the topology, Atem builds its dict views from them
+
+from array import array
+
+# marks a source that was not reported yet in the source arrays
+UNKNOWN_SOURCE = 0xFFFF
+
+
+# expands a bitmask into {label: bool}, the first label being the most significant bit
+def bitmaskDict(num, labels):
+    return {label: bool(num & (1 << len(labels) - i - 1)) for i, label in enumerate(labels)}
+
+
+# {index: source} of the sources that were reported
+def sourcesDict(sources):
+    return {index: source for index, source in enumerate(sources) if source != UNKNOWN_SOURCE}
+
+
+# grows a source array so that index fits
+def growSources(sources, index):
+    if index >= len(sources):
+        sources.extend([UNKNOWN_SOURCE] * (index + 1 - len(sources)))
+
+
+# base of the state records, slots still None are not reported yet and left out of the dict view
+class AtemRecord:
+    __slots__ = ()
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, None)
+
+    def asDict(self):
+        result = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                result[name] = value.asDict() if isinstance(value, AtemRecord) else value
+        return result
+
+
+# AtemFacts
+# ---------
+
+class AtemTopology(AtemRecord):
+    __slots__ = ['mes', 'sources', 'color_generators', 'aux_busses', 'dsks', 'stingers', 'dves', 'supersources',
+                 'hasSD']
+
+
+class AtemMediaPlayerCount(AtemRecord):
+    __slots__ = ['still', 'clip']
+
+
+class AtemFacts(AtemRecord):
+    __slots__ = ['version', 'name', 'topology', 'keyers', 'media_players', 'multiviewers', 'super_source_boxes',
+                 'tally_channels', 'audio_channels', 'has_monitor', 'video_modes', 'macro_banks', 'power',
+                 'last_state_change']
+
+    VIDEO_MODES = 18
+
+    def __init__(self):
+        AtemRecord.__init__(self)
+        self.topology = AtemTopology()
+        self.media_players = AtemMediaPlayerCount()
+        # keyers per M/E
+        self.keyers = array('H')
+
+    def asDict(self):
+        result = AtemRecord.asDict(self)
+        result['keyers'] = sourcesDict(self.keyers)
+        if self.video_modes is not None:
+            result['video_modes'] = {i: bool(self.video_modes & (1 << self.VIDEO_MODES - i - 1))
+                                     for i in range(self.VIDEO_MODES)}
+        result.pop('power', None)
+        result.pop('last_state_change', None)
+        return result
+
+
+# AtemConfig
+# ----------
+
+class AtemInput(AtemRecord):
+    __slots__ = ['name_long', 'name_short', 'types_available', 'port_type_external', 'port_type_internal',
+                 'availability', 'me_availability']
+
+    LABELS_AVAILABILITY = ['Auxilary', 'Multiviewer', 'SuperSourceArt', 'SuperSourceBox', 'KeySource']
+    LABELS_ME_AVAILABILITY = ['ME1', 'ME2']
+
+    # bitmasks are kept as ints, labels for types_available come from Atem.LABELS_PORTS_EXTERNAL
+    def asDict(self, portLabels=()):
+        result = AtemRecord.asDict(self)
+        if self.types_available is not None:
+            result['types_available'] = bitmaskDict(self.types_available, portLabels)
+        if self.availability is not None:
+            result['availability'] = bitmaskDict(self.availability, self.LABELS_AVAILABILITY)
+        if self.me_availability is not None:
+            result['me_availability'] = bitmaskDict(self.me_availability, self.LABELS_ME_AVAILABILITY)
+        return result
+
+
+class AtemMultiviewer(AtemRecord):
+    __slots__ = ['layout', 'windows']
+
+    def __init__(self):
+        AtemRecord.__init__(self)
+        self.windows = array('H')
+
+    def asDict(self):
+        result = AtemRecord.asDict(self)
+        if self.windows:
+            result['windows'] = sourcesDict(self.windows)
+        else:
+            del result['windows']
+        return result
+
+
+class AtemConfig(AtemRecord):
+    __slots__ = ['down_converter', 'video_mode', 'inputs', 'multiviewers', 'clip_maxlength']
+
+    def __init__(self):
+        AtemRecord.__init__(self)
+        # by input index
+        self.inputs = {}
+        self.multiviewers = []
+        # per clip bank
+        self.clip_maxlength = array('H')
+
+    def asDict(self):
+        result = {}
+        if self.down_converter is not None:
+            result['down_converter'] = self.down_converter
+        if self.video_mode is not None:
+            result['video_mode'] = self.video_mode
+        result['multiviewers'] = {i: multiviewer.asDict() for i, multiviewer in enumerate(self.multiviewers)}
+        result['mediapool'] = {i: {'maxlength': length} for i, length in enumerate(self.clip_maxlength)}
+        return result
+
+
+# AtemMixing
+# ----------
+
+class AtemWipe(AtemRecord):
+    __slots__ = ['rate', 'pattern', 'width', 'fillSource', 'symmetry', 'softness', 'x', 'y', 'reverse', 'flipFlop']
+
+
+# the transition of an M/E: style and selection (TrSS) as in Atem.TRANSITION_*, whether it runs on
+# preview only (TrPr), where it is (TrPs, position 0 to 9999) and the settings of mix, dip and wipe
+class AtemTransition(AtemRecord):
+    __slots__ = ['style', 'selection', 'nextStyle', 'nextSelection', 'preview', 'inTransition', 'framesRemaining',
+                 'position', 'mixRate', 'dipRate', 'dipSource', 'wipe']
+
+    def __init__(self):
+        AtemRecord.__init__(self)
+        self.wipe = AtemWipe()
+
+    def asDict(self):
+        result = AtemRecord.asDict(self)
+        if not result['wipe']:
+            del result['wipe']
+        return result
+
+
+class AtemMixing(AtemRecord):
+    __slots__ = ['program', 'preview', 'transitions']
+
+    def __init__(self):
+        AtemRecord.__init__(self)
+        # sources by M/E
+        self.program = array('H')
+        self.preview = array('H')
+        # by M/E
+        self.transitions = []
+
+    def resize(self, mes):
+        growSources(self.program, mes - 1)
+        growSources(self.preview, mes - 1)
+        while len(self.transitions) < mes:
+            self.transitions.append(AtemTransition())
+
+
+# AtemKeyerBase
+# -------------
+
+class AtemDownstreamKeyer(AtemRecord):
+    __slots__ = ['fill', 'key', 'onAir', 'inTransition', 'autoTransitioning', 'framesRemaining']
+
+
+class AtemKeyers(AtemRecord):
+    __slots__ = ['onAir', 'dsks']
+
+    def __init__(self):
+        AtemRecord.__init__(self)
+        # per M/E a bytearray of on air flags by keyer, None for not reported
+        self.onAir = []
+        self.dsks = []
+
+    def resize(self, mes, dsks):
+        while len(self.onAir) < mes:
+            self.onAir.append(None)
+        while len(self.dsks) < dsks:
+            self.dsks.append(AtemDownstreamKeyer())
+
+    def asDict(self):
+        return {
+            'keyers': {me: {keyer: bool(flag) for keyer, flag in enumerate(flags) if flag != 0xFF}
+                       for me, flags in enumerate(self.onAir) if flags is not None},
+            'dskeyers': {i: dsk.asDict() for i, dsk in enumerate(self.dsks) if dsk.fill is not None or
+                         dsk.onAir is not None},
+        }
+
+
+# AtemAux
+# -------
+
+class AtemAux(AtemRecord):
+    __slots__ = ['sources']
+
+    def __init__(self):
+        AtemRecord.__init__(self)
+        self.sources = array('H')
+
+    def resize(self, busses):
+        growSources(self.sources, busses - 1)
+
+
+# AtemVirtualSource
+# -----------------
+
+class AtemMediaPlayer(AtemRecord):
+    __slots__ = ['playing', 'loop', 'beginning', 'clip_frame', 'type', 'still_index', 'clip_index']
+
+
+class AtemMediaPlayers(AtemRecord):
+    __slots__ = ['players']
+
+    def __init__(self):
+        AtemRecord.__init__(self)
+        self.players = []
+
+    def get(self, index):
+        while len(self.players) <= index:
+            self.players.append(AtemMediaPlayer())
+        return self.players[index]
+
+    def asDict(self):
+        return {i: player.asDict() for i, player in enumerate(self.players) if player.asDict()}
+
+
+# AtemMediaPool
+# -------------
+
+class AtemStill(AtemRecord):
+    __slots__ = ['used', 'hash', 'filename']
+
+
+class AtemClip(AtemRecord):
+    __slots__ = ['used', 'filename', 'length']
+
+
+class AtemAudioClip(AtemRecord):
+    __slots__ = ['used', 'filename']
+
+
+class AtemMediaPool(AtemRecord):
+    __slots__ = ['stills', 'clips', 'audio']
+
+    def __init__(self):
+        AtemRecord.__init__(self)
+        # by bank
+        self.stills = {}
+        self.clips = {}
+        self.audio = {}
+
+    def asDict(self):
+        result = {}
+        for name in self.__slots__:
+            banks = getattr(self, name)
+            if banks:
+                result[name] = {bank: record.asDict() for bank, record in banks.items()}
+        return result
+
+
+# AtemAudioMixer
+# --------------
+
+class AtemAudioChannel(AtemRecord):
+    __slots__ = ['fromMediaPlayer', 'plug', 'mix_option', 'volume', 'balance']
+
+    CONFIG = ('fromMediaPlayer', 'plug')
+    STATE = ('mix_option', 'volume', 'balance')
+
+    def asDict(self, names=CONFIG + STATE):
+        return {name: getattr(self, name) for name in names if getattr(self, name) is not None}
+
+
+class AtemAudioMonitor(AtemRecord):
+    __slots__ = ['enabled', 'volume', 'mute', 'solo', 'solo_input', 'dim']
+
+
+class AtemAudioMixer(AtemRecord):
+    __slots__ = ['channels', 'master_volume', 'monitor', 'tally']
+
+    def __init__(self):
+        AtemRecord.__init__(self)
+        # by audio source
+        self.channels = {}
+        self.monitor = AtemAudioMonitor()
+        self.tally = {}
+
+    def asDict(self):
+        result = {channel: record.asDict(AtemAudioChannel.STATE) for channel, record in self.channels.items()}
+        if self.master_volume is not None:
+            result['master_volume'] = self.master_volume
+        monitor = self.monitor.asDict()
+        if monitor:
+            result['monitor'] = monitor
+        if self.tally:
+            result['tally'] = dict(self.tally)
+        return result
+
+
+# AtemCameraControl
+# -----------------
+
+# raw values by feature slot, see Atem.CC_FEATURES; values are the tuples their codec unpacks,
+# None is not reported yet, as is 0xFF in available
+class AtemCamera(AtemRecord):
+    __slots__ = ['available', 'values']
+
+    def __init__(self, features):
+        AtemRecord.__init__(self)
+        self.available = bytearray(b'\xff' * features)
+        self.values = [None] * features
+
+
+class AtemCameraControl(AtemRecord):
+    __slots__ = ['cameras', 'features']
+
+    def __init__(self, features):
+        AtemRecord.__init__(self)
+        # by input
+        self.cameras = {}
+        self.features = features
+
+    def get(self, input_num):
+        camera = self.cameras.get(input_num)
+        if camera is None:
+            camera = self.cameras[input_num] = AtemCamera(self.features)
+        return camera
+
+
+# AtemTally
+# ---------
+
+class AtemTally(AtemRecord):
+    __slots__ = ['byIndex', 'bySource', 'sourcePositions', 'changes', 'predicted']
+
+    def __init__(self):
+        AtemRecord.__init__(self)
+        # raw flags by input index (TlIn) and the raw source/flags entries of TlSr
+        # with the offset of the flags of each source
+        self.byIndex = bytearray()
+        self.bySource = bytearray()
+        self.sourcePositions = {}
+        # input indexes (TlIn) or source ids (TlSr) whose tally changed with the last tally packet
+        self.changes = []
+        # [store, offset, flags before] of the flags the predictive tally set, until the switcher
+        # reports the tally itself, see Atem.predictiveTally
+        self.predicted = []
+
+    # byIndex and bySource as the switcher reported them, without the flags of the predictive tally
+    def reported(self):
+        if not self.predicted:
+            return self.byIndex, self.bySource
+        byIndex = bytearray(self.byIndex)
+        bySource = bytearray(self.bySource)
+        for store, offset, flags in reversed(self.predicted):
+            (byIndex if store is self.byIndex else bySource)[offset] = flags
+        return byIndex, bySource
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+import selectors
+import time
+
+from atem import Atem
+
+
+# runs sessions to several switchers from a single selector loop
+#
+#   manager = AtemManager()
+#   studio = manager.addSwitcher('192.168.2.8')
+#   gallery = manager.addSwitcher('192.168.2.9')
+#   manager.run()
+class AtemManager:
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.sessions = []
+
+    # creates a session on an ephemeral local port and starts connecting it
+    def addSwitcher(self, address, port=9910, cls=Atem, interests=None):
+        atem = cls(address, port=port, localPort=0, interests=interests)
+        self.selector.register(atem.socket, selectors.EVENT_READ, atem)
+        self.sessions.append(atem)
+        atem.connectToSwitcher()
+        return atem
+
+    def removeSwitcher(self, atem):
+        self.selector.unregister(atem.socket)
+        self.sessions.remove(atem)
+        atem.stopTallycast()
+        atem.stopCapture()
+        atem.stopSnapshot()
+        atem.socket.close()
+
+    # waits at most timeout seconds for datagrams, handles them and runs due timers
+    def poll(self, timeout=None):
+        now = time.monotonic()
+        if self.sessions:
+            wait = min(atem.nextDeadline() for atem in self.sessions) - now
+            timeout = wait if timeout is None else min(timeout, wait)
+        if timeout is not None and timeout < 0:
+            timeout = 0
+
+        for key, events in self.selector.select(timeout):
+            key.data.drainSocket()
+
+        now = time.monotonic()
+        for atem in self.sessions:
+            if atem.nextDeadline() <= now:
+                atem.checkTimeouts(now)
+
+    def run(self):
+        while True:
+            self.poll()
+
+    def close(self):
+        for atem in list(self.sessions):
+            self.removeSwitcher(atem)
+        self.selector.close()
@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# moves stills and clip frames between files and the media pool of a switcher
+#
+#   atem.uploadStill(3, '/home/pi/graphics/lower-third.raw', name='Lower third', callback=done)
+#   atem.downloadStill(3, callback=lambda transfer: print(len(transfer.data)))
+#
+# frames are in the native format of the switcher, e.g. 10 bit YUVA 4:2:2 with 8 bytes for
+# two pixels; converting images is left to other tools. On the wire frames are RLE
+# compressed, runs of identical 8 byte blocks become MARKER, their count and the block.
+#
+# a transfer locks the store of its slot (LOCK, answered by LKOB), asks for an upload (FTSD)
+# or download (FTSU) and streams FTDa chunks: uploads send as many as the switcher granted by
+# FTCD, downloads acknowledge the chunks they got by FTUA. FTDC completes a transfer, FTDE
+# fails it. Transfers to the same store take turns, those to different stores run in parallel
+
+import hashlib
+import mmap
+import re
+import struct
+import time
+from collections import deque
+
+MARKER = b'\xfe' * 8
+_RUN = struct.Struct('!Q')
+
+# media pool stores: stills, clip n (from 0) is store n + 1
+STORE_STILLS = 0
+
+# sub-command payloads
+LOCK = struct.Struct('!H?x')            # store, locked
+LKOB = struct.Struct('!H2x')            # store
+LKST = struct.Struct('!H?x')            # store, locked
+FTSD = struct.Struct('!HH2xHIH2x')      # transfer, store, index, size, mode
+FTSU = struct.Struct('!HH2xHH2x')       # transfer, store, index, type
+FTCD = struct.Struct('!H4xHH2x')        # transfer, chunk size, chunk count
+FTDA = struct.Struct('!HH')             # transfer, size, the data follows
+FTFD = struct.Struct('!H64s128s16s2x')  # transfer, name, description, hash
+FTDC = struct.Struct('!H2x')            # transfer
+FTUA = struct.Struct('!HBx')            # transfer, last chunk received
+FTDE = struct.Struct('!HBx')            # transfer, error code
+
+# FTSD mode of frames
+MODE_FRAME = 1
+
+# FTDE error codes
+ERROR_RETRY = 1
+ERROR_NOT_FOUND = 2
+ERROR_NOT_LOCKED = 5
+ERRORS = {ERROR_RETRY: 'busy', ERROR_NOT_FOUND: 'not found', ERROR_NOT_LOCKED: 'not locked'}
+
+
+# run length encoding
+# -------------------
+
+_ZEROS = bytes(16)
+_ZERO_SPAN = bytes(1 << 16)
+_NONZERO = re.compile(rb'[^\x00]')
+
+
+# index of the first non zero byte of buffer at or after position, size if there is none;
+# compares growing spans instead of looking at every byte
+def _zerosEnd(buffer, position, size):
+    step = 256
+    while position < size:
+        end = min(position + step, size)
+        if buffer[position:end] != _ZERO_SPAN[:end - position]:
+            return _NONZERO.search(buffer, position, end).start()
+        position = end
+        step = min(step * 4, len(_ZERO_SPAN))
+    return size
+
+
+def _literal(out, data, view, start, end):
+    # blocks that look like MARKER are sent as runs of one
+    found = data.find(MARKER, start, end)
+    while found >= 0:
+        if (found - start) % 8:
+            found = data.find(MARKER, found + 1, end)
+            continue
+        out += view[start:found]
+        out += MARKER
+        out += _RUN.pack(1)
+        out += MARKER
+        start = found + 8
+        found = data.find(MARKER, start, end)
+    out += view[start:end]
+
+
+# RLE of a frame, data is bytes, a bytearray or an mmap; runs are found in the XOR of the
+# frame with itself shifted by one block, which is zero where a block repeats the one before
+def encodeRLE(data):
+    size = len(data) - len(data) % 8
+    view = memoryview(data)
+    number = int.from_bytes(view[:size], 'big')
+    shifted = (number ^ (number >> 64)).to_bytes(size, 'big')
+    out = bytearray()
+    literal = 0
+    position = 8
+    find = shifted.find
+    while True:
+        # at least two blocks repeating the one before them
+        start = find(_ZEROS, position)
+        if start < 0:
+            break
+        end = _zerosEnd(shifted, start + 16, size)
+        position = end
+        aligned = start + (-start % 8)
+        repeats = (end - aligned) // 8
+        if repeats < 2:
+            continue
+        first = aligned - 8
+        _literal(out, data, view, literal, first)
+        out += MARKER
+        out += _RUN.pack(repeats + 1)
+        out += view[first:aligned]
+        literal = aligned + repeats * 8
+    _literal(out, data, view, literal, len(data))
+    view.release()
+    return out
+
+
+def decodeRLE(data):
+    view = memoryview(data)
+    out = bytearray()
+    position = 0
+    find = data.find
+    while True:
+        found = find(MARKER, position)
+        while found >= 0 and (found - position) % 8:
+            found = find(MARKER, found + 1)
+        if found < 0:
+            out += view[position:]
+            break
+        out += view[position:found]
+        count, = _RUN.unpack_from(data, found + 8)
+        out += bytes(view[found + 16:found + 24]) * count
+        position = found + 24
+    view.release()
+    return out
+
+
+def _cString(text, size):
+    return text.encode('utf-8')[:size - 1]
+
+
+# transfers
+# ---------
+
+# one upload or download, see MediaTransfers; callback(transfer) runs once it is done, failed or skipped
+class MediaTransfer:
+    QUEUED = 0
+    RUNNING = 1
+    DONE = 2
+    FAILED = 3
+    # the slot already held the frame
+    SKIPPED = 4
+
+    __slots__ = ['transferId', 'store', 'index', 'upload', 'rle', 'name', 'description', 'hash', 'payload',
+                 'source', 'size', 'offset', 'credits', 'chunkSize', 'chunks', 'received', 'acknowledge', 'data',
+                 'state', 'error', 'retries', 'callback', 'startTime', 'endTime', 'lastActivity']
+
+    def __init__(self, store, index, upload, callback=None):
+        self.transferId = None
+        self.store = store
+        self.index = index
+        self.upload = upload
+        self.rle = True
+        self.name = ''
+        self.description = ''
+        # md5 of the frame
+        self.hash = None
+        # upload: the frame, bytes-like or an mmap of the file, and the data as sent, a memoryview
+        # into it or of its RLE once the transfer starts
+        self.source = None
+        self.payload = None
+        # bytes on the wire, of a download as far as received
+        self.size = 0
+        # upload: bytes sent, chunks the switcher still accepts and their size, None before the first FTCD
+        self.offset = 0
+        self.credits = 0
+        self.chunkSize = None
+        # download: chunks received, their data and the queued FTUA not sent yet
+        self.chunks = 0
+        self.received = None
+        self.acknowledge = None
+        # download: the frame once done
+        self.data = None
+        self.state = self.QUEUED
+        self.error = None
+        self.retries = 0
+        self.callback = callback
+        self.startTime = None
+        self.endTime = None
+        self.lastActivity = None
+
+    # an upload of source, a path that is mapped instead of read or a bytes-like frame
+    @classmethod
+    def forUpload(cls, store, index, source, name='', description='', rle=True, callback=None):
+        transfer = cls(store, index, True, callback)
+        transfer.name = name
+        transfer.description = description
+        transfer.rle = rle
+        if isinstance(source, str):
+            with open(source, 'rb') as file:
+                source = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        transfer.source = source
+        transfer.hash = hashlib.md5(source).digest()
+        return transfer
+
+    # encodes the frame of an upload, deferred until it is sent so skipped uploads do not pay for it
+    def prepare(self):
+        if self.payload is not None:
+            return
+        if self.rle:
+            self.payload = memoryview(encodeRLE(self.source))
+            self.releaseSource()
+        else:
+            self.payload = memoryview(self.source).cast('B')
+        self.size = len(self.payload)
+
+    @property
+    def finished(self):
+        return self.state >= self.DONE
+
+    # bytes per second on the wire, None until finished
+    @property
+    def throughput(self):
+        if self.endTime is None or self.startTime is None or self.endTime <= self.startTime:
+            return None
+        return self.size / (self.endTime - self.startTime)
+
+    def releaseSource(self):
+        if isinstance(self.source, mmap.mmap):
+            if self.payload is not None and not self.rle:
+                self.payload.release()
+                self.payload = None
+            try:
+                self.source.close()
+            except BufferError:
+                # chunks of it are still queued, the mmap closes once they are gone
+                pass
+        self.source = None
+
+    # marks the transfer finished and lets go of its buffers
+    def end(self, state, error=None):
+        self.state = state
+        self.error = error
+        self.endTime = time.monotonic()
+        self.releaseSource()
+        self.payload = None
+        self.received = None
+        self.acknowledge = None
+
+    # the transfer starts over, e.g. after the switcher was busy
+    def restart(self):
+        self.offset = 0
+        self.credits = 0
+        self.chunkSize = None
+        self.chunks = 0
+        if not self.upload:
+            self.size = 0
+            self.received = bytearray()
+        self.acknowledge = None
+
+
+# runs the media transfers of an Atem: Atem.recvLKOB/FTCD/FTDa/FTDC/FTDE hand the replies of the
+# switcher to it, Atem.nextDeadline and checkTimeouts its timeout
+class MediaTransfers:
+    # seconds without progress before a transfer fails
+    TIMEOUT = 5.0
+    # FTDE retries of a transfer the switcher was too busy for
+    MAX_RETRIES = 3
+
+    def __init__(self, atem):
+        self.atem = atem
+        self.nextId = 1
+        # running transfers by transferId
+        self.transfers = {}
+        # transfers by store, the first one is running or waiting for the lock
+        self.queues = {}
+        # stores we requested the lock of, True once we hold it
+        self.locks = {}
+        # data per FTDa, datagrams keep below MAX_PAYLOAD_SIZE
+        self.maxChunk = (atem.MAX_PAYLOAD_SIZE - atem.SIZE_OF_SUBHEADER - FTDA.size) // 8 * 8
+
+    def add(self, transfer):
+        transfer.transferId = self.nextId
+        self.nextId = self.nextId % 0xFFFF + 1
+        if not transfer.upload:
+            transfer.received = bytearray()
+        transfer.lastActivity = time.monotonic()
+        queue = self.queues.setdefault(transfer.store, deque())
+        queue.append(transfer)
+        if len(queue) == 1:
+            self._begin(transfer)
+        return transfer
+
+    @property
+    def active(self):
+        return bool(self.queues)
+
+    def _begin(self, transfer):
+        transfer.lastActivity = time.monotonic()
+        store = transfer.store
+        if self.locks.get(store):
+            self._start(transfer)
+        elif store not in self.locks:
+            self.locks[store] = False
+            self.atem.sendCommand(b'LOCK', LOCK.pack(store, True))
+
+    def _start(self, transfer):
+        transfer.state = transfer.RUNNING
+        if transfer.startTime is None:
+            transfer.startTime = time.monotonic()
+        self.transfers[transfer.transferId] = transfer
+        if transfer.upload:
+            transfer.prepare()
+            self.atem.sendCommand(b'FTSD', FTSD.pack(transfer.transferId, transfer.store, transfer.index,
+                                                     len(transfer.payload), MODE_FRAME))
+        else:
+            self.atem.sendCommand(b'FTSU', FTSU.pack(transfer.transferId, transfer.store, transfer.index, 0))
+
+    def lockObtained(self, store):
+        if self.locks.get(store) is not False:
+            return
+        self.locks[store] = True
+        queue = self.queues.get(store)
+        if queue:
+            self._start(queue[0])
+        else:
+            del self.locks[store]
+            self.atem.sendCommand(b'LOCK', LOCK.pack(store, False))
+
+    # the switcher accepts chunkCount more chunks of at most chunkSize
+    def continueUpload(self, transferId, chunkSize, chunkCount):
+        transfer = self.transfers.get(transferId)
+        if transfer is None or not transfer.upload:
+            return
+        transfer.lastActivity = time.monotonic()
+        if transfer.chunkSize is None:
+            transfer.chunkSize = min(chunkSize // 8 * 8, self.maxChunk)
+            self.atem.queueCommand(b'FTFD', FTFD.pack(transferId, _cString(transfer.name, 64),
+                                                      _cString(transfer.description, 128), transfer.hash))
+        transfer.credits += chunkCount
+        payload = transfer.payload
+        size = len(payload)
+        offset = transfer.offset
+        chunkSize = transfer.chunkSize
+        queue = self.atem.queueCommand
+        while transfer.credits and offset < size:
+            chunk = payload[offset:offset + chunkSize]
+            queue(b'FTDa', FTDA.pack(transferId, len(chunk)), data=chunk)
+            offset += len(chunk)
+            transfer.credits -= 1
+        transfer.offset = offset
+        self.atem.flushCommands()
+
+    def data(self, transferId, chunk):
+        transfer = self.transfers.get(transferId)
+        if transfer is None or transfer.upload:
+            return
+        transfer.lastActivity = time.monotonic()
+        transfer.received += chunk
+        transfer.size += len(chunk)
+        transfer.chunks += 1
+        payload = FTUA.pack(transferId, (transfer.chunks - 1) & 0xFF)
+        # acknowledges all chunks so far, one FTUA per datagram we send is enough
+        pending = transfer.acknowledge
+        if pending is not None and pending.packageId is None:
+            pending.payload = payload
+        else:
+            transfer.acknowledge = self.atem.queueCommand(b'FTUA', payload)
+
+    def complete(self, transferId):
+        transfer = self.transfers.get(transferId)
+        if transfer is None:
+            return
+        if not transfer.upload:
+            transfer.data = bytes(decodeRLE(transfer.received)) if transfer.rle else bytes(transfer.received)
+        self._finish(transfer, transfer.DONE)
+
+    def error(self, transferId, code):
+        transfer = self.transfers.get(transferId)
+        if transfer is None:
+            return
+        if code == ERROR_RETRY and transfer.retries < self.MAX_RETRIES:
+            transfer.retries += 1
+            transfer.restart()
+            self._start(transfer)
+            return
+        self._finish(transfer, transfer.FAILED, ERRORS.get(code, 'error %d' % code))
+
+    def _finish(self, transfer, state, error=None):
+        self.transfers.pop(transfer.transferId, None)
+        transfer.end(state, error)
+        store = transfer.store
+        queue = self.queues[store]
+        queue.remove(transfer)
+        if queue:
+            self._begin(queue[0])
+        else:
+            del self.queues[store]
+            if self.locks.pop(store, False):
+                self.atem.sendCommand(b'LOCK', LOCK.pack(store, False))
+        if transfer.callback is not None:
+            transfer.callback(transfer)
+
+    # monotonic time the first transfer times out, None without any
+    def deadline(self):
+        deadline = None
+        for queue in self.queues.values():
+            timeout = queue[0].lastActivity + self.TIMEOUT
+            if deadline is None or timeout < deadline:
+                deadline = timeout
+        return deadline
+
+    def checkTimeouts(self, now):
+        for queue in list(self.queues.values()):
+            transfer = queue[0]
+            if now - transfer.lastActivity >= self.TIMEOUT:
+                self._finish(transfer, transfer.FAILED, 'timeout')
+
+    # the switcher forgot our transfers and locks along with the session
+    def failAll(self, reason='session lost'):
+        queues = self.queues
+        self.queues = {}
+        self.transfers = {}
+        self.locks = {}
+        for queue in queues.values():
+            for transfer in queue:
+                transfer.end(transfer.FAILED, reason)
+                if transfer.callback is not None:
+                    transfer.callback(transfer)
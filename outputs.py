@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# drives tally lamps from a worker thread, so that a slow output never holds up
+# the receive loop that has to ACK the switcher
+#
+#   outputs = Outputs(debounce=0.05)
+#   outputs.add('red', GpioOutput(16))
+#   outputs.add('green', FileOutput('/sys/class/leds/led0/brightness'))
+#   outputs.start()
+#   atem.tallyHandler = lambda atem: outputs.update({'red': atem.isProgram(5), 'green': atem.isPreview(5)})
+#
+# update only stores the wanted values in a slot holding the latest value per
+# output and wakes the worker; updates the worker did not get to yet are merged,
+# so the queue never grows. The worker writes an output only when its value
+# changed, and at most once per debounce seconds: a change within that time is
+# written when it ends if it still holds, a blip that reverted is never written.
+
+import threading
+import time
+
+
+# an output pin of the Raspberry Pi, BCM numbering
+class GpioOutput:
+    def __init__(self, pin):
+        import RPi.GPIO as GPIO
+
+        self.GPIO = GPIO
+        self.pin = pin
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+        GPIO.setup(pin, GPIO.OUT)
+
+    def write(self, value):
+        self.GPIO.output(self.pin, self.GPIO.HIGH if value else self.GPIO.LOW)
+
+    def close(self):
+        self.write(False)
+        self.GPIO.cleanup(self.pin)
+
+
+# a file taking a value per write, e.g. the brightness of a LED in /sys/class/leds
+class FileOutput:
+    def __init__(self, path, on=b'1', off=b'0'):
+        self.path = path
+        self.on = on
+        self.off = off
+        self.file = open(path, 'wb', buffering=0)
+
+    def write(self, value):
+        self.file.seek(0)
+        self.file.write(self.on if value else self.off)
+
+    def close(self):
+        self.write(False)
+        self.file.close()
+
+
+# keeps what was written and when, for tests and benchmarks; delay seconds make every
+# write as slow as a slow driver
+class MockOutput:
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.value = None
+        # (monotonic time, value) of every write
+        self.writes = []
+
+    def write(self, value):
+        if self.delay:
+            time.sleep(self.delay)
+        self.value = value
+        self.writes.append((time.monotonic(), value))
+
+    def close(self):
+        pass
+
+
+class Outputs:
+    def __init__(self, debounce=0):
+        self.debounce = debounce
+        # name: [driver, debounce, value written, monotonic time written]
+        self.outputs = {}
+        # the latest values by name the worker did not take yet
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.thread = None
+        self.closed = False
+        self.stats = {'updates': 0, 'merged': 0, 'writes': 0, 'errors': 0}
+
+    # debounce defaults to the one of Outputs
+    def add(self, name, driver, debounce=None):
+        if self.thread is not None:
+            raise ValueError('outputs are added before start')
+        self.outputs[name] = [driver, self.debounce if debounce is None else debounce, None, None]
+        return driver
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='atem-outputs', daemon=True)
+        self.thread.start()
+        return self
+
+    # sets outputs by name to the values, returns at once
+    def update(self, values):
+        with self.condition:
+            self.stats['updates'] += 1
+            if self.pending:
+                self.stats['merged'] += 1
+            self.pending.update(values)
+            self.condition.notify()
+
+    # the worker
+    def run(self):
+        wanted = {}
+        deadline = None
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    timeout = None if deadline is None else deadline - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self.condition.wait(timeout)
+                if self.closed:
+                    return
+                wanted.update(self.pending)
+                self.pending = {}
+            deadline = self.writeChanges(wanted, time.monotonic())
+
+    # writes the wanted values that changed and are out of their debounce time, returns the
+    # monotonic time the next held back value is due or None
+    def writeChanges(self, wanted, now):
+        deadline = None
+        for name, value in wanted.items():
+            output = self.outputs.get(name)
+            if output is None or output[2] == value:
+                continue
+            driver, debounce, written, when = output
+            if when is not None and now < when + debounce:
+                deadline = when + debounce if deadline is None else min(deadline, when + debounce)
+                continue
+            try:
+                driver.write(value)
+                self.stats['writes'] += 1
+            except Exception as e:
+                # e.g. RuntimeError of RPi.GPIO, the other outputs and the worker carry on
+                self.stats['errors'] += 1
+                print('Writing output', name, 'failed', e)
+            output[2] = value
+            output[3] = now
+        return deadline
+
+    # stops the worker and switches every output off
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        for name, output in self.outputs.items():
+            try:
+                output[0].close()
+            except Exception as e:
+                print('Closing output', name, 'failed', e)
+
+
+# the red and green lamps of a tally light as set up in config.py: led_red and led_green name files,
+# e.g. in /sys/class/leds, or else gpio_red and gpio_green are pins; debounce in seconds is optional
+def configOutputs(config):
+    outputs = Outputs(getattr(config, 'debounce', 0))
+    for name in ('red', 'green'):
+        path = getattr(config, 'led_' + name, None)
+        outputs.add(name, FileOutput(path) if path else GpioOutput(getattr(config, 'gpio_' + name)))
+    return outputs.start()
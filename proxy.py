@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# holds one session to a switcher and serves any number of clients on the ATEM
+# protocol, for switchers that accept only a few connections
+#
+#   proxy = AtemProxy('192.168.2.8', listenPort=9910).start()
+#
+#   python3 proxy.py 192.168.2.8 --port 9910
+#
+# clients get their own handshake, uid and packageIds from the session handling
+# of the emulator. Their initial dump is the latest sub-command the switcher sent
+# for each target, as it was sent; live datagrams of the switcher are passed on
+# to every client as they are, with a header of the client's session. Commands of
+# clients are forwarded to the switcher, batched with those of other clients.
+# Media transfers are answered to a single session and are not proxied.
+
+import selectors
+import time
+
+from atem import Atem
+from emulator import AtemEmulator
+
+
+# the session to the switcher, hands every datagram handled in order to the proxy
+class ProxyUpstream(Atem):
+    def __init__(self, proxy, address, port=9910):
+        # only InCm and the like are decoded, the proxy passes the rest on undecoded
+        super().__init__(address, port, localPort=0, interests=())
+        self.metrics = None
+        self.proxy = proxy
+
+    def parsePayload(self, datagram):
+        super().parsePayload(datagram)
+        self.proxy.relay(datagram)
+
+
+class AtemProxy(AtemEmulator):
+    # leading payload bytes that tell which target a sub-command sets, the latest sub-command per tag and
+    # target is cached; sub-commands of state as a whole, e.g. tally, keep only their tag
+    CACHE_KEYS = {
+        b'_ver': 0, b'_pin': 0, b'_top': 0, b'_mpl': 0, b'_MvC': 0, b'_SSC': 0, b'_TlC': 0, b'_AMC': 0,
+        b'_VMC': 0, b'_MAC': 0, b'Powr': 0, b'DcOt': 0, b'VidM': 0, b'MPSp': 0, b'AMMO': 0, b'AMmO': 0,
+        b'AMTl': 0, b'TlIn': 0, b'TlSr': 0, b'Time': 0,
+        b'_MeC': 1, b'MvPr': 1, b'PrgI': 1, b'PrvI': 1, b'DskB': 1, b'DskS': 1, b'AuxS': 1, b'RCPS': 1,
+        b'MPCE': 1, b'MPCS': 1, b'MPAS': 1, b'ColV': 1, b'TrSS': 1, b'TrPr': 1, b'TrPs': 1, b'TMxP': 1,
+        b'TDdP': 1, b'TWpP': 1,
+        b'InPr': 2, b'MvIn': 2, b'KeOn': 2, b'AMIP': 2, b'MPrp': 2, b'LKST': 2,
+        b'CCdo': 4, b'CCdP': 4, b'MPfe': 4,
+    }
+    # for tags not listed, most sub-commands start with the index of what they set
+    DEFAULT_CACHE_KEY = 2
+
+    # sub-commands for one session or that end a dump, not passed on
+    LOCAL_TAGS = frozenset((b'InCm', b'LKOB', b'FTCD', b'FTDa', b'FTDC', b'FTDE', b'AMLv'))
+    # commands of clients not forwarded: media transfers would answer to the proxy, and audio
+    # levels are asked for per session
+    LOCAL_COMMANDS = frozenset((b'LOCK', b'FTSD', b'FTSU', b'FTFD', b'FTDa', b'FTUA', b'SALN'))
+
+    def __init__(self, address, port=9910, listenHost='0.0.0.0', listenPort=9910):
+        super().__init__(listenHost, listenPort)
+        # the latest sub-command by tag and target, in the order first seen
+        self.cache = {}
+        # clients that asked for their dump before the switcher sent all of its state
+        self.waiting = []
+        self.stats.update({'relayed': 0, 'forwarded': 0})
+        self.upstream = ProxyUpstream(self, address, port)
+        self.upstream.stateCompleteHandler = self._upstreamComplete
+        self.selector.register(self.upstream.socket, selectors.EVENT_READ, self.upstream)
+        self.upstream.connectToSwitcher()
+
+    # the cached state as the switcher sent it, ended by InCm
+    def dumpCommands(self):
+        return list(self.cache.values()) + [b'\x00\x08\x00\x00InCm']
+
+    def sendDump(self, session):
+        if not self.upstream.stateComplete:
+            self.waiting.append(session)
+            return
+        super().sendDump(session)
+
+    def _upstreamComplete(self, upstream):
+        waiting = self.waiting
+        self.waiting = []
+        for session in waiting:
+            if self.sessions.get(session.address) is session:
+                super().sendDump(session)
+
+    # caches the sub-commands of a datagram from the switcher and passes them on to the clients
+    def relay(self, datagram):
+        cache = self.cache
+        keys = self.CACHE_KEYS
+        default = self.DEFAULT_CACHE_KEY
+        local = self.LOCAL_TAGS
+        unpackSubHeader = Atem._SUBHEADER.unpack_from
+        offset = Atem.SIZE_OF_HEADER
+        end = len(datagram) - Atem.SIZE_OF_SUBHEADER
+        forwarded = None
+        while offset <= end:
+            size, tag = unpackSubHeader(datagram, offset)
+            if size < Atem.SIZE_OF_SUBHEADER:
+                break
+            if tag in local:
+                if forwarded is None:
+                    # pass on the sub-commands up to this one
+                    forwarded = [datagram[Atem.SIZE_OF_HEADER:offset]]
+            else:
+                command = datagram[offset:offset + size]
+                start = offset + Atem.SIZE_OF_SUBHEADER
+                cache[tag + datagram[start:start + keys.get(tag, default)]] = command
+                if forwarded is not None:
+                    forwarded.append(command)
+            offset += size
+        if forwarded is None:
+            payload = datagram[Atem.SIZE_OF_HEADER:offset]
+        else:
+            payload = b''.join(forwarded)
+        if payload:
+            self.stats['relayed'] += 1
+            self.fanOut(payload)
+
+    # send of payload to every client that got its dump, taking the time and the lock once
+    def fanOut(self, payload):
+        pack = Atem._HEADER.pack
+        word = (Atem.CMD_ACKREQUEST << 11) | (len(payload) + Atem.SIZE_OF_HEADER)
+        mask = self.PACKAGE_ID_MASK
+        sendRaw = self._sendRaw
+        now = time.monotonic()
+        with self.lock:
+            for session in self.sessions.values():
+                if session.dumped:
+                    packageId = session.nextPackageId
+                    session.nextPackageId = (packageId + 1) & mask
+                    data = pack(word, session.uid, 0, 0, packageId) + payload
+                    session.outstanding[packageId] = [data, now, 0]
+                    session.lastSent = now
+                    sendRaw(data, session.address)
+
+    # commands of a client go to the switcher, sent once the datagram was handled
+    def applyCommand(self, tag, payload, session=None):
+        if tag not in self.LOCAL_COMMANDS:
+            self.stats['forwarded'] += 1
+            self.upstream.queueCommand(tag, payload)
+
+    def handleCommands(self, session, data):
+        super().handleCommands(session, data)
+        if self.upstream._outbox:
+            self.upstream.flushCommands()
+
+    # serving
+    # -------
+
+    def nextDeadline(self):
+        return min(super().nextDeadline(), self.upstream.nextDeadline())
+
+    def runTimers(self, now):
+        super().runTimers(now)
+        if self.upstream.nextDeadline() <= now:
+            self.upstream.checkTimeouts(now)
+
+    def poll(self, timeout=None):
+        wait = max(0, self.nextDeadline() - time.monotonic())
+        timeout = wait if timeout is None else min(timeout, wait)
+        for key, events in self.selector.select(timeout):
+            if key.data is None:
+                try:
+                    while self._wakeReader.recv(64):
+                        pass
+                except OSError:
+                    pass
+            elif key.data is self.upstream:
+                self.upstream.drainSocket()
+            else:
+                while self.handleSocketData():
+                    pass
+        self.runTimers(time.monotonic())
+
+    def close(self):
+        super().close()
+        self.upstream.socket.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='serve many clients from one session to an ATEM switcher')
+    parser.add_argument('switcher')
+    parser.add_argument('--switcher-port', type=int, default=9910)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=9910)
+    args = parser.parse_args()
+    proxy = AtemProxy(args.switcher, args.switcher_port, args.host, args.port)
+    try:
+        proxy.run()
+    except KeyboardInterrupt:
+        proxy.close()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# keeps the topology, input properties and tally of a switcher in a small file,
+# so a restarted client can bring its outputs up in the last known state before
+# the switcher answers; the live dump then only reports what changed meanwhile
+#
+#   atem.startSnapshot('/home/pi/tally/state.snap')
+#   atem.connectToSwitcher()
+#
+# a snapshot is MAGIC followed by the state encoded as the sub-commands the
+# switcher sends, so loading it is Atem.parsePayload
+
+import os
+import struct
+import time
+
+MAGIC = b'ATEMSNP1'
+
+SUBHEADER = struct.Struct('!H2x4s')
+
+
+def _subCommand(tag, payload):
+    return SUBHEADER.pack(SUBHEADER.size + len(payload), tag) + payload
+
+
+# the snapshotted state of atem as sub-commands
+def encodeSnapshot(atem):
+    commands = []
+    topology = atem.facts.topology
+    if topology.mes is not None:
+        commands.append(_subCommand(b'_top', bytes([topology.mes, topology.sources, topology.color_generators or 0,
+                                                    topology.aux_busses, topology.dsks, topology.stingers or 0,
+                                                    topology.dves or 0, topology.supersources or 0, 0,
+                                                    1 if topology.hasSD else 0, 0, 0])))
+    for index, setting in sorted(atem.configuration.inputs.items()):
+        payload = struct.pack('!H20s4sxBxBBxBBxx', index, (setting.name_long or '').encode('utf-8')[:20],
+                              (setting.name_short or '').encode('utf-8')[:4], setting.types_available or 0,
+                              setting.port_type_external or 0, setting.port_type_internal or 0,
+                              setting.availability or 0, setting.me_availability or 0)
+        commands.append(_subCommand(b'InPr', payload))
+    # a prediction the switcher never confirmed is not restored
+    byIndex, bySource = atem.tally.reported()
+    if byIndex:
+        commands.append(_subCommand(b'TlIn', struct.pack('!H', len(byIndex)) + byIndex))
+    if bySource:
+        commands.append(_subCommand(b'TlSr', struct.pack('!H', len(bySource) // 3) + bySource))
+    return b''.join(commands)
+
+
+# writes data to path through a temporary file, so a power cut leaves either the old or the new snapshot
+def writeAtomic(path, data):
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+# restores a snapshot into atem, running the usual callbacks; returns whether there was one
+def loadSnapshot(atem, path):
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        return False
+    if not data.startswith(MAGIC):
+        print('%s is not a snapshot, ignored' % path)
+        return False
+    # not traffic from the switcher, keep it out of the metrics
+    metrics = atem.metrics
+    atem.metrics = None
+    try:
+        atem.parsePayload(bytes(atem.SIZE_OF_HEADER) + data[len(MAGIC):])
+    finally:
+        atem.metrics = metrics
+    return True
+
+
+# writes the snapshot of an Atem once it changed, at most every interval seconds;
+# Atem.nextDeadline and checkTimeouts run it, see Atem.startSnapshot
+class SnapshotWriter:
+    # handlers of the state kept in a snapshot
+    TAGS = ('_top', 'InPr', 'TlIn', 'TlSr')
+
+    def __init__(self, path, interval=2.0):
+        self.path = path
+        self.interval = interval
+        self.dirty = False
+        self.lastWrite = 0
+        # the snapshot as last written, unchanged state is not written again
+        self.written = None
+
+    # monotonic time the next write is due, None while nothing changed
+    def deadline(self):
+        return self.lastWrite + self.interval if self.dirty else None
+
+    def flush(self, atem, now=None):
+        if not self.dirty:
+            return
+        self.dirty = False
+        self.lastWrite = time.monotonic() if now is None else now
+        data = MAGIC + encodeSnapshot(atem)
+        if data == self.written:
+            return
+        try:
+            writeAtomic(self.path, data)
+            self.written = data
+        except OSError as e:
+            print('Writing snapshot failed', e)
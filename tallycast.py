@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# sends the tally of a switcher as one small UDP multicast frame to any number of
+# tally lights, which need no session to the switcher and nothing decoded but the
+# frame; frames go out on every change and every interval seconds in between
+#
+#   atem.startTallycast('239.255.90.10')                    # next to the session
+#
+#   python3 tallycast.py publish 192.168.2.8                # a publisher on its own
+#   python3 tallycast.py subscribe                          # a light, config.py as for atem.py
+#
+# a frame is a FRAME header (MAGIC, VERSION, FLAG_* bits, the epoch of the publisher,
+# a sequence number and the counts of both tally lists) followed by the TlIn flags by
+# input index and the TlSr entries (source id and flags) as the switcher sent them.
+# The sequence number grows with every change and is repeated by refreshes; a new
+# epoch tells subscribers the publisher restarted and counts from 0 again
+
+import random
+import selectors
+import socket
+import struct
+import time
+
+MAGIC = b'ATTC'
+VERSION = 1
+# magic, version, flags, epoch, sequence, inputs by index, sources
+FRAME = struct.Struct('!4sBBHIHH')
+# the publisher is ready on a session to the switcher, the tally is live
+FLAG_LIVE = 0x01
+
+GROUP = '239.255.90.10'
+PORT = 9911
+
+# TALLY_* of Atem
+TALLY_PROGRAM = 0x01
+TALLY_PREVIEW = 0x02
+
+
+# publishes the tally of an Atem, see Atem.startTallycast; Atem.nextDeadline and checkTimeouts
+# run the refresh
+class TallyPublisher:
+    def __init__(self, group=GROUP, port=PORT, interval=1.0, ttl=1, interface=None):
+        self.address = (group, port)
+        self.interval = interval
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        if interface is not None:
+            self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+        self.socket.setblocking(0)
+        self.epoch = random.getrandbits(16)
+        self.sequence = 0
+        # the frame without its header as last sent, and the whole frame
+        self.body = None
+        self.frame = None
+        self.lastSent = 0
+        self.sent = 0
+
+    # monotonic time the next refresh is due
+    def deadline(self):
+        return self.lastSent + self.interval
+
+    # sends the tally of atem as the switcher reported it, without predictions, as a new frame if it changed
+    def publish(self, atem, now=None):
+        byIndex, bySource = atem.tally.reported()
+        flags = FLAG_LIVE if atem.isInitialized else 0
+        body = struct.pack('!BHH', flags, len(byIndex), len(bySource) // 3) + byIndex + bySource
+        if body != self.body:
+            self.body = body
+            self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+            self.frame = FRAME.pack(MAGIC, VERSION, flags, self.epoch, self.sequence, len(byIndex),
+                                    len(bySource) // 3) + body[5:]
+        self.send(now)
+
+    # sends the last frame again
+    def send(self, now=None):
+        self.lastSent = time.monotonic() if now is None else now
+        if self.frame is None:
+            return
+        try:
+            self.socket.sendto(self.frame, self.address)
+            self.sent += 1
+        except OSError as e:
+            print('Sending tally frame failed', e)
+
+    def close(self):
+        self.socket.close()
+
+
+# receives tally frames, a tally light without a session to the switcher
+#
+#   subscriber = TallySubscriber()
+#   subscriber.tallyHandler = lambda s: print(s.isProgram(5), s.isPreview(5))
+#   subscriber.run()
+class TallySubscriber:
+    def __init__(self, group=GROUP, port=PORT, interface='0.0.0.0'):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(('', port))
+        if socket.inet_aton(group)[0] & 0xF0 == 0xE0:
+            membership = socket.inet_aton(group) + socket.inet_aton(interface)
+            self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        self.socket.setblocking(0)
+        self.selector = None
+        # the tally as in Atem.tally, and the flags by source id
+        self.byIndex = b''
+        self.bySource = {}
+        self.live = False
+        self.epoch = None
+        self.sequence = 0
+        # monotonic time of the last frame, a light may show it lost the publisher
+        self.lastFrame = None
+        self.frames = 0
+        # called after a frame changed the tally or live
+        self.tallyHandler = None
+
+    # handles a frame, returns whether it was newer than the last one
+    def handleFrame(self, frame):
+        if len(frame) < FRAME.size:
+            return False
+        magic, version, flags, epoch, sequence, indexes, sources = FRAME.unpack_from(frame)
+        if magic != MAGIC or version != VERSION:
+            return False
+        self.lastFrame = time.monotonic()
+        if epoch == self.epoch and not 0 < (sequence - self.sequence) & 0xFFFFFFFF < 0x80000000:
+            # a refresh, or older than what we have
+            return False
+        end = FRAME.size + indexes + 3 * sources
+        if len(frame) < end:
+            return False
+        self.epoch = epoch
+        self.sequence = sequence
+        self.frames += 1
+        self.live = bool(flags & FLAG_LIVE)
+        self.byIndex = frame[FRAME.size:FRAME.size + indexes]
+        entries = frame[FRAME.size + indexes:end]
+        self.bySource = {(entries[i] << 8) | entries[i + 1]: entries[i + 2] for i in range(0, len(entries), 3)}
+        if self.tallyHandler is not None:
+            self.tallyHandler(self)
+        return True
+
+    def handleSocketData(self):
+        try:
+            frame = self.socket.recv(2048)
+        except OSError:
+            return False
+        self.handleFrame(frame)
+        return True
+
+    # tally flags by input index (1 based) and by source id, as Atem.getTally and getSourceTally
+    def getTally(self, index):
+        return self.byIndex[index - 1] if 0 < index <= len(self.byIndex) else 0
+
+    def getSourceTally(self, source):
+        return self.bySource.get(source, 0)
+
+    def isProgram(self, index):
+        return bool(self.getTally(index) & TALLY_PROGRAM)
+
+    def isPreview(self, index):
+        return bool(self.getTally(index) & TALLY_PREVIEW)
+
+    # waits at most timeout seconds for frames and handles them
+    def waitForFrame(self, timeout=None):
+        if self.selector is None:
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(self.socket, selectors.EVENT_READ)
+        if self.selector.select(timeout):
+            while self.handleSocketData():
+                pass
+
+    def run(self):
+        while True:
+            self.waitForFrame()
+
+    def close(self):
+        if self.selector is not None:
+            self.selector.close()
+        self.socket.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='multicast the tally of an ATEM switcher to tally lights')
+    parser.add_argument('--group', default=GROUP)
+    parser.add_argument('--port', type=int, default=PORT)
+    commands = parser.add_subparsers(dest='command', required=True)
+    publish = commands.add_parser('publish', help='publish the tally of a switcher')
+    publish.add_argument('switcher')
+    publish.add_argument('--interval', type=float, default=1.0, help='seconds between refreshes')
+    publish.add_argument('--ttl', type=int, default=1, help='multicast hops')
+    commands.add_parser('subscribe', help='drive the tally light set up in config.py')
+    args = parser.parse_args()
+
+    if args.command == 'publish':
+        from atem import Atem
+
+        atem = Atem(args.switcher, localPort=0, interests=['tally'])
+        atem.startTallycast(args.group, args.port, args.interval, args.ttl)
+        atem.connectToSwitcher()
+        while True:
+            atem.waitForPacket()
+    else:
+        import config
+        from outputs import configOutputs
+
+        outputs = configOutputs(config)
+
+        def tallyWatch(subscriber):
+            outputs.update({'red': subscriber.isProgram(config.input), 'green': subscriber.isPreview(config.input)})
+
+        subscriber = TallySubscriber(args.group, args.port)
+        subscriber.tallyHandler = tallyWatch
+        try:
+            subscriber.run()
+        finally:
+            outputs.close()
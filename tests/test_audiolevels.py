@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+import unittest
+
+from atem import Atem
+from audiolevels import AudioLevels, LEFT, numpy
+from emulator import cmdAMLv
+
+
+# an AMLv payload of two sources with every level set to value
+def payload(value):
+    levels = (value,) * 4
+    return cmdAMLv(levels, levels, {1: levels, 2: levels})[Atem.SIZE_OF_SUBHEADER:]
+
+
+class PullTest(unittest.TestCase):
+    def check(self, levels):
+        for sequence in range(70):
+            levels.update(payload(sequence))
+        # the cursor fell behind the ring of 64, the oldest kept frame is 6
+        cursor, frames = levels.pull(0, 7)
+        self.assertEqual(cursor, 70)
+        # groups start at 7, the first boundary still kept, each holds its highest level
+        self.assertEqual([int(frame[LEFT]) for frame in frames], list(range(13, 70, 7)))
+        levels.update(payload(70))
+        self.assertEqual(levels.pull(cursor, 7), (cursor, []))
+
+    def testBehindRingArray(self):
+        self.check(AudioLevels(history=64, useNumpy=False))
+
+    @unittest.skipIf(numpy is None, 'numpy not installed')
+    def testBehindRingNumpy(self):
+        self.check(AudioLevels(history=64))
+
+    # the oldest kept frame is not on a group boundary, no group comes out short
+    def testBehindRingBoundary(self):
+        levels = AudioLevels(history=8, useNumpy=False)
+        for sequence in range(12):
+            levels.update(payload(sequence))
+        cursor, frames = levels.pull(0, 3)
+        self.assertEqual(cursor, 12)
+        self.assertEqual([frame[LEFT] for frame in frames], [8, 11])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+import time
+import unittest
+
+from outputs import MockOutput, Outputs
+
+
+class BrokenOutput(MockOutput):
+    def write(self, value):
+        raise RuntimeError('driver gone')
+
+
+# waits at most timeout seconds for condition to hold
+def waitFor(condition, timeout=1.0):
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.001)
+    return condition()
+
+
+class OutputsTest(unittest.TestCase):
+    def setUp(self):
+        self.outputs = Outputs()
+
+    def tearDown(self):
+        self.outputs.close()
+
+    # update returns at once, the worker writes the lamp soon after
+    def testLatency(self):
+        red = self.outputs.add('red', MockOutput(delay=0.05))
+        self.outputs.start()
+        latencies = []
+        for value in (True, False, True):
+            start = time.monotonic()
+            self.outputs.update({'red': value})
+            self.assertLess(time.monotonic() - start, 0.01)
+            self.assertTrue(waitFor(lambda: red.value == value))
+            latencies.append(red.writes[-1][0] - start)
+        self.assertLess(max(latencies), 0.05 + 0.1)
+        self.assertEqual([value for when, value in red.writes], [True, False, True])
+
+    # a blip within the debounce time is never written
+    def testDebounce(self):
+        red = self.outputs.add('red', MockOutput(), debounce=0.1)
+        self.outputs.start()
+        self.outputs.update({'red': True})
+        self.assertTrue(waitFor(lambda: red.value is True))
+        self.outputs.update({'red': False})
+        self.outputs.update({'red': True})
+        time.sleep(0.2)
+        self.assertEqual([value for when, value in red.writes], [True])
+
+    # a driver raising something else than OSError neither stops the worker nor the other outputs
+    def testDriverError(self):
+        self.outputs.add('red', BrokenOutput())
+        green = self.outputs.add('green', MockOutput())
+        self.outputs.start()
+        self.outputs.update({'red': True, 'green': True})
+        self.assertTrue(waitFor(lambda: green.value is True))
+        self.outputs.update({'red': False, 'green': False})
+        self.assertTrue(waitFor(lambda: green.value is False))
+        self.assertTrue(self.outputs.thread.is_alive())
+        self.assertEqual(self.outputs.stats['errors'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+import tracemalloc
+import unittest
+
+from atem import Atem
+from benchmarks import datagrams
+
+INPUTS = 20
+PACKETS = 5000
+# tracemalloc's own bookkeeping, but nothing that grows with the packet count
+RETAINED_LIMIT = 1024
+
+
+def frame(program, preview):
+    flags = [0] * INPUTS
+    flags[program - 1] |= Atem.TALLY_PROGRAM
+    flags[preview - 1] |= Atem.TALLY_PREVIEW
+    return datagrams.datagram([datagrams.cmdTlIn(flags),
+                               datagrams.cmdTlSr([(i + 1, flags[i]) for i in range(INPUTS)])])
+
+
+class TallyAllocationTest(unittest.TestCase):
+    def setUp(self):
+        self.atem = Atem('127.0.0.1', localPort=0)
+        self.atem.socket.close()
+        self.calls = 0
+        self.atem.tallyHandler = self.tallyHandler
+
+    def tallyHandler(self, atem):
+        self.calls += 1
+
+    # bytes still allocated after parsing PACKETS of packets in turn
+    def retained(self, packets):
+        for packet in packets:
+            self.atem.parsePayload(packet)
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            for i in range(PACKETS):
+                self.atem.parsePayload(packets[i % len(packets)])
+            return tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+
+    def testRepeatedFrame(self):
+        self.assertLess(self.retained([frame(1, 2)]), RETAINED_LIMIT)
+
+    # every packet changes program and preview
+    def testChangingFrames(self):
+        packets = [frame(1 + i % INPUTS, 1 + (i + 1) % INPUTS) for i in range(INPUTS)]
+        calls = self.calls
+        self.assertLess(self.retained(packets), RETAINED_LIMIT)
+        # two per packet, one each of TlIn and TlSr
+        self.assertEqual(self.calls - calls, 2 * (PACKETS + len(packets)))
+        self.assertTrue(self.atem.isProgram(1 + (PACKETS - 1) % INPUTS))
+
+    # with a state subscriber the dicts it gets are its own, nothing else is kept
+    def testChangingFramesSubscribed(self):
+        self.atem.handleStateChange(lambda atem, path, old, new: None, ('tally', 'tally_by_index'))
+        packets = [frame(1, 2), frame(2, 1)]
+        self.assertLess(self.retained(packets), RETAINED_LIMIT)
+
+
+if __name__ == '__main__':
+    unittest.main()